@@ -4,14 +4,19 @@ import Recorder from 'matt-diamond-recorderjs';
 import { baseUrl } from '../App';
 import { BpmContext, SheetMusicContext } from '../utils/Contexts';
 import useMicrophone from '../utils/UseMicrophone';
+import encodeWAV from '../utils/EncodeWav';
 import loading_gif from '../assets/images/loading_gif.gif'
 import MetronomeRecording from './MetronomeRecording';
 
+// Milliseconds between the chunks of a recording uploaded while it's recorded
+const CHUNK_INTERVAL_MS = 1000;
+
 function RecordControl() {
   const [isRecording, setIsRecording] = useState(false);
   const [isComplete, setIsComplete] = useState(false);
   const [isStarting, setIsStarting] = useState(false);
   const [isLoading, setIsLoading] = useState(false);
+  const [progress, setProgress] = useState(null);
   const [performanceId, setPerformanceId] = useState(-1);
   const [countdownDisplay, setCountdownDisplay] = useState(10);
   const inputRef = useRef();
@@ -23,6 +28,7 @@ function RecordControl() {
   
   const audioContext = useRef();
   const recorder = useRef();
+  const upload = useRef();
 
   const startCountdown = () => {
     // Countdown speed matches set BPM
@@ -62,19 +68,99 @@ function RecordControl() {
     })
     recorder.current.record();
     setIsRecording(true);
+    startUpload(audioContext.current.sampleRate);
   }
 
-  const stopRecording = () => {
+  // The recording is uploaded chunk by chunk while it's recorded, so it's analyzed as it goes
+  const startUpload = (sampleRate) => {
+    const formData = new FormData();
+    formData.append("sheet_music_id", sheetMusicId);
+    formData.append("average_tempo", bpm);
+    formData.append("sample_rate", sampleRate);
+
+    upload.current = {id: null, sampleRate: sampleRate, recorded: [], chunks: 0, failed: false, timerId: null};
+    upload.current.queue = fetch(baseUrl + "/recording", {
+      method: "POST",
+      body: formData
+    }).then((res) => {
+      if (!res.ok) throw new Error("Recording upload refused");
+      return res.json();
+    }).then((session) => {
+      upload.current.id = session.id;
+    }).catch((err) => {
+      console.error(err);
+      upload.current.failed = true;
+    });
+    upload.current.timerId = setInterval(uploadChunk, CHUNK_INTERVAL_MS);
+  }
+
+  // Sends the samples recorded since the last chunk, after the chunks before it. The recorder is
+  // cleared as its buffer is read (in the same task, so no samples arrive in between), so it only
+  // ever holds the new samples; the chunks are kept for uploading the whole recording if need be.
+  const uploadChunk = () => {
+    const current = upload.current;
+    const buffer = new Promise((resolve) => recorder.current.getBuffer(resolve));
+    recorder.current.clear();
+    return buffer
+      .then((buffers) => {
+        const samples = buffers[0];
+        if (samples.length === 0) return current.queue;
+        current.recorded.push(samples);
+        const index = current.chunks++;
+        current.queue = current.queue.then(() => {
+          if (current.failed) return;
+          return fetch(baseUrl + "/recording/" + current.id + "/chunks/" + index, {
+            method: "PUT",
+            headers: {"Content-Type": "application/octet-stream"},
+            body: samples.buffer
+          }).then((res) => {
+            if (!res.ok) throw new Error("Chunk " + index + " refused");
+          }).catch((err) => {
+            console.error(err);
+            current.failed = true;
+          });
+        });
+        return current.queue;
+      });
+  }
+
+  const stopRecording = async () => {
     console.log("Stopping recording.");
     recorder.current.stop();
-    recorder.current.exportWAV(onStop);
+    clearInterval(upload.current.timerId);
     setIsRecording(false);
     setIsComplete(true);
+
+    setIsLoading(true);
+    await uploadChunk();
+    if (upload.current.failed) {
+      // Upload the whole recording instead
+      if (upload.current.id) {
+        fetch(baseUrl + "/recording/" + upload.current.id, {method: "DELETE"});
+      }
+      onStop(encodeWAV(upload.current.recorded, upload.current.sampleRate));
+      return;
+    }
+    await fetch(baseUrl + "/recording/" + upload.current.id + "/finish", {
+      method: "POST"
+    }).then((res) => {
+      if (!res.ok) throw new Error("Recording analysis refused");
+      return res.json();
+    }).then((job) => waitForJob(job.id))
+      .then((job) => setPerformanceId(job.result.id))
+      .catch(err => console.error(err));
+    setIsLoading(false);
   }
 
   const cancelRecording = () => {
     console.log("Cancelling recording.");
     recorder.current.stop();
+    clearInterval(upload.current.timerId);
+    upload.current.queue.then(() => {
+      if (upload.current.id) {
+        fetch(baseUrl + "/recording/" + upload.current.id, {method: "DELETE"});
+      }
+    });
     setIsRecording(false);
     setIsComplete(true);
     navigate(-1);
@@ -97,12 +183,33 @@ function RecordControl() {
     await fetch(baseUrl + "/performance", {
       method: "POST",
       body: formData
-    }).then((res) => res.json())
-      .then((data) => setPerformanceId(data.id))
+    }).then((res) => {
+      if (!res.ok) throw new Error("Recording analysis refused");
+      return res.json();
+    }).then((job) => waitForJob(job.id))
+      .then((job) => setPerformanceId(job.result.id))
       .catch(err => console.error(err));
     setIsLoading(false);
   }
 
+  // The recording is analyzed in the background; follow its progress until it's done
+  const waitForJob = (jobId) => {
+    return new Promise((resolve, reject) => {
+      const events = new EventSource(baseUrl + "/jobs/" + jobId + "/events");
+      events.addEventListener("progress", (event) => setProgress(JSON.parse(event.data)));
+      events.addEventListener("done", (event) => {
+        events.close();
+        setProgress(null);
+        resolve(JSON.parse(event.data));
+      });
+      events.addEventListener("failed", (event) => {
+        events.close();
+        setProgress(null);
+        reject(new Error(JSON.parse(event.data).error));
+      });
+    });
+  }
+
   const viewResults = () => {
     navigate("/performance/" + performanceId);
   }
@@ -180,6 +287,10 @@ function RecordControl() {
         isLoading
         ? <div style={{margin:30}}>
             <img src={loading_gif} width="40px" alt="Loading..."/>
+            { progress
+              ? <p>{progress.stage.replace("_", " ")}: {Math.round(progress.percent)}%</p>
+              : ""
+            }
           </div>
         : ""
       }
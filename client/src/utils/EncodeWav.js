@@ -0,0 +1,37 @@
+// Encodes mono samples (chunks of Float32Arrays, between -1 and 1) as a 16-bit PCM WAV file,
+// like Recorder.js's exportWAV
+const encodeWAV = (chunks, sampleRate) => {
+  const length = chunks.reduce((total, chunk) => total + chunk.length, 0);
+  const view = new DataView(new ArrayBuffer(44 + 2*length));
+  const writeString = (offset, string) => {
+    for (let i = 0; i < string.length; i++) {
+      view.setUint8(offset + i, string.charCodeAt(i));
+    }
+  };
+
+  writeString(0, "RIFF");
+  view.setUint32(4, 36 + 2*length, true);
+  writeString(8, "WAVE");
+  writeString(12, "fmt ");
+  view.setUint32(16, 16, true);
+  view.setUint16(20, 1, true); // PCM
+  view.setUint16(22, 1, true); // mono
+  view.setUint32(24, sampleRate, true);
+  view.setUint32(28, 2*sampleRate, true);
+  view.setUint16(32, 2, true);
+  view.setUint16(34, 16, true);
+  writeString(36, "data");
+  view.setUint32(40, 2*length, true);
+
+  let offset = 44;
+  for (const chunk of chunks) {
+    for (let i = 0; i < chunk.length; i++, offset += 2) {
+      const sample = Math.max(-1, Math.min(1, chunk[i]));
+      view.setInt16(offset, sample < 0 ? sample*0x8000 : sample*0x7FFF, true);
+    }
+  }
+
+  return new Blob([view], {type: "audio/wav"});
+};
+
+export default encodeWAV;
@@ -0,0 +1,199 @@
+"""Jobs API
+
+Runs long analyses in the background and exposes their state. A job is a row
+of the job table (so jobs queued or running when the server stops run again
+when it starts), and is run by a handler registered for its kind on a pool
+of ANALYSIS_JOB_WORKERS threads. While a job runs, the progress its handler
+reports (see scripts/progress.py) is streamed to clients as Server-Sent
+Events.
+"""
+from flask import Blueprint, Response, current_app, stream_with_context
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import json
+import logging
+import uuid
+
+from models import db
+from models.job import Job, JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED
+from scripts.progress import Progress, set_reporter
+from config import ANALYSIS_JOB_WORKERS
+
+PROGRESS_HISTORY = 100 # Finished jobs whose progress is kept, for clients that connect late.
+EVENTS_KEEP_ALIVE = 15 # Seconds between comments that keep an idle event stream open.
+
+jobs_blueprint = Blueprint("jobs", __name__)
+logger = logging.getLogger(__name__)
+
+class JobQueue:
+    """A durable queue of jobs, run by a pool of worker threads.
+
+    A handler takes the params of a job and returns its result (anything
+    JSON serializable). Whatever it adds to the session is committed together
+    with the job's result, so nothing it adds is kept unless the job
+    finishes. If it raises, the job fails with the error as its message.
+    """
+
+    def __init__(self):
+        self.handlers = {}
+        self.app = None
+        self.executor = None
+        self.progress = {} # job ID: Progress, for jobs queued or run since the server started
+
+    def handler(self, kind: str):
+        """Registers the decorated function as the handler of a kind of job.
+
+        Args:
+            kind (str): The kind of job
+        """
+        def register(function):
+            self.handlers[kind] = function
+            return function
+        return register
+
+    def init_app(self, app, workers: int=ANALYSIS_JOB_WORKERS):
+        """Starts the worker threads, and queues the jobs that were queued or
+        running when the server last stopped, oldest first.
+
+        Args:
+            app (Flask): The app, whose context the jobs run in
+            workers (int): The number of worker threads
+        """
+        self.app = app
+        app.extensions["job_queue"] = self
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analysis")
+        with app.app_context():
+            unfinished = (db.session.query(Job)
+                          .filter(Job.state.in_([JOB_QUEUED, JOB_RUNNING]))
+                          .order_by(Job.created).all())
+            for job in unfinished:
+                job.state = JOB_QUEUED
+            db.session.commit()
+            for job in unfinished:
+                logger.info(f"Resuming {job.kind} job {job.id}")
+                self.progress[job.id] = Progress()
+                self.executor.submit(self.run, job.id)
+
+    def submit(self, kind: str, params: dict) -> Job:
+        """Stores a new job and queues it.
+
+        Args:
+            kind (str): The kind of job
+            params (dict): The params passed to its handler
+
+        Returns:
+            Job: The new job
+        """
+        job = Job(uuid.uuid4().hex, kind, params, datetime.now(timezone.utc))
+        db.session.add(job)
+        db.session.commit()
+        self.progress[job.id] = Progress()
+        self.executor.submit(self.run, job.id)
+        return job
+
+    def run(self, job_id: str):
+        """Runs a job with its handler and stores the outcome.
+
+        Args:
+            job_id (str): The ID of the job
+        """
+        progress = self.progress.setdefault(job_id, Progress())
+        set_reporter(progress)
+        try:
+            with self.app.app_context():
+                job = db.session.get(Job, job_id)
+                job.state = JOB_RUNNING
+                job.updated = datetime.now(timezone.utc)
+                db.session.commit()
+                try:
+                    result = self.handlers[job.kind](json.loads(job.params))
+                    job.result = json.dumps(result, default=str)
+                    job.state = JOB_DONE
+                except Exception as error:
+                    logger.exception(f"{job.kind} job {job_id} failed")
+                    db.session.rollback()
+                    job.error = str(error) or type(error).__name__
+                    job.state = JOB_FAILED
+                job.updated = datetime.now(timezone.utc)
+                db.session.commit()
+                logger.info(f"{job.kind} job {job_id} {job.state}, seconds per stage: {progress.stage_seconds}")
+        finally:
+            set_reporter(None)
+            progress.finish()
+
+        # Forget the progress of the oldest finished jobs
+        finished = [id for id, kept in list(self.progress.items()) if kept.finished]
+        for id in finished[:-PROGRESS_HISTORY]:
+            self.progress.pop(id, None)
+
+    def pending(self, kind: str) -> list:
+        """Gets the params of the jobs of a kind that are queued or running.
+
+        Args:
+            kind (str): The kind of job
+
+        Returns:
+            list: The params of every unfinished job, oldest first
+        """
+        jobs = (db.session.query(Job)
+                .filter(Job.kind == kind, Job.state.in_([JOB_QUEUED, JOB_RUNNING]))
+                .order_by(Job.created))
+        return [json.loads(job.params) for job in jobs]
+
+job_queue = JobQueue()
+
+@jobs_blueprint.route("/jobs/<string:id>", methods=["GET"])
+def get_job(id: str):
+    """Get the state of a job, and its result once it's done.
+
+    Args:
+        id (str): The ID of the job
+
+    Returns:
+        dict: A dict of the job
+    """
+    job = db.session.get(Job, id)
+    if job:
+        return job.serialize
+    else:
+        return {"error": "Job not found"}, 404
+
+@jobs_blueprint.route("/jobs/<string:id>/events", methods=["GET"])
+def get_job_events(id: str):
+    """Stream the progress of a job as Server-Sent Events: a "progress"
+    event per stage update (with the stage, the percent of it and of the
+    whole job done, and the seconds elapsed since the job was queued), then
+    one event named after the state the job ended in, with the job and the
+    seconds each stage took.
+
+    Args:
+        id (str): The ID of the job
+
+    Returns:
+        Response: The text/event-stream response
+    """
+    job = db.session.get(Job, id)
+    if not job:
+        return {"error": "Job not found"}, 404
+    progress = current_app.extensions["job_queue"].progress.get(id)
+
+    def stream():
+        seen = 0
+        finished = progress is None
+        while not finished:
+            events, finished = progress.wait(seen, EVENTS_KEEP_ALIVE)
+            for event in events:
+                yield f"event: progress\ndata: {json.dumps(event)}\n\n"
+            seen += len(events)
+            if not events and not finished:
+                yield ": keep-alive\n\n"
+            # (events reported just before finishing are sent first)
+            finished = finished and seen == len(progress.events)
+
+        db.session.expire_all()
+        job = db.session.get(Job, id)
+        data = dict(job.serialize, stage_seconds=progress.stage_seconds if progress else None)
+        yield f"event: {job.state}\ndata: {json.dumps(data, default=str)}\n\n"
+
+    return Response(stream_with_context(stream()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache"})
@@ -12,13 +12,38 @@ from models import db
 from models.performance import Performance
 from models.sheetmusic import SheetMusic
 
-from scripts.signal_processing import signal_processing
-from scripts.compare import compare_arrays
-from scripts.objects import Difference_with_info, Note
-from config import JSON_DIR, WAV_DIR
+from scripts.signal_processing import signal_processing, get_score_band
+from scripts.pitch_estimators import get_pitch_estimator_names
+from scripts.compare import compare_arrays, find_subsequence, get_aligner_names
+from scripts.objects import Difference_with_info, Note, NoteArray
+from scripts.analysis_pool import analysis_pool
+from scripts import progress
+from api.jobs import job_queue
+from config import JSON_DIR, WAV_DIR, SCORE_INFORMED_ANALYSIS
 
 performance_blueprint = Blueprint("performance", __name__)
 
+def get_section_measures(note_info: list, first: int, last: int):
+    """Get the measures of a section of the sheet music's notes.
+
+    Args:
+        note_info (list): The note_info.json entries of the sheet music
+        first (int): The index of the first note of the section
+        last (int): The index after the last note of the section
+
+    Returns:
+        dict: The first and last note and measure of the section
+    """
+    # note_info also lists rests
+    measures = [info["measure"] for info in note_info if info["element"] == "note"]
+    last_note = max(first, last - 1)
+    return {
+        "first_note": first,
+        "last_note": last_note,
+        "first_measure": measures[min(first, len(measures) - 1)] if measures else None,
+        "last_measure": measures[min(last_note, len(measures) - 1)] if measures else None
+    }
+
 @performance_blueprint.route("/performance", methods=["GET"])
 def get_all_performances():
     """Get all performances from the database.
@@ -106,70 +131,210 @@ def get_diff_json(sheet_music_id: int, run_number: int):
     except FileNotFoundError:
         return {"error": "File not found"}, 404
 
+def get_analysis_options(form, xml_data: dict) -> dict:
+    """Get the analysis options chosen for a recording.
+
+    Args:
+        form (dict): The form of the request
+        xml_data (dict): The master.json data of the sheet music
+
+    Raises:
+        ValueError: If an option is unknown
+
+    Returns:
+        dict: The pitch estimator, alignment and aligner
+    """
+
+    # pitch estimator chosen for this request, else for the sheet music
+    pitch_estimator = (form.get("pitch_estimator")
+                       or xml_data.get("pitch_estimator"))
+    if pitch_estimator and pitch_estimator not in get_pitch_estimator_names():
+        raise ValueError("Unknown pitch estimator")
+
+    # "subsequence" compares a recording of a section of the piece against that section alone
+    alignment = form.get("alignment", "global")
+    if alignment not in ["global", "subsequence"]:
+        raise ValueError("Unknown alignment")
+
+    # alignment strategy chosen for this request, else ALIGNMENT_MODE
+    aligner = form.get("aligner")
+    if aligner and aligner not in get_aligner_names():
+        raise ValueError("Unknown aligner")
+
+    return {"pitch_estimator": pitch_estimator, "alignment": alignment, "aligner": aligner}
+
+def queue_performance(sheet_music: SheetMusic, average_tempo: int, options: dict, save_recording,
+                      stream: bool=None):
+    """Save a recording as the next run of its sheet music and queue its
+    analysis.
+
+    Args:
+        sheet_music (SheetMusic): The sheet music played
+        average_tempo (int): The BPM of the recording
+        options (dict): The analysis options, from get_analysis_options
+        save_recording: A function saving the recording to the file path
+            it's given
+        stream (bool): Whether to analyze the recording block by block. By
+            default, long recordings are streamed
+
+    Returns:
+        tuple: The response: a dict of the analysis job, 202 and its location
+    """
+
+    sheet_music_id = str(sheet_music.id)
+    # recordings still being analyzed have their run numbers already
+    new_run_number = (len(db.session.query(Performance)
+                          .filter(Performance.sheet_music_id == sheet_music_id).all()) +
+                      len([params for params in job_queue.pending("performance")
+                           if params["sheet_music_id"] == sheet_music_id]) + 1)
+    new_date_time = datetime.now(timezone.utc)
+
+    # construct new file path and save the recording
+    new_wav_file_path = f"{WAV_DIR}/{sheet_music_id}_{sheet_music.title}/{new_run_number}.wav"
+    save_recording(new_wav_file_path)
+
+    job = job_queue.submit("performance", {
+        "sheet_music_id": sheet_music_id,
+        "run_number": new_run_number,
+        "average_tempo": average_tempo,
+        "date_time": new_date_time.isoformat(),
+        **options,
+        "stream": stream,
+        "wav_file_path": new_wav_file_path
+    })
+    return job.serialize, 202, {"Location": f"/jobs/{job.id}"}
+
 @performance_blueprint.route("/performance", methods=["POST"])
 def add_performance():
-    """Add a performance to the database.
+    """Save a recording and queue its analysis. The performance is added to
+    the database once the analysis job finishes (see GET /jobs/<id>).
 
     Returns:
-        dict: A dict of the new performance
+        dict: A dict of the analysis job
     """
 
-    new_id = randint(1, 1000000)
-
     sheet_music_id = request.form.get("sheet_music_id")
-    sheet_music_name = (db.session.query(SheetMusic)
-                                 .filter(SheetMusic.id == sheet_music_id)
-                                 .first().title)
-    new_run_number = len(db.session.query(Performance)
-                         .filter(Performance.sheet_music_id == sheet_music_id).all()) + 1
+    sheet_music = (db.session.query(SheetMusic)
+                   .filter(SheetMusic.id == sheet_music_id)
+                   .first())
     new_average_tempo = int(request.form.get("average_tempo"))
-    new_date_time = datetime.now(timezone.utc)
 
-    # construct new file path and handle file upload
-    new_wav_file_path = f"{WAV_DIR}/{sheet_music_id}_{sheet_music_name}/{new_run_number}.wav"
-    new_wav_file_data = request.files.get("file")
-    new_wav_file_data.save(new_wav_file_path)
+    # get json file path of the sheet music and load it
+    with open(sheet_music.data_file_path) as xml_json_file:
+        xml_data = json.load(xml_json_file)
+
+    try:
+        options = get_analysis_options(request.form, xml_data)
+    except ValueError as error:
+        return {"error": str(error)}, 400
+
+    # handle file upload
+    return queue_performance(sheet_music, new_average_tempo, options, request.files.get("file").save)
+
+def analyze_recording(wav_file_path: str, average_tempo: int, ideal_notes: list, pitch_estimator: str,
+                      alignment: str, aligner: str, stream: bool=None):
+    """Find the notes of a recording and compare them with the notes of its
+    sheet music. Runs in an analysis worker process.
+
+    Args:
+        wav_file_path (str): The file path of the recording
+        average_tempo (int): The BPM of the recording
+        ideal_notes (list): The notes of the sheet music, as stored in
+            master.json
+        pitch_estimator (str): The pitch estimator, or None for the default
+        alignment (str): "global" or "subsequence"
+        aligner (str): The alignment strategy, or None for ALIGNMENT_MODE
+        stream (bool): Whether to analyze the recording block by block, or
+            None to decide by its length
+
+    Returns:
+        tuple: The notes JSON of the recording, the first and last index of
+            the ideal notes compared, the tuning, dynamics and tempo
+            accuracies, and the differences
+    """
+
+    # analyze recording, searching only around the pitch range of the score
+    band = get_score_band(ideal_notes) if SCORE_INFORMED_ANALYSIS else None
+    notes_from_rec = signal_processing(wav_file_path, average_tempo, stream=stream,
+                                       estimator=pitch_estimator, band=band)
+
+    ideal_notes = NoteArray.from_dicts(ideal_notes)
+    actual_notes = NoteArray.from_dicts(json.loads(notes_from_rec)["notes"])
+
+    # find the section that was played, and line the recording up with it
+    progress.report("alignment", 0)
+    section_first, section_last = 0, len(ideal_notes)
+    if alignment == "subsequence" and len(ideal_notes) and len(actual_notes):
+        section_first, section_last, shift = find_subsequence(ideal_notes, actual_notes)
+        ideal_notes = ideal_notes[section_first:section_last]
+        actual_notes.start += shift
+        actual_notes.end += shift
+
+    # run comparison algorithms
+    comparison = compare_arrays(ideal_notes, actual_notes, aligner)
+    progress.report("alignment")
+    return (notes_from_rec, section_first, section_last) + tuple(comparison)
+
+@job_queue.handler("performance")
+def analyze_performance(params: dict):
+    """Analyze a recording, compare it with its sheet music and add the
+    performance (committed by the job queue when the job finishes).
+
+    Args:
+        params (dict): The params of the job queued by add_performance
+
+    Returns:
+        dict: A dict of the new performance
+    """
+
+    new_id = randint(1, 1000000)
+
+    sheet_music_id = params["sheet_music_id"]
+    sheet_music = (db.session.query(SheetMusic)
+                   .filter(SheetMusic.id == sheet_music_id)
+                   .first())
+    sheet_music_name = sheet_music.title
+    new_run_number = params["run_number"]
+    new_average_tempo = params["average_tempo"]
+    new_date_time = datetime.fromisoformat(params["date_time"])
+    pitch_estimator = params["pitch_estimator"]
+    alignment = params["alignment"]
+    aligner = params["aligner"]
+    stream = params.get("stream")
+    new_wav_file_path = params["wav_file_path"]
+
+    # get json file path of the sheet music and load it
+    with open(sheet_music.data_file_path) as xml_json_file:
+        xml_data = json.load(xml_json_file)
 
     # Make new subdirectory
     new_subdir = f"{JSON_DIR}/{sheet_music_id}_{sheet_music_name}/runs"
     os.makedirs(new_subdir, exist_ok=True)
     
-    # analyze recording
-    notes_from_rec = signal_processing(new_wav_file_path, new_average_tempo)
+    # analyze the recording in a worker process
+    (notes_from_rec, section_first, section_last, new_tuning_percent_accuracy, new_dynamics_percent_accuracy,
+     new_tempo_percent_accuracy, differences) = analysis_pool.run(analyze_recording, new_wav_file_path,
+                                                                  new_average_tempo, xml_data["notes"],
+                                                                  pitch_estimator, alignment, aligner, stream)
     rec_json_path = f"{new_subdir}/{new_run_number}_rec.json"
     
     # save notes info into a json file
     with open(rec_json_path, 'w') as rec_json_file:
         rec_json_file.write(notes_from_rec)
 
-    # get json file paths
+    # get json file path
     wav_json_file_path = rec_json_path
-    xml_json_file_path = (db.session.query(SheetMusic)
-                          .filter(SheetMusic.id == sheet_music_id)
-                          .first().data_file_path)
-
-    # open json file and load into obj
-    with open(xml_json_file_path) as xml_json_file:
-        xml_data = json.load(xml_json_file)
-    with open(wav_json_file_path) as wav_json_file:
-        wav_data = json.load(wav_json_file)
-
-    ideal_notes = [Note(note["pitch"], note["velocity"], note["start"], note["end"])
-                   for note in xml_data["notes"]]
-    actual_notes = [Note(note["pitch"], note["velocity"], note["start"], note["end"])
-                        for note in wav_data["notes"]]
-
-    # run comparison algorithms
-    (new_tuning_percent_accuracy, new_dynamics_percent_accuracy,
-     new_tempo_percent_accuracy, differences) = compare_arrays(ideal_notes, actual_notes)
 
     # append info to differences
-    note_info_file_path = (db.session.query(SheetMusic)
-                           .filter(SheetMusic.id == sheet_music_id)
-                           .first().note_info_file_path)
-    with open(note_info_file_path) as file:
+    progress.report("diff_annotation", 0)
+    with open(sheet_music.note_info_file_path) as file:
         note_info_data = json.load(file)
 
+    # differences index the notes of the whole piece
+    for diff in differences:
+        if diff.ideal_idx is not None:
+            diff.ideal_idx += section_first
+
     differences_with_info  = []
     prev_ideal_index = None
     next_ideal_index = None
@@ -209,22 +374,28 @@ def add_performance():
                                                                 [note_info_data[prev_ideal_index], note_info_data[next_ideal_index]],
                                                                 "Between"))
 
+    progress.report("diff_annotation")
+
     # save the diff file locally
+    progress.report("persistence", 0)
     diff_json_path = f"{new_subdir}/{new_run_number}_diff.json"
     with open(diff_json_path, 'w') as diff_json_file:
         json.dump([info.to_dict() for info in differences_with_info],
                   diff_json_file, indent=4, default=Note.custom_serializer)
     
-    # send info to database
+    # add to the database (committed when the job finishes)
     new_performance = Performance(new_id, sheet_music_id, new_run_number,
                                   new_date_time, new_tempo_percent_accuracy,
                                   new_average_tempo, new_tuning_percent_accuracy,
                                   new_dynamics_percent_accuracy, new_wav_file_path,
                                   wav_json_file_path, diff_json_path)
     db.session.add(new_performance)
-    db.session.commit()
-    
-    return new_performance.serialize
+    progress.report("persistence")
+
+    performance_data = new_performance.serialize
+    if alignment == "subsequence":
+        performance_data["section"] = get_section_measures(note_info_data, section_first, section_last)
+    return performance_data
 
 @performance_blueprint.route("/performance/<int:id>", methods=["DELETE"])
 def delete_performance(id: int):
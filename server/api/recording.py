@@ -0,0 +1,180 @@
+"""Recording API
+
+API endpoints to upload a recording chunk by chunk while it's being
+recorded. Each chunk is pitch tracked as it arrives (see
+scripts/recording_session.py), so once the recording ends its analysis job
+only has the last few seconds to pitch track before finding its notes and
+comparing them with the sheet music.
+
+Sessions are kept in memory: a recording still being uploaded when the
+server stops is lost, and one that goes RECORDING_SESSION_TIMEOUT seconds
+without a chunk is dropped (by the next request to any of these endpoints).
+"""
+from flask import request, Blueprint
+import json
+import os
+import threading
+import time
+import uuid
+import numpy as np
+
+from models import db
+from models.sheetmusic import SheetMusic
+
+from scripts.recording_session import RecordingSession
+from scripts.signal_processing import get_analysis_setup, get_score_band
+from api.performance import get_analysis_options, queue_performance
+from config import (TMP_DIR, SCORE_INFORMED_ANALYSIS, COARSE_TO_FINE_HOPS, ENERGY_GATE_TOP_DB,
+                    RECORDING_SESSION_TIMEOUT)
+
+recording_blueprint = Blueprint("recording", __name__)
+
+sessions = {} # session ID: dict of the session, its sheet music, tempo, options and last chunk time
+sessions_lock = threading.Lock()
+
+def drop_idle_sessions():
+    """Drop the sessions that went RECORDING_SESSION_TIMEOUT seconds without
+    a chunk, and their recordings.
+    """
+    now = time.monotonic()
+    with sessions_lock:
+        idle = [id for id, upload in sessions.items() if now - upload["updated"] > RECORDING_SESSION_TIMEOUT]
+        dropped = [sessions.pop(id) for id in idle]
+    for upload in dropped:
+        cancel_session(upload["session"])
+
+def cancel_session(session: RecordingSession):
+    """Cancel a session and delete its recording.
+
+    Args:
+        session (RecordingSession): The session
+    """
+    session.cancel()
+    if os.path.exists(session.wav_file_path):
+        os.remove(session.wav_file_path)
+
+@recording_blueprint.route("/recording", methods=["POST"])
+def start_recording():
+    """Start uploading a recording. Takes the same form as POST /performance,
+    with the sample rate of the recording instead of the file.
+
+    Returns:
+        dict: The ID of the session
+    """
+    drop_idle_sessions()
+
+    sheet_music_id = request.form.get("sheet_music_id")
+    sheet_music = (db.session.query(SheetMusic)
+                   .filter(SheetMusic.id == sheet_music_id)
+                   .first())
+    if not sheet_music:
+        return {"error": "Sheet music not found"}, 404
+    new_average_tempo = int(request.form.get("average_tempo"))
+    sample_rate = int(request.form.get("sample_rate", 0))
+    if sample_rate <= 0:
+        return {"error": "Invalid sample rate"}, 400
+
+    # get json file path of the sheet music and load it
+    with open(sheet_music.data_file_path) as xml_json_file:
+        xml_data = json.load(xml_json_file)
+
+    try:
+        options = get_analysis_options(request.form, xml_data)
+    except ValueError as error:
+        return {"error": str(error)}, 400
+
+    # analyze as the analysis job will, searching only around the pitch range of the score
+    band = get_score_band(xml_data["notes"]) if SCORE_INFORMED_ANALYSIS else None
+    setup = get_analysis_setup(band, COARSE_TO_FINE_HOPS, ENERGY_GATE_TOP_DB)
+
+    id = uuid.uuid4().hex
+    session = RecordingSession(f"{TMP_DIR}/{id}.wav", sample_rate, setup, options["pitch_estimator"])
+    with sessions_lock:
+        sessions[id] = {
+            "session": session,
+            "sheet_music_id": sheet_music.id,
+            "average_tempo": new_average_tempo,
+            "options": options,
+            "updated": time.monotonic()
+        }
+    return {"id": id}, 201, {"Location": f"/recording/{id}"}
+
+@recording_blueprint.route("/recording/<string:id>/chunks/<int:index>", methods=["PUT"])
+def add_recording_chunk(id: str, index: int):
+    """Upload the next chunk of a recording: its mono samples as little-endian
+    32-bit floats. Chunks are numbered from 0; a chunk uploaded again is
+    ignored.
+
+    Args:
+        id (str): The ID of the session
+        index (int): The number of the chunk
+
+    Returns:
+        dict: The number of chunks received so far
+    """
+    drop_idle_sessions()
+
+    with sessions_lock:
+        upload = sessions.get(id)
+    if not upload:
+        return {"error": "Recording not found"}, 404
+
+    data = request.get_data()
+    if len(data) % 4:
+        return {"error": "Chunks must be 32-bit float samples"}, 400
+    try:
+        upload["session"].push(index, np.frombuffer(data, dtype="<f4"))
+    except ValueError as error:
+        return {"error": str(error)}, 409
+    upload["updated"] = time.monotonic()
+    return {"chunks": upload["session"].chunks}
+
+@recording_blueprint.route("/recording/<string:id>/finish", methods=["POST"])
+def finish_recording(id: str):
+    """End a recording and queue its analysis, like POST /performance.
+
+    Args:
+        id (str): The ID of the session
+
+    Returns:
+        dict: A dict of the analysis job
+    """
+    drop_idle_sessions()
+
+    with sessions_lock:
+        upload = sessions.pop(id, None)
+    if not upload:
+        return {"error": "Recording not found"}, 404
+    session = upload["session"]
+    sheet_music = db.session.get(SheetMusic, upload["sheet_music_id"])
+    if not sheet_music:
+        # (deleted while the recording was being uploaded)
+        cancel_session(session)
+        return {"error": "Sheet music not found"}, 404
+
+    def save_recording(wav_file_path: str):
+        # the analysis is cached under the recording's contents, so it's found at its new path too
+        session.finish()
+        os.replace(session.wav_file_path, wav_file_path)
+
+    # the recording was analyzed block by block, as streaming it would
+    return queue_performance(sheet_music, upload["average_tempo"], upload["options"], save_recording, stream=True)
+
+@recording_blueprint.route("/recording/<string:id>", methods=["DELETE"])
+def cancel_recording(id: str):
+    """Cancel a recording and delete what was uploaded of it.
+
+    Args:
+        id (str): The ID of the session
+
+    Returns:
+        dict: An empty dict
+    """
+    drop_idle_sessions()
+
+    with sessions_lock:
+        upload = sessions.pop(id, None)
+    if not upload:
+        return {"error": "Recording not found"}, 404
+    cancel_session(upload["session"])
+    return {}
@@ -12,6 +12,7 @@ from models.sheetmusic import SheetMusic
 from models.goal import Goal
 from models.performance import Performance
 from scripts.musicxml_reader import MusicXMLReader
+from scripts.pitch_estimators import get_pitch_estimator_names
 from config import JSON_DIR, XML_DIR, WAV_DIR, TMP_DIR
 
 sheetmusic_blueprint = Blueprint("sheetmusic", __name__)
@@ -56,6 +57,9 @@ def add_sheet_music():
     new_title = request.form.get("title")
     new_composer = request.form.get("composer")
     new_instrument = request.form.get("instrument")
+    new_pitch_estimator = request.form.get("pitch_estimator")
+    if new_pitch_estimator and new_pitch_estimator not in get_pitch_estimator_names():
+        return {"error": "Unknown pitch estimator"}, 400
 
     # Make new subdirectories for the sheet music
     new_subdir = f"/{new_id}_{new_title}"
@@ -72,7 +76,7 @@ def add_sheet_music():
     # Read XML file and convert to MIDI
     xml_reader = MusicXMLReader(new_xml_file_path, new_midi_file_path, new_instrument)
     new_tempo = xml_reader.get_tempo()
-    xml_reader.save_notes_json(new_dat_file_path)
+    xml_reader.save_notes_json(new_dat_file_path, pitch_estimator=new_pitch_estimator)
 
     # save note info locally
     note_info = xml_reader.get_notes_and_measure_num()
@@ -1,6 +1,10 @@
 from flask import Blueprint, jsonify
 import platform
 
+from scripts.pitch_estimators import PITCH_ESTIMATORS
+from scripts.audio_stream import decode_stats
+from scripts.signal_processing import analysis_cache, gate_stats
+
 status_blueprint = Blueprint("status", __name__)
 
 @status_blueprint.route("/status", methods=["GET"])
@@ -19,4 +23,53 @@ def get_platform():
     Returns:
         dict: A dict of the platform information
     """
-    return jsonify({ "platform": platform.platform() })
\ No newline at end of file
+    return jsonify({ "platform": platform.platform() })
+
+@status_blueprint.route("/status/pitch_estimators", methods=["GET"])
+def get_pitch_estimators():
+    """Get the available pitch estimators and the throughput each one has
+    reached in the server and its analysis workers so far.
+
+    Returns:
+        list: A list of dicts with the name, frames estimated and frames per
+            second of every pitch estimator
+    """
+    return jsonify([{ "name": name,
+                      "frames_estimated": estimator.frames_estimated,
+                      "throughput": estimator.throughput }
+                    for name, estimator in PITCH_ESTIMATORS.items()])
+
+@status_blueprint.route("/status/analysis_cache", methods=["GET"])
+def get_analysis_cache():
+    """Get the hit and miss counts of the analysis cache in the server and
+    its analysis workers, and its current size.
+
+    Returns:
+        dict: A dict of the analysis cache statistics
+    """
+    return jsonify(analysis_cache.stats)
+
+@status_blueprint.route("/status/timing", methods=["GET"])
+def get_timing():
+    """Get the seconds spent per minute of audio on decoding (including
+    resampling) and on pitch tracking with each pitch estimator in the server
+    and its analysis workers so far.
+
+    Returns:
+        dict: A dict of the decode time and the pitch estimator times
+    """
+    return jsonify({ "decode_seconds_per_minute": decode_stats.seconds_per_minute,
+                     "pitch_estimator_seconds_per_minute": { name: estimator.seconds_per_minute
+                                                             for name, estimator in PITCH_ESTIMATORS.items() } })
+
+@status_blueprint.route("/status/energy_gate", methods=["GET"])
+def get_energy_gate():
+    """Get the number of frames the energy gate has seen in the server and
+    its analysis workers, and the fraction it skipped as silence or rests.
+
+    Returns:
+        dict: A dict of the energy gate statistics
+    """
+    return jsonify({ "frames": gate_stats.frames,
+                     "frames_skipped": gate_stats.frames_skipped,
+                     "skipped_fraction": gate_stats.skipped_fraction })
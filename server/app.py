@@ -1,6 +1,7 @@
 import cherrypy
 from flask import Flask
 from flask_cors import CORS
+import multiprocessing
 import os
 
 from models import db
@@ -28,6 +29,7 @@ def create_app():
     from models.goal import model_goal_blueprint
     from models.performance import model_performance_blueprint
     from models.sheetmusic import model_sheetmusic_blueprint
+    from models.job import model_job_blueprint
     with app.app_context():
         db.create_all()
 
@@ -36,19 +38,31 @@ def create_app():
     from api.sheetmusic import sheetmusic_blueprint    
     from api.performance import performance_blueprint
     from api.goal import goal_blueprint
+    from api.jobs import jobs_blueprint, job_queue
+    from api.recording import recording_blueprint
+    from scripts.analysis_pool import analysis_pool
 
     app.register_blueprint(model_goal_blueprint)
     app.register_blueprint(model_performance_blueprint)
     app.register_blueprint(model_sheetmusic_blueprint)
+    app.register_blueprint(model_job_blueprint)
     app.register_blueprint(status_blueprint)
     app.register_blueprint(sheetmusic_blueprint)
     app.register_blueprint(performance_blueprint)
     app.register_blueprint(goal_blueprint)
+    app.register_blueprint(jobs_blueprint)
+    app.register_blueprint(recording_blueprint)
 
     # Initialize data subdirectories
     for dir in config.DATA_DIRS:
         os.makedirs(dir, exist_ok=True)
 
+    # Start the analysis workers, resuming jobs left unfinished by the last run (only in the
+    # server's process: spawned analysis processes import this module too)
+    if multiprocessing.parent_process() is None:
+        analysis_pool.start()
+        job_queue.init_app(app)
+
     logger.info('App initialization complete.')
 
     return app
@@ -56,6 +70,9 @@ def create_app():
 app = create_app()
 
 if __name__ == "__main__":
+    # Analysis worker processes re-run this executable when it's frozen
+    multiprocessing.freeze_support()
+
     # app.run() # (flask debugging mode)
 
     # Reason for choosing cherrypy
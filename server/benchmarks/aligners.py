@@ -0,0 +1,92 @@
+"""Aligners Benchmark
+
+Reports the wall time, peak memory and agreement with the "full" aligner of
+every registered alignment strategy. Each strategy aligns the sheet music in
+tests/data/dat against perturbed performances of it (timing jitter, wrong,
+missing and extra notes), and against a longer synthetic piece made by
+repeating the longest one.
+
+Run from the server directory:
+    python -m benchmarks.aligners [aligner ...]
+"""
+import glob
+import json
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+from scripts.compare import compare_arrays, get_aligner, get_aligner_names
+from scripts.objects import Note, NoteArray
+
+DAT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests/data/dat")
+PERFORMANCES = 5 # Perturbed performances of every piece.
+SYNTHETIC_NOTES = 4000 # Length of the synthetic piece in notes.
+REFERENCE = "full" # Aligner the others are compared against.
+
+def perform(notes: NoteArray, seed: int) -> NoteArray:
+    # Plays the notes with timing jitter, 5% wrong, missing and extra notes
+    rng = np.random.default_rng(seed)
+    played = []
+    for note in notes:
+        if rng.random() < 0.05:
+            continue
+        pitch = note.pitch*2**(rng.choice([-1, 1])/12) if rng.random() < 0.05 else note.pitch
+        shift = rng.normal(0, 0.05)
+        played.append(Note(pitch, int(rng.integers(40, 100)), note.start + shift, note.end + shift))
+        if rng.random() < 0.05:
+            played.append(Note(note.pitch*1.5, 60, note.end, note.end + 0.1))
+    return NoteArray.from_notes(played)
+
+def repeat(notes: NoteArray, length: int) -> NoteArray:
+    # Plays the notes over and over, one second apart, until there are length notes
+    index = np.resize(np.arange(len(notes)), length)
+    offsets = (np.cumsum(index == 0) - 1)*(notes.end.max() + 1)
+    return NoteArray(notes.pitch[index], notes.velocity[index], notes.start[index] + offsets, notes.end[index] + offsets)
+
+def pairs(ideal_indices: np.array, actual_indices: np.array) -> set:
+    paired = (ideal_indices >= 0) & (actual_indices >= 0)
+    return set(zip(ideal_indices[paired].tolist(), actual_indices[paired].tolist()))
+
+def main():
+    names = sys.argv[1:] or get_aligner_names()
+
+    pieces = []
+    for file in sorted(glob.glob(DAT_DIR + "/*.json")):
+        with open(file) as json_file:
+            pieces.append((os.path.basename(file)[:-5], NoteArray.from_dicts(json.load(json_file)["notes"])))
+    pieces.append((f"synthetic {SYNTHETIC_NOTES}", repeat(max(pieces, key=lambda piece: len(piece[1]))[1],
+                                                          SYNTHETIC_NOTES)))
+
+    # Compile the kernels before timing anything
+    for name in set(names) | {REFERENCE}:
+        get_aligner(name).align(pieces[0][1], pieces[0][1])
+
+    print(f"{'piece':20} {'aligner':10} {'seconds':>8} {'MiB':>7} {'pairs agree':>12} {'accuracy diff':>14}")
+    for piece, ideal in pieces:
+        performances = [perform(ideal, seed) for seed in range(PERFORMANCES)]
+        references = [get_aligner(REFERENCE).align(ideal, actual) for actual in performances]
+        reference_accuracies = [compare_arrays(ideal, actual, REFERENCE)[:3] for actual in performances]
+        for name in names:
+            aligner = get_aligner(name)
+            seconds = peak = agree = total = 0
+            accuracy_diff = 0.0
+            for actual, reference, reference_accuracy in zip(performances, references, reference_accuracies):
+                tracemalloc.start()
+                start = time.perf_counter()
+                aligned = aligner.align(ideal, actual)
+                seconds += time.perf_counter() - start
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+
+                reference_pairs = pairs(*reference)
+                agree += len(pairs(*aligned) & reference_pairs)
+                total += len(reference_pairs)
+                accuracy = compare_arrays(ideal, actual, name)[:3]
+                accuracy_diff = max(accuracy_diff, *np.abs(np.subtract(accuracy, reference_accuracy)))
+            print(f"{piece:20} {name:10} {seconds/PERFORMANCES:8.3f} {peak/2**20:7.1f} "
+                  f"{agree/total:12.2%} {accuracy_diff:14.2%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Audio Decode Benchmark
+
+Compares the time spent decoding and resampling the test recordings with
+librosa.load (kaiser_best) against load_audio with each resampler, next to
+the time pitch tracking takes, all per minute of audio.
+
+Run from the server directory:
+    python -m benchmarks.audio_decode
+"""
+import glob
+import os
+import time
+import warnings
+import librosa
+import config
+
+from scripts.audio_stream import load_audio
+from scripts.pitch_estimators import get_pitch_estimator
+from scripts.signal_processing import get_frame_features, YIN_SAMPLE_RATE
+
+WAV_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests/data/wav")
+RESAMPLERS = ["polyphase", "kaiser_fast", "fft"]
+
+def per_minute(function, files):
+    audio_seconds = 0.0
+    start = time.perf_counter()
+    for file in files:
+        audio, sr = function(file)
+        audio_seconds += audio.size/sr
+    return 60*(time.perf_counter() - start)/audio_seconds
+
+def main():
+    warnings.filterwarnings("ignore")
+    files = sorted(glob.glob(WAV_DIR + "/*.wav"))
+
+    print(f"{'decoder':24} {'s per minute':>12}")
+    print(f"{'librosa.load':24} {per_minute(librosa.load, files):12.3f}")
+    for res_type in RESAMPLERS:
+        seconds = per_minute(lambda file: load_audio(file, YIN_SAMPLE_RATE, res_type), files)
+        print(f"{'load_audio ' + res_type:24} {seconds:12.3f}")
+
+    # Pitch tracking alone, for scale
+    estimator = get_pitch_estimator(config.PITCH_ESTIMATOR)
+    estimator.reset_throughput()
+    for file in files:
+        get_frame_features(*load_audio(file, YIN_SAMPLE_RATE))
+    print(f"{config.PITCH_ESTIMATOR:24} {estimator.seconds_per_minute:12.3f}")
+
+if __name__ == "__main__":
+    main()
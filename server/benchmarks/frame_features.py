@@ -0,0 +1,65 @@
+"""Frame Features Benchmark
+
+Compares wall time and peak memory of the fused frame feature extractor
+against the previous path (librosa.yin plus a boxcar STFT for the RMS) on the
+test recordings and on a longer synthetic take.
+
+Run from the server directory:
+    python -m benchmarks.frame_features
+"""
+import glob
+import os
+import time
+import tracemalloc
+import warnings
+import librosa
+import numpy as np
+
+from scripts.signal_processing import (get_frame_features, FMIN, FMAX, YIN_FRAME_LENGTH,
+                                       YIN_HOP_LENGTH, YIN_WINDOW_LENGTH)
+
+WAV_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests/data/wav")
+SYNTHETIC_DURATION = 300 # Length of the synthetic take in seconds.
+
+def separate_features(audio: np.array, sr: int):
+    # The previous implementation of get_f0_time_amp_yin
+    f0 = librosa.yin(audio, sr=sr, fmin=FMIN, fmax=FMAX, frame_length=YIN_FRAME_LENGTH, win_length=YIN_WINDOW_LENGTH, hop_length=YIN_HOP_LENGTH)
+    times = np.array([YIN_HOP_LENGTH/sr*i for i in range(f0.size)])
+    S = librosa.magphase(librosa.stft(audio, n_fft=YIN_FRAME_LENGTH, hop_length=YIN_HOP_LENGTH, win_length=YIN_WINDOW_LENGTH, window=np.ones))[0]
+    amplitudes = librosa.feature.rms(S=S, frame_length=YIN_FRAME_LENGTH, hop_length=YIN_HOP_LENGTH)[0]
+    return f0, times, amplitudes
+
+def fused_features(audio: np.array, sr: int):
+    f0, amplitudes = get_frame_features(audio, sr)
+    times = YIN_HOP_LENGTH/sr*np.arange(f0.size)
+    return f0, times, amplitudes
+
+def measure(function, audio: np.array, sr: int):
+    tracemalloc.start()
+    start = time.perf_counter()
+    function(audio, sr)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+def main():
+    warnings.filterwarnings("ignore")
+    takes = []
+    for file in sorted(glob.glob(WAV_DIR + "/*.wav")):
+        audio, sr = librosa.load(file)
+        takes.append((os.path.basename(file), audio, sr))
+    # Longer take made by looping the longest recording
+    name, audio, sr = max(takes, key=lambda take: take[1].size)
+    takes.append((f"synthetic {SYNTHETIC_DURATION}s",
+                  np.resize(audio, SYNTHETIC_DURATION*sr), sr))
+
+    print(f"{'recording':32} {'separate s':>10} {'MiB':>7} {'fused s':>10} {'MiB':>7}")
+    for name, audio, sr in takes:
+        separate_time, separate_peak = measure(separate_features, audio, sr)
+        fused_time, fused_peak = measure(fused_features, audio, sr)
+        print(f"{name:32} {separate_time:10.3f} {separate_peak/2**20:7.1f} "
+              f"{fused_time:10.3f} {fused_peak/2**20:7.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Parallel Frame Features Benchmark
+
+Measures the speedup of splitting the frame feature extraction across worker
+processes, on the test recordings and on longer synthetic takes.
+
+Run from the server directory:
+    python -m benchmarks.parallel_features [max workers]
+"""
+import glob
+import os
+import sys
+import time
+import warnings
+import librosa
+import numpy as np
+
+from scripts import signal_processing
+from scripts.signal_processing import get_frame_features_parallel
+
+WAV_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests/data/wav")
+SYNTHETIC_DURATIONS = [120, 600] # Lengths of the synthetic takes in seconds.
+
+def main():
+    warnings.filterwarnings("ignore")
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+    worker_counts = sorted({1, 2, 4, max_workers})
+    # Split even the short test recordings
+    signal_processing.PARALLEL_MIN_DURATION = 0
+
+    takes = []
+    for file in sorted(glob.glob(WAV_DIR + "/*.wav")):
+        audio, sr = librosa.load(file)
+        takes.append((os.path.basename(file), audio, sr))
+    name, audio, sr = max(takes, key=lambda take: take[1].size)
+    for duration in SYNTHETIC_DURATIONS:
+        takes.append((f"synthetic {duration}s", np.resize(audio, duration*sr), sr))
+
+    # Start the worker pools before timing anything
+    for workers in worker_counts:
+        get_frame_features_parallel(takes[0][1], takes[0][2], workers)
+
+    print(f"{'recording':32}" + "".join(f"{f'{workers} workers':>14}" for workers in worker_counts))
+    for name, audio, sr in takes:
+        row = f"{name:32}"
+        serial_time = None
+        for workers in worker_counts:
+            start = time.perf_counter()
+            get_frame_features_parallel(audio, sr, workers)
+            elapsed = time.perf_counter() - start
+            serial_time = serial_time or elapsed
+            row += f"{elapsed:8.3f}s x{serial_time/elapsed:3.1f}"
+        print(row)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Pitch Estimators Benchmark
+
+Reports the throughput of every registered pitch estimator, how closely its
+frames agree with librosa.yin, and whether the notes it leads to match the
+sheet music of the test recordings.
+
+Run from the server directory:
+    python -m benchmarks.pitch_estimators [backend ...]
+"""
+import json
+import os
+import sys
+import warnings
+import librosa
+import numpy as np
+
+from scripts.objects import Note
+from scripts.pitch_estimators import get_pitch_estimator, get_pitch_estimator_names
+from scripts.signal_processing import (get_frame_features, amplitude_to_midi_velocity,
+                                       freq_to_notes_yin, YIN_HOP_LENGTH)
+
+TEST_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests/data")
+# Recording, sheet music and BPM, as in tests/test_signal_processing_yin.py
+RECORDINGS = [
+    ("cmaj_expected.wav", "CMajor.json", 60),
+    ("cmaj_actual.wav", "CMajor.json", 60),
+    ("cmaj_clarinet.wav", "CMajor.json", 60),
+    ("happybirthday_expected.wav", "Happy Birthday.json", 80),
+    ("happybirthday_actual.wav", "Happy Birthday.json", 80),
+    ("happybirthday_clarinet.wav", "Happy Birthday.json", 60),
+]
+MAX_CENTS_DIFF = 15 # Frame and note agreement tolerance.
+
+def main():
+    warnings.filterwarnings("ignore")
+    names = sys.argv[1:] or get_pitch_estimator_names()
+
+    takes = []
+    for wav, dat, bpm in RECORDINGS:
+        audio, sr = librosa.load(os.path.join(TEST_DIR, "wav", wav))
+        audio, _ = librosa.effects.trim(audio)
+        with open(os.path.join(TEST_DIR, "dat", dat)) as file:
+            expected = [note["pitch"] for note in json.load(file)["notes"]]
+        reference, _ = get_frame_features(audio, sr, estimator="librosa_yin")
+        takes.append((audio, sr, bpm, expected, reference))
+
+    print(f"{'backend':14} {'frames/s':>10} {'frames agree':>13} {'pieces correct':>15}")
+    for name in names:
+        estimator = get_pitch_estimator(name)
+        estimator.reset_throughput()
+        agree = total = correct = 0
+        for audio, sr, bpm, expected, reference in takes:
+            f0, amplitudes = get_frame_features(audio, sr, estimator=name)
+            agree += np.sum(np.abs(1200*np.log2(f0/reference)) <= MAX_CENTS_DIFF)
+            total += f0.size
+            times = YIN_HOP_LENGTH/sr*np.arange(f0.size)
+            notes = freq_to_notes_yin(f0, times, amplitude_to_midi_velocity(amplitudes), bpm)
+            correct += (len(notes) == len(expected) and
+                        all(Note.difference_cents(note.pitch, pitch) <= MAX_CENTS_DIFF
+                            for note, pitch in zip(notes, expected)))
+        print(f"{name:14} {estimator.throughput:10.0f} {agree/total:13.2%} "
+              f"{f'{correct}/{len(takes)}':>15}")
+
+if __name__ == "__main__":
+    main()
@@ -20,14 +20,63 @@ JSON_DIR = os.path.join(instance_path, "data/json")
 WAV_DIR = os.path.join(instance_path, "data/wav")
 XML_DIR = os.path.join(instance_path, "data/xml")
 TMP_DIR = os.path.join(instance_path, "data/tmp")
+CACHE_DIR = os.path.join(instance_path, "data/cache")
 
 DATA_DIRS = [
     JSON_DIR,
     WAV_DIR,
     XML_DIR,
     TMP_DIR,
+    CACHE_DIR,
 ]
 
+# Number of recordings analyzed at the same time, in the background (see api/jobs.py)
+ANALYSIS_JOB_WORKERS = 2
+
+# Number of worker processes recordings are analyzed in (started and warmed up with the server,
+# see scripts/analysis_pool.py), and the number of recordings each one analyzes before it's
+# replaced by a fresh one. None keeps them for good
+ANALYSIS_PROCESSES = ANALYSIS_JOB_WORKERS
+ANALYSIS_PROCESS_MAX_JOBS = 50
+
+# Seconds a recording uploaded chunk by chunk may go without a chunk before it's dropped
+# (see api/recording.py)
+RECORDING_SESSION_TIMEOUT = 300
+
+# Number of worker processes that share the pitch tracking of a recording. Split between the
+# analysis processes, so each one uses ANALYSIS_WORKERS // ANALYSIS_PROCESSES of them
+ANALYSIS_WORKERS = os.cpu_count() or 1
+
+# Resampler used when a recording isn't at the analysis sample rate (any librosa res_type,
+# e.g. "polyphase", "kaiser_fast", "kaiser_best", "fft")
+RESAMPLE_TYPE = "polyphase"
+
+# Default pitch estimation backend (see scripts/pitch_estimators.py)
+PITCH_ESTIMATOR = "yin"
+
+# Whether recordings are analyzed only around the pitch range of their sheet music, at the
+# lowest sample rate that range allows
+SCORE_INFORMED_ANALYSIS = True
+
+# Hops between the frames of the coarse pitch tracking pass (~30 ms); pitch is only tracked
+# frame by frame around note boundaries. 1 tracks every frame
+COARSE_TO_FINE_HOPS = 16
+
+# Frames this many dB below the loudest frame of a recording are treated as rests and not
+# pitch tracked. None tracks every frame
+ENERGY_GATE_TOP_DB = 50
+
+# Whether note extraction runs as numba-compiled kernels (see scripts/note_kernels.py). False runs
+# the NumPy versions, e.g. for debugging
+COMPILED_NOTE_KERNELS = True
+
+# How pitch tracked frames are grouped into notes: "frames" follows the pitch frame by frame,
+# "onsets" makes one note per segment between spectral flux onsets (suits piano)
+NOTE_SEGMENTER = "frames"
+
+# Size limit of the frame-level analysis cache in bytes (least recently used entries are evicted first)
+ANALYSIS_CACHE_MAX_BYTES = 512*1024*1024
+
 # the following constants are used for the comparison algorithm (xml vs wav)
 
 # pass confidence values are percentages
@@ -59,6 +108,22 @@ VELOCITY_TOLERANCE = 30 # MIDI velocity units
 START_TOLERANCE = 0.1 # seconds
 END_TOLERANCE = 0.2 # seconds
 
+# alignment of played notes to the sheet music: "full" aligns every note against every note,
+# "banded" only against notes played within ALIGNMENT_BAND_SECONDS of when they were expected
+# (the band widens when the alignment runs along its edge). banded is much faster on long pieces.
+# "anchored" fixes notes that start the same runs of ANCHOR_NGRAM_LENGTH pitch intervals in both
+# (within the band) and aligns only between them: about linear time when the piece is mostly
+# played right, but not always the best alignment. "dtw" is dynamic time warping
+# (see the aligner registry in scripts/compare.py; benchmarks/aligners.py compares them)
+ALIGNMENT_MODE = "full"
+ALIGNMENT_BAND_SECONDS = 4
+ANCHOR_NGRAM_LENGTH = 8
+
+# full alignments with a score matrix of at least this many cells (ideal notes + 1 times played
+# notes + 1) use Hirschberg's linear memory algorithm instead of keeping a step for every cell
+# (2 bytes per cell with the note matches)
+HIRSCHBERG_MIN_CELLS = 16_000_000
+
 # duration at which an extra note will recieve the maximum pitch accuracy penalty
 EXTRA_NOTE_MAX_PENALTY_DURATION = 0.125
 
@@ -0,0 +1,45 @@
+from flask import Blueprint
+import json
+from models import db
+
+model_job_blueprint = Blueprint("model_job", __name__)
+
+# States of a job, in order
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+class Job(db.Model):
+    __tablename__ = "job"
+
+    id = db.Column(db.String, primary_key=True)
+    kind = db.Column(db.String)
+    state = db.Column(db.String)
+    params = db.Column(db.Text)
+    result = db.Column(db.Text)
+    error = db.Column(db.String)
+    created = db.Column(db.DateTime)
+    updated = db.Column(db.DateTime)
+
+    def __init__(self, id: str, kind: str, params: dict, created):
+        self.id = id
+        self.kind = kind
+        self.state = JOB_QUEUED
+        self.params = json.dumps(params)
+        self.result = None
+        self.error = None
+        self.created = created
+        self.updated = created
+
+    @property
+    def serialize(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "state": self.state,
+            "result": json.loads(self.result) if self.result else None,
+            "error": self.error,
+            "created": self.created,
+            "updated": self.updated
+        }
@@ -0,0 +1,162 @@
+"""Alignment Kernels
+
+This module contains the numba-compiled Needleman-Wunsch and dynamic time
+warping kernels used to align played notes to the notes of the sheet music in
+compare.
+
+While filling the score matrix, the kernels store which step every cell's
+score came from as one byte, and keeps only two rows of scores. The traceback
+then follows the stored steps from the bottom right cell: one step per
+aligned pair, with no scores to compare again.
+
+Like note_kernels, compiled kernels are cached on disk, and setting
+NUMBA_DISABLE_JIT=1 runs them as plain Python.
+"""
+import numba
+import numpy as np
+
+# Steps of an alignment path into a cell of the score matrix
+STEP_MATCH = 0 # from the cell above and to the left (ideal and actual note aligned)
+STEP_DELETE = 1 # from the cell above (gap in the actual notes)
+STEP_INSERT = 2 # from the cell to the left (gap in the ideal notes)
+
+@numba.njit(cache=True)
+def align(matches: np.array, match_score: int, mismatch_penalty: int, gap_penalty: int,
+          insert_penalty: int, free_ideal_ends: bool = False):
+    """Fills the Needleman-Wunsch score matrix of two arrays of notes, keeping
+    the step each cell's score came from. Ties prefer a match, then a gap in
+    the actual notes, then a gap in the ideal notes.
+
+    With free_ideal_ends, ideal notes before the first aligned one cost
+    nothing, so the actual notes can align to any window of the ideal notes
+    (the window ends at the best score of the last column).
+
+    Args:
+        matches (np.array): Whether ideal note i equals actual note j, (n, m)
+        match_score (int): Score of aligning equal notes
+        mismatch_penalty (int): Score of aligning different notes
+        gap_penalty (int): Score of an ideal note that wasn't played
+        insert_penalty (int): Score of an extra played note
+        free_ideal_ends (bool): Whether skipping ideal notes before the
+            aligned ones is free
+
+    Returns:
+        Tuple[np.array, np.array]: The scores of the last column (the best
+            alignment ends in its last cell), and the (n + 1, m + 1) uint8
+            array of steps
+    """
+
+    n, m = matches.shape
+    steps = np.empty((n + 1, m + 1), dtype=np.uint8)
+    previous = np.empty(m + 1, dtype=np.int64)
+    row = np.empty(m + 1, dtype=np.int64)
+    last_column = np.empty(n + 1, dtype=np.int64)
+
+    steps[0, 0] = STEP_MATCH
+    previous[0] = 0
+    for j in range(1, m + 1):
+        previous[j] = previous[j - 1] + insert_penalty
+        steps[0, j] = STEP_INSERT
+    last_column[0] = previous[m]
+
+    for i in range(1, n + 1):
+        row[0] = 0 if free_ideal_ends else previous[0] + gap_penalty
+        steps[i, 0] = STEP_DELETE
+        for j in range(1, m + 1):
+            match = previous[j - 1] + (match_score if matches[i - 1, j - 1] else mismatch_penalty)
+            delete = previous[j] + gap_penalty
+            insert = row[j - 1] + insert_penalty
+            if match >= delete and match >= insert:
+                row[j] = match
+                steps[i, j] = STEP_MATCH
+            elif delete >= insert:
+                row[j] = delete
+                steps[i, j] = STEP_DELETE
+            else:
+                row[j] = insert
+                steps[i, j] = STEP_INSERT
+        last_column[i] = row[m]
+        previous, row = row, previous
+
+    return last_column, steps
+
+@numba.njit(cache=True)
+def traceback(steps: np.array, i: int, j: int, free_ideal_ends: bool = False):
+    """Follows the steps from cell (i, j) back to the top left cell, or to the
+    first column with free_ideal_ends.
+
+    Args:
+        steps (np.array): The steps returned by align
+        i (int): The row to start from
+        j (int): The column to start from
+        free_ideal_ends (bool): Whether the steps were filled with
+            free_ideal_ends
+
+    Returns:
+        Tuple[np.array, np.array]: The index of the ideal and the actual note
+            of every aligned pair, in order, with -1 for gaps
+    """
+
+    ideal = np.empty(i + j, dtype=np.int64)
+    actual = np.empty(i + j, dtype=np.int64)
+    k = 0
+    while j > 0 or (i > 0 and not free_ideal_ends):
+        step = steps[i, j]
+        if step == STEP_MATCH:
+            i -= 1
+            j -= 1
+            ideal[k], actual[k] = i, j
+        elif step == STEP_DELETE:
+            i -= 1
+            ideal[k], actual[k] = i, -1
+        else:
+            j -= 1
+            ideal[k], actual[k] = -1, j
+        k += 1
+
+    return ideal[:k][::-1], actual[:k][::-1]
+
+@numba.njit(cache=True)
+def dtw(costs: np.array):
+    """Fills the dynamic time warping cost matrix of two arrays of notes,
+    keeping the step each cell's cost came from (with the same preference as
+    align, and the same meaning: STEP_DELETE pairs an ideal note with the
+    actual note of the cell above it, STEP_INSERT an actual note with the
+    ideal note of the cell to its left).
+
+    Args:
+        costs (np.array): The cost of pairing ideal note i with actual note
+            j, (n, m)
+
+    Returns:
+        Tuple[float, np.array]: The cost of the best warping path, and the
+            (n + 1, m + 1) uint8 array of steps
+    """
+
+    n, m = costs.shape
+    steps = np.empty((n + 1, m + 1), dtype=np.uint8)
+    previous = np.full(m + 1, np.inf)
+    row = np.empty(m + 1)
+
+    previous[0] = 0.0
+    steps[0, 0] = STEP_MATCH
+    for j in range(1, m + 1):
+        steps[0, j] = STEP_INSERT
+
+    for i in range(1, n + 1):
+        row[0] = np.inf
+        steps[i, 0] = STEP_DELETE
+        for j in range(1, m + 1):
+            match, delete, insert = previous[j - 1], previous[j], row[j - 1]
+            if match <= delete and match <= insert:
+                row[j] = costs[i - 1, j - 1] + match
+                steps[i, j] = STEP_MATCH
+            elif delete <= insert:
+                row[j] = costs[i - 1, j - 1] + delete
+                steps[i, j] = STEP_DELETE
+            else:
+                row[j] = costs[i - 1, j - 1] + insert
+                steps[i, j] = STEP_INSERT
+        previous, row = row, previous
+
+    return previous[m], steps
@@ -0,0 +1,136 @@
+"""Analysis Cache
+
+This module contains an on-disk cache of the frame-level analysis of
+recordings (fundamental frequencies and velocities), so that analyzing the
+same audio again with the same parameters only has to redo the note
+extraction.
+
+Entries are keyed by a hash of the audio file's contents together with the
+analysis parameters, stored as compressed .npz files, and evicted least
+recently used first once the cache grows past its size limit.
+"""
+import hashlib
+import json
+import os
+import numpy as np
+from typing import Dict, Optional, Tuple
+
+CACHE_VERSION = 2 # Bump when the stored analysis changes meaning.
+HASH_BLOCK_SIZE = 1 << 20 # Bytes read at a time while hashing a file.
+
+class AnalysisCache:
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, rec_file: str, params: Dict) -> str:
+        """Builds the cache key of a recording analyzed with some parameters.
+
+        Args:
+            rec_file (str): The file path of the recording
+            params (Dict): The analysis parameters (JSON serializable)
+
+        Returns:
+            str: The cache key
+        """
+
+        digest = hashlib.sha256()
+        with open(rec_file, "rb") as file:
+            for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b""):
+                digest.update(block)
+        digest.update(json.dumps({"version": CACHE_VERSION, **params}, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[np.array, np.array, np.array]]:
+        """Gets a cached analysis and marks it as recently used.
+
+        Args:
+            key (str): The cache key
+
+        Returns:
+            Optional[Tuple[np.array, np.array, np.array]]: The arrays for
+                fundamental frequency, their times, and velocities, or None
+                if the analysis isn't cached
+        """
+
+        path = self._path(key)
+        try:
+            with np.load(path) as entry:
+                f0 = entry["f0"]
+                times = entry["hop_seconds"]*np.arange(f0.size)
+                velocities = entry["velocities"].tolist()
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError, KeyError):
+            # Unreadable entry, e.g. left behind by a crash
+            self._remove(path)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return f0, times, velocities
+
+    def put(self, key: str, f0: np.array, times: np.array, velocities: np.array):
+        """Stores an analysis, then evicts the least recently used entries
+        until the cache fits in max_bytes.
+
+        Args:
+            key (str): The cache key
+            f0 (np.array): The array of fundamental frequencies
+            times (np.array): The array of timestamps (evenly spaced)
+            velocities (np.array): The array of velocities
+        """
+
+        os.makedirs(self.directory, exist_ok=True)
+        hop_seconds = times[1] - times[0] if len(times) > 1 else 0.0
+        path = self._path(key)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as file:
+            np.savez_compressed(file, f0=f0, hop_seconds=hop_seconds,
+                                velocities=np.asarray(velocities, dtype=np.int16))
+        os.replace(temporary_path, path)
+
+        self.evict()
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits in
+        max_bytes.
+        """
+
+        entries = [entry for entry in os.scandir(self.directory)
+                   if entry.name.endswith(".npz")]
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        total = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            total -= entry.stat().st_size
+            self._remove(entry.path)
+
+    @property
+    def stats(self) -> Dict:
+        """Hit and miss counts of this process, and the current cache size."""
+
+        entries = ([entry for entry in os.scandir(self.directory) if entry.name.endswith(".npz")]
+                   if os.path.isdir(self.directory) else [])
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(entries),
+            "bytes": sum(entry.stat().st_size for entry in entries),
+            "max_bytes": self.max_bytes
+        }
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npz")
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
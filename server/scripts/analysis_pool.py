@@ -0,0 +1,299 @@
+"""Analysis Pool
+
+This module contains the pool of worker processes recordings are analyzed
+in, so that pitch tracking and alignment don't hold the server's GIL while
+requests are being served.
+
+Every worker is started ahead of time, and warms up by importing librosa,
+numba and music21 and running the analysis on a short synthetic recording,
+which loads the compiled kernels, so the first upload it handles runs at full
+speed. A worker is replaced by a fresh one after ANALYSIS_PROCESS_MAX_JOBS
+recordings (or when it dies), which also releases whatever memory it held on
+to.
+
+One more worker pitch tracks recordings uploaded chunk by chunk as the chunks
+arrive (see scripts/recording_session.py). Its calls run one at a time, in
+the order they're submitted, so it keeps the state of every recording between
+them.
+
+Progress the workers report (see scripts/progress.py) is sent back over a
+queue, and passed to the reporter of the thread that's waiting on the job.
+So are the counters every job adds to (decoding, the energy gate, the
+analysis cache and the pitch estimators), which are added to the server
+process's own, so the status endpoints cover the analyses the workers run.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import tempfile
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+
+from . import progress
+import config
+from config import ANALYSIS_PROCESSES, ANALYSIS_PROCESS_MAX_JOBS
+
+WARM_UP_SAMPLE_RATE = 22050 # Sample rate of the warm up recording.
+WARM_UP_PITCHES = (261.63, 329.63, 392.0, 523.25) # Notes of the warm up recording (Hz), half a second each.
+PROGRESS_FLUSH_TIMEOUT = 1 # Seconds to wait for a job's last progress events after its result.
+
+logger = logging.getLogger(__name__)
+
+# Queue progress is sent back over, in a worker process
+_progress_queue = None
+
+def start_worker(progress_queue, workers: int):
+    """Sets up a worker process as it starts: keeps the progress queue,
+    limits the processes it splits long recordings across, and warms up.
+
+    Args:
+        progress_queue (multiprocessing.Queue): The queue to send progress
+            back over
+        workers (int): The number of processes the worker may split the
+            pitch tracking of a recording across
+    """
+    global _progress_queue
+    _progress_queue = progress_queue
+    config.ANALYSIS_WORKERS = workers
+    warm_up()
+
+def run_job(key: int, function, args: tuple):
+    """Runs a function in a worker process, sending the progress it reports
+    back tagged with the key of the job, then the key and what the job added
+    to the counters when it's done.
+    """
+    progress.set_reporter(lambda stage, fraction: _progress_queue.put((key, stage, fraction)))
+    before = read_counters()
+    try:
+        return function(*args)
+    finally:
+        progress.set_reporter(None)
+        after = read_counters()
+        _progress_queue.put((key, None, {name: {field: value - before[name][field] for field, value in values.items()}
+                                         for name, values in after.items()}))
+
+def get_counters() -> dict:
+    """Gets the objects counting the work analyses do in this process, for
+    the status endpoints.
+
+    Returns:
+        dict: The name of every counting object: the object, and the names
+            of its counters
+    """
+
+    from .audio_stream import decode_stats
+    from .pitch_estimators import PITCH_ESTIMATORS
+    from .signal_processing import analysis_cache, gate_stats
+
+    counters = {
+        "decode": (decode_stats, ("audio_seconds", "seconds_spent")),
+        "energy_gate": (gate_stats, ("frames", "frames_skipped")),
+        "analysis_cache": (analysis_cache, ("hits", "misses")),
+    }
+    for name, estimator in PITCH_ESTIMATORS.items():
+        counters[f"pitch_estimator.{name}"] = (estimator, ("frames_estimated", "audio_seconds", "seconds_spent"))
+    return counters
+
+def read_counters() -> dict:
+    """Reads the counters of this process.
+
+    Returns:
+        dict: The name of every counting object: its counters by name
+    """
+    return {name: {field: getattr(counter, field) for field in fields}
+            for name, (counter, fields) in get_counters().items()}
+
+def add_counters(deltas: dict):
+    """Adds what a job in a worker process counted to the counters of this
+    process.
+
+    Args:
+        deltas (dict): The name of every counting object: how much its
+            counters grew, by name
+    """
+    counters = get_counters()
+    for name, values in deltas.items():
+        counter, _ = counters[name]
+        for field, value in values.items():
+            setattr(counter, field, getattr(counter, field) + value)
+
+def warm_up():
+    """Imports the analysis libraries and runs every compiled kernel once,
+    analyzing and aligning a short recording of a few tones. Runs in every
+    worker process as it starts.
+    """
+
+    import music21 # noqa: F401 (librosa and numba come with signal_processing)
+    import soundfile as sf
+    from .compare import compare_arrays, get_aligner_names
+    from .objects import NoteArray
+    from .signal_processing import signal_processing
+
+    t = np.arange(WARM_UP_SAMPLE_RATE // 2) / WARM_UP_SAMPLE_RATE
+    audio = np.concatenate([0.5*np.sin(2*np.pi*pitch*t) for pitch in WARM_UP_PITCHES])
+    file, path = tempfile.mkstemp(suffix=".wav")
+    os.close(file)
+    try:
+        sf.write(path, audio, WARM_UP_SAMPLE_RATE)
+        for segmenter in ["frames", "onsets"]:
+            result = signal_processing(path, 120, stream=False, use_cache=False, segmenter=segmenter)
+            notes = NoteArray.from_dicts(json.loads(result)["notes"])
+        for mode in get_aligner_names():
+            compare_arrays(notes, notes, mode)
+    except Exception:
+        # A worker that can't warm up still analyzes, only slower the first time
+        logger.exception("Analysis worker warm up failed")
+    finally:
+        os.remove(path)
+
+class AnalysisWorker:
+    """One worker process, and the number of jobs it has run."""
+
+    def __init__(self, progress_queue, workers: int):
+        # Spawned rather than forked: the server's threads (and their locks) aren't copied along
+        self.executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=start_worker, initargs=(progress_queue, workers))
+        self.jobs = 0
+        # Start the process now, so it warms up before the first job
+        self.executor.submit(int)
+
+class AnalysisPool:
+    """A pool of pre-warmed analysis worker processes. Until it's started,
+    run calls the function in the calling thread.
+    """
+
+    def __init__(self):
+        self.idle = queue.Queue()
+        self.size = 0
+        self.max_jobs = None
+        self.worker_processes = 1
+        self.recording_worker = None
+        self.progress_queue = None
+        self.reporters = {} # key of every running job: (reporter, whether its last progress arrived)
+        self.next_key = 0
+        self.lock = threading.Lock()
+
+    def start(self, size: int=ANALYSIS_PROCESSES, max_jobs: int=ANALYSIS_PROCESS_MAX_JOBS):
+        """Starts the worker processes.
+
+        Args:
+            size (int): The number of worker processes
+            max_jobs (int): The number of jobs after which a worker is
+                replaced, or None to keep workers for good
+        """
+        self.size = size
+        self.max_jobs = max_jobs
+        # Workers share the CPUs when they split long recordings across processes of their own
+        self.worker_processes = max(1, config.ANALYSIS_WORKERS//max(1, size))
+        self.progress_queue = multiprocessing.get_context("spawn").Queue()
+        threading.Thread(target=self.forward_progress, name="analysis-progress", daemon=True).start()
+        for _ in range(size):
+            self.idle.put(AnalysisWorker(self.progress_queue, self.worker_processes))
+        self.recording_worker = AnalysisWorker(self.progress_queue, 1)
+
+    def run(self, function, *args):
+        """Runs a function in the next idle worker process, waiting for one
+        if they're all busy.
+
+        Args:
+            function: The function, importable by the workers
+            *args: Its arguments (picklable)
+
+        Returns:
+            The function's return value
+        """
+        if self.size == 0:
+            return function(*args)
+
+        with self.lock:
+            key = self.next_key
+            self.next_key += 1
+        done = threading.Event()
+        self.reporters[key] = (progress.get_reporter(), done)
+
+        worker = self.idle.get()
+        broken = False
+        try:
+            result = worker.executor.submit(run_job, key, function, args).result()
+            # The queue may still hold the job's last progress events
+            done.wait(PROGRESS_FLUSH_TIMEOUT)
+            return result
+        except BrokenProcessPool:
+            broken = True
+            raise
+        finally:
+            del self.reporters[key]
+            worker.jobs += 1
+            if broken or (self.max_jobs is not None and worker.jobs >= self.max_jobs):
+                logger.info(f"Replacing analysis worker after {worker.jobs} jobs")
+                worker.executor.shutdown(wait=False)
+                worker = AnalysisWorker(self.progress_queue, self.worker_processes)
+            self.idle.put(worker)
+
+    def submit_recording(self, function, *args) -> Future:
+        """Runs a function in the recording worker, without waiting for it.
+        Functions run one at a time, in the order they're submitted. Until
+        the pool is started, the function runs in the calling thread.
+
+        Args:
+            function: The function, importable by the workers
+            *args: Its arguments (picklable)
+
+        Returns:
+            Future: The function's return value, once it has run
+        """
+        if self.size == 0:
+            future = Future()
+            try:
+                future.set_result(function(*args))
+            except Exception as error:
+                future.set_exception(error)
+            return future
+
+        with self.lock:
+            key = self.next_key
+            self.next_key += 1
+            try:
+                return self.recording_worker.executor.submit(run_job, key, function, args)
+            except BrokenProcessPool:
+                # The recordings it was tracking are left to their analysis jobs
+                logger.info("Replacing recording worker")
+                self.recording_worker.executor.shutdown(wait=False)
+                self.recording_worker = AnalysisWorker(self.progress_queue, 1)
+                return self.recording_worker.executor.submit(run_job, key, function, args)
+
+    def forward_progress(self):
+        """Passes the progress the workers send back to the reporters of the
+        threads waiting on their jobs, and adds the counters of finished jobs
+        to this process's. Runs in its own thread.
+        """
+        while True:
+            key, stage, fraction = self.progress_queue.get()
+            if stage is None:
+                # (the counters of a job, sent when it's done)
+                add_counters(fraction)
+            reporter, done = self.reporters.get(key, (None, None))
+            if done is None:
+                continue
+            if stage is None:
+                done.set()
+            elif reporter is not None:
+                try:
+                    reporter(stage, fraction)
+                except Exception:
+                    logger.exception(f"Reporting {stage} progress failed")
+
+    def stop(self):
+        """Stops the worker processes, once they finish their current job."""
+        for _ in range(self.size):
+            self.idle.get().executor.shutdown(wait=True)
+        if self.recording_worker is not None:
+            self.recording_worker.executor.shutdown(wait=True)
+            self.recording_worker = None
+        self.size = 0
+
+analysis_pool = AnalysisPool()
@@ -0,0 +1,228 @@
+"""Audio Stream
+
+This module contains helpers to decode sound files, either whole or block by
+block, and cut the decoded audio into overlapping analysis frames, so that
+long recordings can be analyzed without holding the whole signal in memory.
+
+Decoding keeps count of the audio it has produced and the time it took, so
+its cost can be compared with the cost of pitch tracking.
+"""
+import math
+import time
+import librosa
+import numpy as np
+import soundfile as sf
+from scipy.signal import resample_poly
+from typing import Iterator, Tuple
+
+# Extra input samples decoded on each side of a block before resampling so
+# that the resampling filter never sees a block edge (~10 taps are needed).
+RESAMPLE_MARGIN = 1024
+
+class DecodeStats:
+    """Running totals of the audio decoded (and resampled) in this process."""
+
+    def __init__(self):
+        self.audio_seconds = 0.0
+        self.seconds_spent = 0.0
+
+    def add(self, audio_seconds: float, seconds_spent: float):
+        self.audio_seconds += audio_seconds
+        self.seconds_spent += seconds_spent
+
+    @property
+    def seconds_per_minute(self) -> float:
+        """Seconds spent per minute of audio so far (0 before the first file)."""
+
+        if self.audio_seconds == 0:
+            return 0.0
+        return 60*self.seconds_spent/self.audio_seconds
+
+    def reset(self):
+        self.audio_seconds = 0.0
+        self.seconds_spent = 0.0
+
+decode_stats = DecodeStats()
+
+class FrameStream:
+    """Cuts a stream of audio blocks into segments of whole frames.
+
+    The frames match what a single framing of the concatenated blocks with
+    center=True and zero padding would produce. Every segment returned by
+    push and flush can be analyzed with center=False and its frames follow
+    directly after the frames of the previous segment.
+    """
+
+    def __init__(self, frame_length: int, hop_length: int):
+        self.frame_length = frame_length
+        self.hop_length = hop_length
+        # Zero padding that centers the first frame on sample 0
+        self.buffer = np.zeros(frame_length//2, dtype=np.float32)
+
+    def push(self, block: np.array) -> np.array:
+        """Adds a block of audio and returns the samples spanned by every
+        frame that is now complete.
+
+        Args:
+            block (np.array): The next block of audio
+
+        Returns:
+            np.array: The samples of the complete frames (possibly empty)
+        """
+
+        self.buffer = np.concatenate((self.buffer, block))
+        if self.buffer.size < self.frame_length:
+            return self.buffer[:0]
+
+        n_frames = 1 + (self.buffer.size - self.frame_length)//self.hop_length
+        segment = self.buffer[:(n_frames - 1)*self.hop_length + self.frame_length]
+        self.buffer = self.buffer[n_frames*self.hop_length:]
+
+        return segment
+
+    def flush(self) -> np.array:
+        """Pads the end of the stream and returns the remaining frames.
+
+        Returns:
+            np.array: The samples of the remaining frames (possibly empty)
+        """
+
+        return self.push(np.zeros(self.frame_length//2, dtype=np.float32))
+
+def load_audio(rec_file: str, sr: int, res_type: str="polyphase") -> Tuple[np.array, int]:
+    """Decodes a whole sound file as mono float32 audio at the given sample
+    rate.
+
+    The file is read directly with soundfile and only resampled when its
+    native sample rate differs from sr. Files soundfile can't read are
+    decoded by librosa instead.
+
+    Args:
+        rec_file (str): The file path of the sound file
+        sr (int): The sample rate to resample to
+        res_type (str): The librosa resampler to use when resampling is
+            needed ("polyphase", "kaiser_fast", "kaiser_best", "fft", ...)
+
+    Returns:
+        Tuple[np.array, int]: The audio and its sample rate
+    """
+
+    start = time.perf_counter()
+    try:
+        with sf.SoundFile(rec_file) as audio_file:
+            native_sr = audio_file.samplerate
+            audio = _read_mono(audio_file, -1)
+    except RuntimeError:
+        audio, native_sr = librosa.load(rec_file, sr=None)
+
+    if native_sr != sr:
+        audio = librosa.resample(audio, orig_sr=native_sr, target_sr=sr, res_type=res_type)
+        audio = audio.astype(np.float32, copy=False)
+    decode_stats.add(audio.size/sr, time.perf_counter() - start)
+
+    return audio, sr
+
+def stream_audio(rec_file: str, sr: int, block_duration: float) -> Iterator[np.array]:
+    """Decodes a sound file block by block as mono float32 audio at the
+    given sample rate.
+
+    Blocks are resampled with a polyphase filter. Each block is decoded with
+    RESAMPLE_MARGIN samples of context on both sides and cropped afterwards,
+    so the concatenated blocks match resampling the whole file at once.
+
+    Args:
+        rec_file (str): The file path of the sound file
+        sr (int): The sample rate to resample to
+        block_duration (float): The approximate length of a block in seconds
+
+    Yields:
+        np.array: The next block of audio
+    """
+
+    with sf.SoundFile(rec_file) as audio_file:
+        divisor = math.gcd(audio_file.samplerate, sr)
+        up, down = sr//divisor, audio_file.samplerate//divisor
+        # Block edges must land on the polyphase grid to crop exactly
+        block_length = down*max(1, int(block_duration*audio_file.samplerate)//down)
+        margin = 0 if up == down else down*math.ceil(RESAMPLE_MARGIN/down)
+
+        before = np.zeros(0, dtype=np.float32)
+        current = _read_mono(audio_file, block_length)
+        while current.size > 0:
+            start = time.perf_counter()
+            after = _read_mono(audio_file, block_length)
+            if up == down:
+                block = current
+            else:
+                padded = np.concatenate((before, current, after[:margin]))
+                resampled = resample_poly(padded, up, down).astype(np.float32)
+                first = before.size*up//down
+                block = resampled[first:first + math.ceil(current.size*up/down)]
+            decode_stats.add(block.size/sr, time.perf_counter() - start)
+            yield block
+            before = np.concatenate((before, current))[-margin:] if margin else before
+            current = after
+
+class ResampleStream:
+    """Resamples a stream of audio blocks, e.g. pushed as they're recorded.
+
+    Like stream_audio, audio is resampled with a polyphase filter and
+    RESAMPLE_MARGIN samples of context on both sides, so the output of every
+    push is held back until that much audio follows it, and the concatenated
+    output matches resampling the whole stream at once.
+    """
+
+    def __init__(self, orig_sr: int, sr: int):
+        self.sr = sr
+        divisor = math.gcd(orig_sr, sr)
+        self.up, self.down = sr//divisor, orig_sr//divisor
+        self.margin = 0 if self.up == self.down else self.down*math.ceil(RESAMPLE_MARGIN/self.down)
+        self.before = np.zeros(0, dtype=np.float32)
+        self.pending = np.zeros(0, dtype=np.float32)
+
+    def push(self, block: np.array) -> np.array:
+        """Adds a block of audio and returns the audio that can now be
+        resampled.
+
+        Args:
+            block (np.array): The next block of audio, at orig_sr
+
+        Returns:
+            np.array: The next resampled audio, at sr (possibly empty)
+        """
+
+        if self.up == self.down:
+            return np.asarray(block, dtype=np.float32)
+        self.pending = np.concatenate((self.pending, block))
+        # Whole polyphase periods with the margin after them
+        length = (self.pending.size - self.margin)//self.down*self.down
+        return self._resample(length) if length > 0 else self.pending[:0]
+
+    def flush(self) -> np.array:
+        """Resamples the end of the stream.
+
+        Returns:
+            np.array: The remaining resampled audio (possibly empty)
+        """
+
+        if self.up == self.down or self.pending.size == 0:
+            return self.pending[:0]
+        return self._resample(self.pending.size)
+
+    def _resample(self, length: int) -> np.array:
+        start = time.perf_counter()
+        current, after = self.pending[:length], self.pending[length:length + self.margin]
+        resampled = resample_poly(np.concatenate((self.before, current, after)), self.up, self.down).astype(np.float32)
+        first = self.before.size*self.up//self.down
+        block = resampled[first:first + math.ceil(current.size*self.up/self.down)]
+        self.before = np.concatenate((self.before, current))[-self.margin:]
+        self.pending = self.pending[length:]
+        decode_stats.add(block.size/self.sr, time.perf_counter() - start)
+        return block
+
+def _read_mono(audio_file: sf.SoundFile, frames: int) -> np.array:
+    """Reads the next frames of a sound file and mixes them down to mono.
+    """
+
+    block = audio_file.read(frames, dtype="float32", always_2d=True)
+    return block.mean(axis=1, dtype=np.float32)
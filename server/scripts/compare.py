@@ -1,14 +1,26 @@
 import numpy as np
 import json
-from .objects import Difference, Note
+import bisect
+import time
+from .objects import Difference, Note, NoteArray
+from . import alignment_kernels
+from .alignment_kernels import STEP_MATCH, STEP_DELETE, STEP_INSERT
 from config import VELOCITY_PASS_CONF, PITCH_PASS_CONF, START_PASS_CONF, END_PASS_CONF
-
-import pandas as pd # Debugging
-
-MATCH_SCORE = 2
-MISMATCH_PENALTY = -4
-GAP_PENALTY = -3
-INSERT_PENALTY = -4
+from config import EXTRA_NOTE_MAX_PENALTY_DURATION, EXTRA_NOTE_MAX_PENALTY
+from config import ALIGNMENT_MODE, ALIGNMENT_BAND_SECONDS, HIRSCHBERG_MIN_CELLS, ANCHOR_NGRAM_LENGTH
+from config import NOTE_MATCH_PASS_CONF, PITCH_WEIGHT, VELOCITY_WEIGHT, END_WEIGHT, START_WEIGHT, PITCH_TOLERANCE, VELOCITY_TOLERANCE, START_TOLERANCE, END_TOLERANCE
+
+# Scores of the note alignments, the defaults of every aligner. Extra played notes cost
+# INSERT_PENALTY in the aligners that score them apart from missing notes (full_alignment and
+# find_subsequence, with the compiled kernel); it equals GAP_PENALTY so that every mode finds
+# the same alignment.
+MATCH_SCORE = 1
+MISMATCH_PENALTY = -2
+GAP_PENALTY = -2
+INSERT_PENALTY = -2
+BAND_OUTSIDE_SCORE = -(1 << 40) # Score of cells outside the band of a banded alignment
+HIRSCHBERG_BLOCK_CELLS = 1 << 16 # Regions up to this many cells are aligned without splitting them further
+MATCH_BLOCK_CELLS = 1 << 18 # Note pairs compared at once by note_match_matrix
 
 # This script compares two arrays of Note objects, representing ideal and actual
 # musical performances, and calculates the accuracy and differences between them.
@@ -16,6 +28,8 @@ INSERT_PENALTY = -4
 # DEBUGGING FUNCTION
 
 def save_score_matrix_to_csv(score_matrix, ideal_notes, actual_notes, output_file):
+    import pandas as pd
+
     score_matrix_list = []
 
     for i in range(score_matrix.shape[0]):
@@ -55,115 +69,617 @@ def shift_start_time_to_zero(notes_array, ideal_first_note):
             note.start -= first_note_start_time
             note.end -= first_note_start_time
 
+# Stack the pitch (MIDI cents), velocity, start and end of every note (a NoteArray or a list of
+# Note objects) into an (n, 4) array.
+def note_fields(notes):
+    if isinstance(notes, NoteArray):
+        return notes.fields
+    return np.array([(note.cents, note.velocity, note.start, note.end) for note in notes], dtype=float).reshape(-1, 4)
+
+# Turn the indices of an alignment into the aligned notes: the ideal and played notes as two
+# lists of the same length, with None for gaps.
+def aligned_notes(ideal_array, actual_array, ideal_indices, actual_indices):
+    aligned_ideal = [ideal_array[i] if i >= 0 else None for i in ideal_indices]
+    aligned_actual = [actual_array[j] if j >= 0 else None for j in actual_indices]
+    return aligned_ideal, aligned_actual
+
+# Compute whether ideal and actual notes are equal (see Note.__eq__), given their fields.
+# The arrays broadcast against each other, so any set of pairs can be checked at once.
+def notes_match(ideal, actual):
+    # Same confidences and weights as Note.compare_notes, in the same order
+    pitch_confidence = np.maximum(0, 1 - (np.abs(ideal[..., 0] - actual[..., 0]) / PITCH_TOLERANCE))
+    start_confidence = np.maximum(0, 1 - np.abs(ideal[..., 2] - actual[..., 2]) / END_TOLERANCE)
+    end_confidence = np.maximum(0, 1 - np.abs(ideal[..., 3] - actual[..., 3]) / END_TOLERANCE)
+    velocity_confidence = np.maximum(0, 1 - np.abs(ideal[..., 1] - actual[..., 1]) / VELOCITY_TOLERANCE)
+    total_confidence = (
+        PITCH_WEIGHT * pitch_confidence +
+        START_WEIGHT * start_confidence +
+        END_WEIGHT * end_confidence +
+        VELOCITY_WEIGHT * velocity_confidence
+    )
+
+    return total_confidence >= NOTE_MATCH_PASS_CONF
+
+# Compute which notes of seq1 and seq2 are equal (see Note.__eq__) for every pair at once. Rows
+# are computed MATCH_BLOCK_CELLS pairs at a time, since notes_match makes several float arrays
+# the size of its result.
+def note_match_matrix(seq1, seq2):
+    fields1, fields2 = note_fields(seq1), note_fields(seq2)
+    matches = np.empty((len(fields1), len(fields2)), dtype=bool)
+    block_rows = max(1, MATCH_BLOCK_CELLS // max(1, len(fields2)))
+    for first in range(0, len(fields1), block_rows):
+        matches[first:first + block_rows] = notes_match(fields1[first:first + block_rows, None], fields2[None, :])
+    return matches
+
 # Implement the Needleman-Wunsch algorithm to find the optimal alignment of two arrays of musical notes.
-def needleman_wunsch(seq1, seq2, gap_penalty=-2, mismatch_penalty=-2, match_score=1):
+def needleman_wunsch(seq1, seq2, gap_penalty=GAP_PENALTY, mismatch_penalty=MISMATCH_PENALTY, match_score=MATCH_SCORE):
     len1, len2 = len(seq1), len(seq2)
     # Create a score matrix of size (len1 + 1) x (len2 + 1) initialized with zeros.
     score_matrix = np.zeros((len1 + 1, len2 + 1), dtype=int)
 
     # Fill the first row and column of the score matrix with gap penalty values.
-    for i in range(len1 + 1):
-        score_matrix[i, 0] = gap_penalty * i
-    for j in range(len2 + 1):
-        score_matrix[0, j] = gap_penalty * j
+    score_matrix[:, 0] = gap_penalty * np.arange(len1 + 1)
+    score_matrix[0, :] = gap_penalty * np.arange(len2 + 1)
 
-    # Fill in the rest of the score matrix using the Needleman-Wunsch algorithm.
+    # Score for a match or a mismatch of every pair of notes.
+    pair_scores = np.where(note_match_matrix(seq1, seq2), match_score, mismatch_penalty)
+    gap_steps = gap_penalty * np.arange(len2 + 1)
+
+    # Fill in the rest of the score matrix one row at a time.
     for i in range(1, len1 + 1):
-        for j in range(1, len2 + 1):
-            # Calculate the score for a match or a mismatch.
-            match = score_matrix[i - 1, j - 1] + (match_score if seq1[i - 1] == seq2[j - 1] else mismatch_penalty)
-            # Calculate the score for a gap in seq2.
-            delete = score_matrix[i - 1, j] + gap_penalty
-            # Calculate the score for a gap in seq1.
-            insert = score_matrix[i, j - 1] + gap_penalty
-            # Choose the maximum score and store it in the score matrix.
-            score_matrix[i, j] = max(match, delete, insert)
+        previous, row = score_matrix[i - 1], score_matrix[i]
+        # Best of a match/mismatch and a gap in seq2, for every cell of the row.
+        row[1:] = np.maximum(previous[:-1] + pair_scores[i - 1], previous[1:] + gap_penalty)
+        # A gap in seq1 extends the cell to the left: row[j] = max over k <= j of row[k] + gap_penalty * (j - k).
+        row[:] = np.maximum.accumulate(row - gap_steps) + gap_steps
 
     # Return the final score matrix.
     return score_matrix
 
+# Find the columns of the score matrix that each row may use when aligning in a band: the played
+# notes that start within band_seconds of when the ideal note is expected to be played. The
+# played notes are expected to follow the ideal notes at one steady tempo, fitted to the span of
+# both arrays. Returns the first and last column of every row (both inclusive).
+def get_alignment_band(ideal, actual, band_seconds):
+    ideal_fields, actual_fields = note_fields(ideal), note_fields(actual)
+    ideal_start, actual_start = ideal_fields[:, 2], actual_fields[:, 2]
+    ideal_span = ideal_fields[:, 3].max() - ideal_start.min()
+    actual_span = actual_fields[:, 3].max() - actual_start.min()
+    scale = actual_span / ideal_span if ideal_span > 0 else 1
+    expected_start = (ideal_start - ideal_start.min()) * scale + actual_start.min()
+
+    # Row i aligns ideal note i - 1, column j comes after played note j - 1
+    first = np.zeros(len(ideal) + 1, dtype=int)
+    last = np.zeros(len(ideal) + 1, dtype=int)
+    first[1:] = np.searchsorted(actual_start, expected_start - band_seconds, side="left")
+    last[1:] = np.searchsorted(actual_start, expected_start + band_seconds, side="right")
+    last[0] = last[1]
+    last[-1] = len(actual)
+
+    # Keep the band monotone and connected, so a path from the first to the last cell exists
+    first = np.maximum.accumulate(first)
+    last = np.maximum.accumulate(last)
+    first[1:] = np.minimum(first[1:], last[:-1])
+    last = np.maximum(last, first)
+
+    return first, last
+
+# Needleman-Wunsch limited to a band of columns in every row (see get_alignment_band). Only the
+# band is stored: row i of the returned matrix holds columns first[i] .. first[i] + width - 1 and
+# cells outside the band score BAND_OUTSIDE_SCORE. Also returns the match or mismatch score of the
+# pair of notes of every cell in the band, from row 1 on.
+def banded_needleman_wunsch(seq1, seq2, first, last, gap_penalty=GAP_PENALTY, mismatch_penalty=MISMATCH_PENALTY,
+                            match_score=MATCH_SCORE):
+    len1 = len(seq1)
+    width = int((last - first).max()) + 1
+    columns = first[:, None] + np.arange(width)
+    inside = columns <= last[:, None]
+    gap_steps = gap_penalty * columns
+
+    # Score for a match or a mismatch of every pair of notes in the band
+    ideal, actual = note_fields(seq1), note_fields(seq2)
+    matched = notes_match(ideal[:, None], actual[np.clip(columns[1:] - 1, 0, len(seq2) - 1)])
+    pair_scores = np.where(matched & (columns[1:] > 0), match_score, mismatch_penalty)
+
+    score_band = np.full((len1 + 1, width), BAND_OUTSIDE_SCORE, dtype=np.int64)
+    score_band[0] = np.where(inside[0], gap_steps[0], BAND_OUTSIDE_SCORE)
+
+    # The previous row, padded so that columns j - 1 and j of any row are plain slices of it
+    padded = np.full(2 * width + 1, BAND_OUTSIDE_SCORE, dtype=np.int64)
+    for i in range(1, len1 + 1):
+        padded[1:width + 1] = score_band[i - 1]
+        shift = first[i] - first[i - 1]
+        above_left, above = padded[shift:shift + width], padded[shift + 1:shift + width + 1]
+
+        # Match or mismatch, and a gap in seq2
+        row = np.maximum(above_left + pair_scores[i - 1], above + gap_penalty)
+        if first[i] == 0:
+            row[0] = gap_penalty * i
+        # Gaps in seq1, as in needleman_wunsch
+        row = np.maximum.accumulate(row - gap_steps[i]) + gap_steps[i]
+        score_band[i] = np.where(inside[i], row, BAND_OUTSIDE_SCORE)
+
+    return score_band, pair_scores
+
+# Align two arrays of notes within a band around the expected time correspondence. When the best
+# path runs along the edge of the band, notes outside it could have scored better, so the band is
+# doubled and the alignment redone until the path stays inside or the band covers everything.
+# Like every alignment below, returns the index of the ideal and the played note of every aligned
+# pair, in order, with -1 for gaps (see aligned_notes).
+def banded_alignment(ideal_array, actual_array, band_seconds=ALIGNMENT_BAND_SECONDS,
+                     gap_penalty=GAP_PENALTY, mismatch_penalty=MISMATCH_PENALTY, match_score=MATCH_SCORE):
+    ideal_len, actual_len = len(ideal_array), len(actual_array)
+    while True:
+        first, last = get_alignment_band(ideal_array, actual_array, band_seconds)
+        score_band, pair_scores = banded_needleman_wunsch(ideal_array, actual_array, first, last,
+                                             gap_penalty, mismatch_penalty, match_score)
+
+        def score(i, j):
+            if first[i] <= j <= last[i]:
+                return score_band[i, j - first[i]]
+            return BAND_OUTSIDE_SCORE
+
+        # Traceback, following the step each cell's score came from (match first, then a
+        # gap in seq2, then a gap in seq1)
+        i, j = ideal_len, actual_len
+        ideal_indices = []
+        actual_indices = []
+        on_edge = False
+        while i > 0 or j > 0:
+            on_edge = on_edge or (j == first[i] and j > 0) or (j == last[i] and j < actual_len)
+            current = score(i, j)
+            if i > 0 and j > 0:
+                pair_score = pair_scores[i - 1, j - first[i]]
+            if i > 0 and j > 0 and current == score(i - 1, j - 1) + pair_score:
+                i -= 1
+                j -= 1
+                ideal_indices.append(i)
+                actual_indices.append(j)
+            elif i > 0 and current == score(i - 1, j) + gap_penalty:
+                i -= 1
+                ideal_indices.append(i)
+                actual_indices.append(-1)
+            else:
+                j -= 1
+                ideal_indices.append(-1)
+                actual_indices.append(j)
+
+        full_band = (first == 0).all() and (last == actual_len).all()
+        if not on_edge or full_band:
+            return np.array(ideal_indices[::-1], dtype=int), np.array(actual_indices[::-1], dtype=int)
+        band_seconds *= 2
+
+# Compute one row of Needleman-Wunsch scores over columns first .. first + len(previous) - 1, from
+# the row above it and, when first > 0, the scores of column first - 1 in both rows. Also returns
+# which step every cell's score came from (STEP_MATCH, STEP_DELETE or STEP_INSERT), with the same
+# preference as the banded traceback.
+def needleman_wunsch_row(ideal, actual, i, first, previous, left_above, left,
+                         gap_penalty=GAP_PENALTY, mismatch_penalty=MISMATCH_PENALTY, match_score=MATCH_SCORE):
+    columns = first + np.arange(previous.size)
+    above_left = np.empty_like(previous)
+    above_left[1:] = previous[:-1]
+    above_left[0] = left_above if first > 0 else BAND_OUTSIDE_SCORE
+    matched = notes_match(ideal[i - 1], actual[np.maximum(columns - 1, 0)])
+    match = above_left + np.where(matched, match_score, mismatch_penalty)
+    delete = previous + gap_penalty
+
+    row = np.maximum(match, delete)
+    if first > 0:
+        row[0] = max(row[0], left + gap_penalty)
+    gap_steps = gap_penalty * columns
+    row = np.maximum.accumulate(row - gap_steps) + gap_steps
+
+    steps = np.where(row == match, STEP_MATCH, np.where(row == delete, STEP_DELETE, STEP_INSERT))
+    return row, steps
+
+# Hirschberg's divide and conquer alignment of the region of the score matrix between rows
+# top_row .. bottom_row and columns first .. last. Given the scores of the region's top row
+# (top) and of the column left of it (left, one per row, None when first is 0), traces back
+# from the bottom right cell until the path first reaches the top row. Returns the steps taken,
+# last first, as (ideal index, actual index) pairs with None for gaps, and the column the path
+# reaches the top row at. Only the region's borders are kept, so memory is linear.
+def _hirschberg(ideal, actual, top_row, bottom_row, first, last, top, left, penalties):
+    width = last - first + 1
+    if (bottom_row - top_row + 1) * width <= HIRSCHBERG_BLOCK_CELLS or bottom_row - top_row < 2:
+        # Small enough to keep every row and trace back directly
+        rows, steps = [top], [None]
+        for i in range(top_row + 1, bottom_row + 1):
+            left_above, left_here = (left[i - top_row - 1], left[i - top_row]) if first > 0 else (None, None)
+            row, row_steps = needleman_wunsch_row(ideal, actual, i, first, rows[-1], left_above, left_here, *penalties)
+            rows.append(row)
+            steps.append(row_steps)
+
+        path = []
+        i, j = bottom_row, last
+        while i > top_row:
+            step = steps[i - top_row][j - first]
+            if step == STEP_MATCH:
+                path.append((i - 1, j - 1))
+                i, j = i - 1, j - 1
+            elif step == STEP_DELETE:
+                path.append((i - 1, None))
+                i -= 1
+            else:
+                path.append((None, j - 1))
+                j -= 1
+        return path, j
+
+    # Scores of the middle row
+    middle_row = (top_row + bottom_row) // 2
+    row = top
+    for i in range(top_row + 1, middle_row + 1):
+        left_above, left_here = (left[i - top_row - 1], left[i - top_row]) if first > 0 else (None, None)
+        row, _ = needleman_wunsch_row(ideal, actual, i, first, row, left_above, left_here, *penalties)
+    middle = row
+
+    # Below the middle row, follow every cell's steps back to the column where they first reach
+    # the middle row (-1 where they leave the region first)
+    reached = np.arange(first, last + 1)
+    for i in range(middle_row + 1, bottom_row + 1):
+        left_above, left_here = (left[i - top_row - 1], left[i - top_row]) if first > 0 else (None, None)
+        row, steps = needleman_wunsch_row(ideal, actual, i, first, row, left_above, left_here, *penalties)
+        from_above = np.where(steps == STEP_MATCH, np.concatenate(([-1], reached[:-1])), reached)
+        # Insert steps take the value of the nearest cell to their left that isn't an insert
+        source = np.maximum.accumulate(np.where(steps != STEP_INSERT, np.arange(width), -1))
+        reached = np.where(source >= 0, from_above[np.maximum(source, 0)], -1)
+    split = int(reached[-1])
+
+    # Scores of the column left of the split, for the lower half
+    lower_left = None
+    if split > 0:
+        if split > first:
+            lower_left = [middle[split - 1 - first]]
+            row = middle
+            for i in range(middle_row + 1, bottom_row + 1):
+                left_above, left_here = (left[i - top_row - 1], left[i - top_row]) if first > 0 else (None, None)
+                row, _ = needleman_wunsch_row(ideal, actual, i, first, row, left_above, left_here, *penalties)
+                lower_left.append(row[split - 1 - first])
+            lower_left = np.array(lower_left)
+        else:
+            lower_left = left[middle_row - top_row:]
+
+    lower_path, _ = _hirschberg(ideal, actual, middle_row, bottom_row, split, last, middle[split - first:],
+                                lower_left, penalties)
+    upper_left = left[:middle_row - top_row + 1] if first > 0 else None
+    upper_path, reached_top = _hirschberg(ideal, actual, top_row, middle_row, first, split,
+                                          top[:split - first + 1], upper_left, penalties)
+
+    return lower_path + upper_path, reached_top
+
+# Align two arrays of notes with Hirschberg's linear memory version of Needleman-Wunsch. Gives the
+# same alignment as a full score matrix traced back like banded_alignment.
+def hirschberg_alignment(ideal_array, actual_array, gap_penalty=GAP_PENALTY, mismatch_penalty=MISMATCH_PENALTY,
+                         match_score=MATCH_SCORE):
+    ideal, actual = note_fields(ideal_array), note_fields(actual_array)
+    top = gap_penalty * np.arange(len(actual_array) + 1)
+    path, reached_top = _hirschberg(ideal, actual, 0, len(ideal_array), 0, len(actual_array), top, None,
+                                    (gap_penalty, mismatch_penalty, match_score))
+    # Extra notes before the first ideal note
+    path += [(None, j) for j in range(reached_top - 1, -1, -1)]
+
+    path.reverse()
+    ideal_indices = np.array([-1 if i is None else i for i, _ in path], dtype=int)
+    actual_indices = np.array([-1 if j is None else j for _, j in path], dtype=int)
+    return ideal_indices, actual_indices
+
+# Align two arrays of notes with full Needleman-Wunsch. The compiled kernel stores the step every
+# cell's score came from (one byte per cell) and the traceback follows them, so the alignment is
+# the optimal one traced back like banded_alignment. insert_penalty scores extra played notes.
+def full_alignment(ideal_array, actual_array, gap_penalty=GAP_PENALTY, mismatch_penalty=MISMATCH_PENALTY,
+                   match_score=MATCH_SCORE, insert_penalty=INSERT_PENALTY):
+    matches = note_match_matrix(ideal_array, actual_array)
+    _, steps = alignment_kernels.align(matches, match_score, mismatch_penalty, gap_penalty, insert_penalty)
+    return alignment_kernels.traceback(steps, len(ideal_array), len(actual_array))
+
+# Find the pitch intervals between consecutive notes, in semitones (rounded, so played notes a
+# little out of tune still give the intervals of the sheet music).
+def pitch_intervals(notes):
+    semitones = np.round(note_fields(notes)[:, 0] / 100).astype(int)
+    return np.diff(semitones)
+
+# Index the runs of ngram_length pitch intervals: a dict from the intervals of a run to the
+# (increasing) indices of the notes that start it.
+def index_ngrams(intervals, ngram_length):
+    index = {}
+    for i in range(len(intervals) - ngram_length + 1):
+        index.setdefault(intervals[i:i + ngram_length].tobytes(), []).append(i)
+    return index
+
+# Find anchors: pairs of an ideal and a played note that start runs of ngram_length equal pitch
+# intervals. The ideal runs are indexed by their intervals in a dict, and every played run looks
+# up the ideal runs with the same intervals within band_seconds of the expected time
+# correspondence (see get_alignment_band). Runs that are repeated within the band (in either
+# array) are ambiguous and skipped. Every note of a run whose notes are equal (see Note.__eq__)
+# becomes an anchor. Returns the ideal and played index of every anchor.
+def find_anchors(ideal, actual, ngram_length=ANCHOR_NGRAM_LENGTH, band_seconds=ALIGNMENT_BAND_SECONDS):
+    ideal_intervals, actual_intervals = pitch_intervals(ideal), pitch_intervals(actual)
+    index = index_ngrams(ideal_intervals, ngram_length)
+
+    # Ideal notes i that played note j may align with: first[i + 1] <= j + 1 <= last[i + 1]. The
+    # band is monotone, so they are a range of ideal notes
+    first, last = get_alignment_band(ideal, actual, band_seconds)
+    columns = np.arange(1, len(actual) + 1)
+    lowest = np.searchsorted(last[1:], columns, side="left")
+    highest = np.searchsorted(first[1:], columns, side="right")
+
+    candidates = {}
+    for j in range(len(actual_intervals) - ngram_length + 1):
+        starts = index.get(actual_intervals[j:j + ngram_length].tobytes(), [])
+        found = starts[bisect.bisect_left(starts, lowest[j]):bisect.bisect_left(starts, highest[j])]
+        if len(found) == 1:
+            candidates.setdefault(found[0], []).append(j)
+    seeds = [(i, played[0]) for i, played in candidates.items() if len(played) == 1]
+    if not seeds:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+
+    # The ngram_length + 1 notes of every run, without the ones shared by overlapping runs
+    seeds = np.array(seeds)
+    offsets = np.arange(ngram_length + 1)
+    pairs = np.unique(np.stack([(seeds[:, 0, None] + offsets).ravel(),
+                                (seeds[:, 1, None] + offsets).ravel()], axis=1), axis=0)
+    pairs = pairs[notes_match(note_fields(ideal)[pairs[:, 0]], note_fields(actual)[pairs[:, 1]])]
+    return pairs[:, 0], pairs[:, 1]
+
+# Chain anchors into the longest set where both the ideal and the played indices increase, so
+# they can all be part of one alignment (longest increasing subsequence, O(k log k) for k anchors).
+def chain_anchors(ideal_indices, actual_indices):
+    # In played order, and in decreasing ideal order for the same played note, so at most one of
+    # them is chained
+    order = np.lexsort((-ideal_indices, actual_indices))
+    ideal_indices, actual_indices = ideal_indices[order], actual_indices[order]
+
+    tails = [] # ideal index ending the best chain of every length
+    tail_anchors = [] # anchor ending the best chain of every length
+    previous = np.full(len(order), -1)
+    for k, i in enumerate(ideal_indices):
+        length = bisect.bisect_left(tails, i)
+        if length > 0:
+            previous[k] = tail_anchors[length - 1]
+        if length == len(tails):
+            tails.append(i)
+            tail_anchors.append(k)
+        else:
+            tails[length] = i
+            tail_anchors[length] = k
+
+    chain = []
+    k = tail_anchors[-1] if tail_anchors else -1
+    while k >= 0:
+        chain.append(k)
+        k = previous[k]
+    chain.reverse()
+    return ideal_indices[chain], actual_indices[chain]
+
+# Align two arrays of notes by seeding and extending: notes that start the same runs of pitch
+# intervals in both arrays are chained into anchors (see find_anchors and chain_anchors), and only
+# the notes between consecutive anchors are aligned with full_alignment. A performance that is
+# mostly right aligns in about linear time. Anchors are taken as given, so the alignment is not
+# guaranteed to be optimal; stretches without anchors cost as much as full alignment.
+def anchored_alignment(ideal_array, actual_array, ngram_length=ANCHOR_NGRAM_LENGTH,
+                       band_seconds=ALIGNMENT_BAND_SECONDS):
+    anchor_ideal, anchor_actual = chain_anchors(*find_anchors(ideal_array, actual_array, ngram_length,
+                                                              band_seconds))
+
+    ideal_indices = [np.zeros(0, dtype=int)]
+    actual_indices = [np.zeros(0, dtype=int)]
+    i = j = 0
+    for anchor_i, anchor_j in zip(list(anchor_ideal) + [len(ideal_array)], list(anchor_actual) + [len(actual_array)]):
+        if anchor_i > i or anchor_j > j:
+            gap_ideal, gap_actual = full_alignment(ideal_array[i:anchor_i], actual_array[j:anchor_j])
+            ideal_indices.append(np.where(gap_ideal >= 0, gap_ideal + i, -1))
+            actual_indices.append(np.where(gap_actual >= 0, gap_actual + j, -1))
+        if anchor_i < len(ideal_array):
+            ideal_indices.append([anchor_i])
+            actual_indices.append([anchor_j])
+        i, j = anchor_i + 1, anchor_j + 1
+
+    return np.concatenate(ideal_indices).astype(int), np.concatenate(actual_indices).astype(int)
+
+# Find the window of the ideal notes that the played notes match best, for recordings of only a
+# section of the piece. Played runs of ngram_length pitch intervals are looked up in the ideal
+# runs (see index_ngrams), and vote for the diagonal (ideal index - played index) they are on.
+# The recording starts at its own time 0, so the played notes are shifted to the time of the
+# ideal note where the best diagonal starts. Around that diagonal, the played notes are aligned to
+# the ideal notes with skipping ideal notes before and after them free. Only the window around
+# the diagonal is aligned (the whole piece when no run matched), so the cost grows with the
+# recording, not with the piece. Returns the first and last + 1 index of the window, and the
+# seconds to add to the played notes' times to line them up with it (median over aligned notes).
+def find_subsequence(ideal_array, actual_array, ngram_length=ANCHOR_NGRAM_LENGTH, gap_penalty=GAP_PENALTY,
+                     mismatch_penalty=MISMATCH_PENALTY, match_score=MATCH_SCORE, insert_penalty=INSERT_PENALTY):
+    ideal_len, actual_len = len(ideal_array), len(actual_array)
+    ideal, actual = note_fields(ideal_array), note_fields(actual_array)
+    index = index_ngrams(pitch_intervals(ideal_array), ngram_length)
+    actual_intervals = pitch_intervals(actual_array)
+    diagonals = [i - j for j in range(len(actual_intervals) - ngram_length + 1)
+                 for i in index.get(actual_intervals[j:j + ngram_length].tobytes(), ())]
+
+    search_first, search_last = 0, ideal_len
+    shift = 0.0
+    if diagonals:
+        values, counts = np.unique(diagonals, return_counts=True)
+        diagonal = int(values[np.argmax(counts)])
+        first_played = max(0, -diagonal)
+        shift = ideal[diagonal + first_played, 2] - actual[first_played, 2]
+        # Room for missing notes at both ends
+        margin = actual_len // 2 + ngram_length
+        search_first = max(0, diagonal - margin)
+        search_last = min(ideal_len, diagonal + actual_len + margin)
+    actual[:, 2:] += shift
+
+    matches = notes_match(ideal[search_first:search_last, None], actual[None, :])
+    last_column, steps = alignment_kernels.align(matches, match_score, mismatch_penalty, gap_penalty,
+                                                 insert_penalty, True)
+    ideal_indices, actual_indices = alignment_kernels.traceback(steps, int(np.argmax(last_column)), actual_len, True)
+    aligned = (ideal_indices >= 0) & (actual_indices >= 0)
+    if aligned.any():
+        shift += np.median(ideal[search_first + ideal_indices[aligned], 2] - actual[actual_indices[aligned], 2])
+
+    ideal_indices = ideal_indices[ideal_indices >= 0]
+    if ideal_indices.size == 0:
+        return search_first, search_first, shift
+    return search_first + int(ideal_indices[0]), search_first + int(ideal_indices[-1]) + 1, float(shift)
+
+# Align two arrays of notes with dynamic time warping (like the archived old_v3_compare, without
+# its extra step pattern). Pairs of unequal notes cost 1 and equal notes 0. A warping path can pair
+# a note with several notes of the other array; only its diagonal steps are kept as pairs, and the
+# notes it repeats become gaps.
+def dtw_alignment(ideal_array, actual_array):
+    costs = (~note_match_matrix(ideal_array, actual_array)).view(np.uint8)
+    _, steps = alignment_kernels.dtw(costs)
+    return alignment_kernels.traceback(steps, len(ideal_array), len(actual_array))
+
+# Registry of the alignment strategies compare_arrays can use, by name.
+ALIGNERS = {}
+
+# Class decorator that adds an instance of an aligner to the registry under its name.
+def register_aligner(aligner_class):
+    ALIGNERS[aligner_class.name] = aligner_class()
+    return aligner_class
+
+# Get a registered aligner by name. Raises ValueError if no aligner has that name.
+def get_aligner(name):
+    aligner = ALIGNERS.get(name)
+    if aligner is None:
+        raise ValueError(f"Unknown alignment mode: {name}")
+    return aligner
+
+# Get the names of all registered aligners.
+def get_aligner_names():
+    return list(ALIGNERS)
+
+# Base class of the alignment strategies. Subclasses set name and implement _align, which returns
+# the index of the ideal and the played note of every aligned pair, with -1 for gaps. Aligners keep
+# count of the notes they have aligned and the time it took, so their throughput can be compared.
+class Aligner:
+    name = None
+
+    def __init__(self):
+        self.notes_aligned = 0
+        self.seconds_spent = 0.0
+
+    def align(self, ideal_array, actual_array):
+        start = time.perf_counter()
+        aligned = self._align(ideal_array, actual_array)
+        self.seconds_spent += time.perf_counter() - start
+        self.notes_aligned += len(ideal_array) + len(actual_array)
+        return aligned
+
+    # Notes (ideal and played) aligned per second so far (0 before the first call)
+    @property
+    def throughput(self):
+        if self.seconds_spent == 0:
+            return 0.0
+        return self.notes_aligned / self.seconds_spent
+
+    def reset_throughput(self):
+        self.notes_aligned = 0
+        self.seconds_spent = 0.0
+
+    def _align(self, ideal_array, actual_array):
+        raise NotImplementedError
+
+# Needleman-Wunsch over every pair of notes, in linear memory once the score matrix would have
+# HIRSCHBERG_MIN_CELLS cells.
+@register_aligner
+class FullAligner(Aligner):
+    name = "full"
+
+    def _align(self, ideal_array, actual_array):
+        if (len(ideal_array) + 1) * (len(actual_array) + 1) >= HIRSCHBERG_MIN_CELLS:
+            return hirschberg_alignment(ideal_array, actual_array)
+        return full_alignment(ideal_array, actual_array)
+
+# Needleman-Wunsch within ALIGNMENT_BAND_SECONDS of the expected time of every note.
+@register_aligner
+class BandedAligner(Aligner):
+    name = "banded"
+
+    def _align(self, ideal_array, actual_array):
+        return banded_alignment(ideal_array, actual_array)
+
+# Needleman-Wunsch between anchors found from runs of pitch intervals.
+@register_aligner
+class AnchoredAligner(Aligner):
+    name = "anchored"
+
+    def _align(self, ideal_array, actual_array):
+        return anchored_alignment(ideal_array, actual_array)
+
+# Dynamic time warping.
+@register_aligner
+class DTWAligner(Aligner):
+    name = "dtw"
+
+    def _align(self, ideal_array, actual_array):
+        return dtw_alignment(ideal_array, actual_array)
+
 # Compare two arrays of musical notes and calculate the accuracy and differences between them.
-def compare_arrays(ideal_array, actual_array):
-    
+# The notes can be NoteArrays or lists of Note objects. mode picks the aligner by name (see
+# get_aligner_names; defaults to ALIGNMENT_MODE). The aligned pairs are scored all at once, and
+# Note objects are only made for the notes that differ.
+def compare_arrays(ideal_array, actual_array, mode=None):
+
     # If either array is empty, return None for all metrics.
-    if not ideal_array or not actual_array:
+    if len(ideal_array) == 0 or len(actual_array) == 0:
         return None, None, None, [Difference(None, None, None, None, "error")]
 
-    # Use the Needleman-Wunsch algorithm to find the optimal alignment of the two arrays
-    score_matrix = needleman_wunsch(ideal_array, actual_array)
-    # save_score_matrix_to_csv(score_matrix, ideal_array, actual_array, 'score_matrix.csv') # DEBUGGING
-    ideal_len, actual_len = len(ideal_array), len(actual_array)
-
-    # Traceback through the score matrix to determine the optimal alignment
-    i, j = ideal_len, actual_len
-    aligned_ideal = []
-    aligned_actual = []
-
-    while i > 0 or j > 0:
-        match = score_matrix[i - 1, j - 1]
-        delete = score_matrix[i - 1, j]
-        insert = score_matrix[i, j - 1]
-
-        if match >= delete and match >= insert:
-            aligned_ideal.append(ideal_array[i - 1])
-            aligned_actual.append(actual_array[j - 1])
-            i -= 1
-            j -= 1
-        elif delete >= insert:
-            aligned_ideal.append(ideal_array[i - 1])
-            aligned_actual.append(None)
-            i -= 1
-        else:
-            aligned_ideal.append(None)
-            aligned_actual.append(actual_array[j - 1])
-            j -= 1
-
-    # Reverse the aligned arrays to get the correct order.
-    aligned_ideal.reverse()
-    aligned_actual.reverse()
+    if not isinstance(ideal_array, NoteArray):
+        ideal_array = NoteArray.from_notes(ideal_array)
+    if not isinstance(actual_array, NoteArray):
+        actual_array = NoteArray.from_notes(actual_array)
+    ideal_indices, actual_indices = get_aligner(mode or ALIGNMENT_MODE).align(ideal_array, actual_array)
 
     # export aligned arrays (used for DEBUGGING)
-    # save_aligned_arrays_to_json(aligned_ideal, aligned_actual, 'aligned_arrays.json')
-
-    # Calculate the accuracy values
-    matches_notes = matches_dynamics = matches_start_stop = 0
+    # save_aligned_arrays_to_json(*aligned_notes(ideal_array, actual_array, ideal_indices, actual_indices), 'aligned_arrays.json')
+
+    # Confidences of the aligned pairs, as in Note.get_*_eq_confidence
+    paired = (ideal_indices >= 0) & (actual_indices >= 0)
+    ideal, actual = ideal_array[ideal_indices[paired]], actual_array[actual_indices[paired]]
+    pitch_ok = np.maximum(0, 1 - np.abs(ideal.cents - actual.cents) / PITCH_TOLERANCE) >= PITCH_PASS_CONF
+    velocity_ok = np.maximum(0, 1 - np.abs(ideal.velocity - actual.velocity) / VELOCITY_TOLERANCE) >= VELOCITY_PASS_CONF
+    start_ok = np.maximum(0, 1 - np.abs(ideal.start - actual.start) / START_TOLERANCE) >= START_PASS_CONF
+    # (the start check also compares the starts against the end tolerance)
+    start_stop_ok = start_ok & (np.maximum(0, 1 - np.abs(ideal.start - actual.start) / END_TOLERANCE) >= END_PASS_CONF)
+    end_ok = np.maximum(0, 1 - np.abs(ideal.end - actual.end) / END_TOLERANCE) >= END_PASS_CONF
+
+    # Extra note penalties, as in Note.get_extra_note_penalty
+    extra = actual_array[actual_indices[ideal_indices < 0]]
+    duration = extra.end - extra.start
+    penalties = np.where(duration >= EXTRA_NOTE_MAX_PENALTY_DURATION, EXTRA_NOTE_MAX_PENALTY,
+                         duration / EXTRA_NOTE_MAX_PENALTY_DURATION * EXTRA_NOTE_MAX_PENALTY)
+    total_extra_note_penalty = sum(penalties.tolist())
+
+    # Differences in alignment order. Every step of the alignment counts as a played note, and
+    # only pairs count as ideal notes
+    pair_position = np.cumsum(paired) - 1
+    differs = ~paired
+    differs[paired] = ~(pitch_ok & velocity_ok & start_stop_ok)
     differences = []
-    total_extra_note_penalty = 0
-    
-    ideal_index = 0
-    actual_index = 0
-
-    for i, (ideal_note, actual_note) in enumerate(zip(aligned_ideal, aligned_actual)):
-        if ideal_note is not None and actual_note is not None:
-            if (Note.get_pitch_eq_confidence(ideal_note.pitch, actual_note.pitch)) >= PITCH_PASS_CONF:
-                matches_notes += 1
-            else:
+    for step in np.flatnonzero(differs):
+        ideal_index, actual_index = int(pair_position[step] + 1), int(step)
+        i, j = ideal_indices[step], actual_indices[step]
+        if i < 0:
+            differences.append(Difference(None, None, actual_index, actual_array[j], 'extra'))
+        elif j < 0:
+            differences.append(Difference(ideal_index, ideal_array[i], None, None, 'missing'))
+        else:
+            pair = pair_position[step]
+            ideal_note, actual_note = ideal_array[i], actual_array[j]
+            ideal_index -= 1
+            if not pitch_ok[pair]:
                 differences.append(Difference(ideal_index, ideal_note, actual_index, actual_note, 'pitch'))
-            if Note.get_velocity_eq_confidence(ideal_note.velocity, actual_note.velocity) >= VELOCITY_PASS_CONF:
-                matches_dynamics += 1
-            else:
+            if not velocity_ok[pair]:
                 differences.append(Difference(ideal_index, ideal_note, actual_index, actual_note, 'velocity'))
-            if (Note.get_start_eq_confidence(ideal_note.start, actual_note.start) >= START_PASS_CONF and Note.get_end_eq_confidence(ideal_note.start, actual_note.start) >= END_PASS_CONF):
-                matches_start_stop += 1
-            else:
-                if (Note.get_start_eq_confidence(ideal_note.start, actual_note.start) < START_PASS_CONF):
+            if not start_stop_ok[pair]:
+                if not start_ok[pair]:
                     differences.append(Difference(ideal_index, ideal_note, actual_index, actual_note, 'start'))
-                if (Note.get_end_eq_confidence(ideal_note.end, actual_note.end) < END_PASS_CONF):
+                if not end_ok[pair]:
                     differences.append(Difference(ideal_index, ideal_note, actual_index, actual_note, 'end'))
-            ideal_index = ideal_index + 1
-            actual_index = actual_index + 1
-        elif ideal_note is None and actual_note is not None: # extra note
-            differences.append(Difference(None, None, actual_index, actual_note, 'extra'))
-            total_extra_note_penalty = total_extra_note_penalty + Note.get_extra_note_penalty(actual_note)
-            actual_index = actual_index + 1
-        elif ideal_note is not None and actual_note is None: # missing note
-            differences.append(Difference(ideal_index, ideal_note, None, None, 'missing'))
-            actual_index = actual_index + 1
-
-    ideal_len_aligned = sum(note is not None for note in aligned_ideal)
-    accuracy_notes = max(0, (round((matches_notes / ideal_len_aligned) * 100, 2) - total_extra_note_penalty)) / 100
-    accuracy_dynamics = round((matches_dynamics / ideal_len_aligned) * 100, 2) / 100
-    accuracy_start_stop = round((matches_start_stop / ideal_len_aligned) * 100, 2) / 100
+
+    ideal_len_aligned = int(np.count_nonzero(ideal_indices >= 0))
+    accuracy_notes = max(0, (round((int(pitch_ok.sum()) / ideal_len_aligned) * 100, 2) - total_extra_note_penalty)) / 100
+    accuracy_dynamics = round((int(velocity_ok.sum()) / ideal_len_aligned) * 100, 2) / 100
+    accuracy_start_stop = round((int(start_stop_ok.sum()) / ideal_len_aligned) * 100, 2) / 100
 
     return accuracy_notes, accuracy_dynamics, accuracy_start_stop, differences
 
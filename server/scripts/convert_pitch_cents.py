@@ -0,0 +1,83 @@
+"""Convert Pitch Cents
+
+This module adds the pitch in MIDI cents to the notes of JSON files written
+before notes stored it: the notes of sheet music (master.json), of
+recordings (*_rec.json) and of the differences between them (*_diff.json).
+Every note dict with a pitch in Hz and no "cents" gets one, right after its
+"pitch". Files that are already converted are left as they are.
+
+Run from the server directory:
+    python -m scripts.convert_pitch_cents [file or directory ...]
+(with no arguments, every JSON file under config.JSON_DIR is converted)
+"""
+import glob
+import json
+import os
+import sys
+
+from .objects import hz_to_cents
+from config import JSON_DIR
+
+def add_cents(data) -> int:
+    """Adds "cents" to every note dict in the data, in place.
+
+    Args:
+        data: The loaded JSON data (dicts and lists, nested in any way)
+
+    Returns:
+        int: The number of notes converted
+    """
+
+    converted = 0
+    if isinstance(data, list):
+        for item in data:
+            converted += add_cents(item)
+    elif isinstance(data, dict):
+        for value in data.values():
+            converted += add_cents(value)
+        pitch = data.get("pitch")
+        if "cents" not in data and isinstance(pitch, (int, float)) and not isinstance(pitch, bool) and pitch > 0:
+            items = list(data.items())
+            data.clear()
+            for key, value in items:
+                data[key] = value
+                if key == "pitch":
+                    data["cents"] = float(hz_to_cents(pitch))
+            converted += 1
+
+    return converted
+
+def convert_file(path: str) -> int:
+    """Adds "cents" to the notes of a JSON file, rewriting it if any changed.
+
+    Args:
+        path (str): The path of the JSON file
+
+    Returns:
+        int: The number of notes converted
+    """
+
+    with open(path) as json_file:
+        data = json.load(json_file)
+    converted = add_cents(data)
+    if converted:
+        with open(path, 'w') as json_file:
+            json.dump(data, json_file, indent=4)
+
+    return converted
+
+def main():
+    paths = []
+    for path in sys.argv[1:] or [JSON_DIR]:
+        if os.path.isdir(path):
+            paths += sorted(glob.glob(os.path.join(path, "**", "*.json"), recursive=True))
+        else:
+            paths.append(path)
+
+    for path in paths:
+        converted = convert_file(path)
+        if converted:
+            print(f"{path}: {converted} notes")
+
+if __name__ == "__main__":
+    main()
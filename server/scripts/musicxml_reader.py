@@ -1,7 +1,9 @@
 import json
 # import pygame
+import numpy as np
 import pretty_midi
-from music21 import converter, pitch, tempo, note as m21note
+from music21 import converter, tempo, note as m21note
+from .objects import NoteArray
 # from music21 import environment
 # from mido import MidiFile
 
@@ -71,18 +73,16 @@ class MusicXMLReader:
             return 120
 
     def get_notes(self, part_index=0):
-        # Get a list of notes for the specified instrument
-        notes_list = []
+        # Get the notes for the specified instrument as a NoteArray
         notes = self.pretty_midi.instruments[part_index].notes
-        for note in notes:
-            notes_list.append({
-                "pitch": pitch.Pitch(midi=note.pitch).frequency * # use nameWithOctave for A4
-                    (SEMITONE_RATIO**FREQUENCY_OFFSETS.get(self.instrument)), # apply instrument pitch offset
-                "velocity": note.velocity,
-                "start": note.start,
-                "end": note.end
-            })
-        return notes_list
+        midi = np.array([note.pitch for note in notes], dtype=float)
+        # Pitch in MIDI cents, with the instrument pitch offset applied (the Hz are derived from it)
+        cents = 100*midi + 1200*np.log2(SEMITONE_RATIO)*FREQUENCY_OFFSETS.get(self.instrument)
+        return NoteArray(None,
+                         [note.velocity for note in notes],
+                         [note.start for note in notes],
+                         [note.end for note in notes],
+                         cents)
     
     def get_notes_and_measure_num(self, part_index=0):
         # Get a list of notes and rests for the specified instrument
@@ -121,8 +121,9 @@ class MusicXMLReader:
         return elements_list
 
 
-    def save_notes_json(self, json_file_out, part_index=0):
+    def save_notes_json(self, json_file_out, part_index=0, pitch_estimator=None):
         # Save note data as a JSON file and return the JSON data as a string
+        # (pitch_estimator optionally picks the backend used to analyze recordings)
         notes = self.get_notes(part_index)
         tempo = self.get_tempo()
         downbeat_locations = self.pretty_midi.get_downbeats().tolist()
@@ -130,8 +131,10 @@ class MusicXMLReader:
             "size": len(notes),
             "tempo": tempo,
             "downbeat_locations": downbeat_locations,
-            "notes": notes,
+            "notes": notes.to_dicts(),
         }
+        if pitch_estimator:
+            data["pitch_estimator"] = pitch_estimator
 
         with open(json_file_out, 'w') as outfile:
             json.dump(data, outfile, indent=4)  # Indent the JSON output for better readability
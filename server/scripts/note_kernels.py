@@ -0,0 +1,191 @@
+"""Note Kernels
+
+This module contains numba-compiled versions of the note extraction hot loops
+in signal processing: grouping frames into notes, the two merge passes, and
+converting amplitudes to MIDI velocities.
+
+The kernels walk the frames and notes once in plain loops, the way the
+original note extraction did, and give the same results as the NumPy
+versions in signal_processing bit for bit. Means are taken with the same
+pairwise summation NumPy uses for that reason.
+
+Compiled kernels are cached on disk (next to this module, or in the user's
+cache directory when that isn't writable), so only the first server start
+pays for compilation. Set config.COMPILED_NOTE_KERNELS to False to use the
+NumPy versions instead, or set NUMBA_DISABLE_JIT=1 to run these kernels as
+plain Python under a debugger.
+"""
+import numba
+import numpy as np
+from .objects import A4
+
+PAIRWISE_BLOCK_SIZE = 128 # Largest block NumPy sums without splitting (PW_BLOCKSIZE).
+STACK_SIZE = 192 # Pending runs of a pairwise sum (3 per halving, enough for any array).
+
+@numba.njit(cache=True)
+def block_sum(values: np.array, first: int, count: int) -> float:
+    """Sums at most PAIRWISE_BLOCK_SIZE values the way NumPy does: with eight
+    interleaved partial sums once there are at least eight values.
+    """
+
+    if count < 8:
+        total = 0.0
+        for i in range(count):
+            total += values[first + i]
+        return total
+
+    partial = np.empty(8)
+    for j in range(8):
+        partial[j] = values[first + j]
+    i = 8
+    while i < count - count % 8:
+        for j in range(8):
+            partial[j] += values[first + i + j]
+        i += 8
+    total = ((partial[0] + partial[1]) + (partial[2] + partial[3])) + \
+            ((partial[4] + partial[5]) + (partial[6] + partial[7]))
+    while i < count:
+        total += values[first + i]
+        i += 1
+    return total
+
+@numba.njit(cache=True)
+def pairwise_sum(values: np.array, first: int, count: int) -> float:
+    """Sums values[first:first + count] the way NumPy's add.reduce does on
+    contiguous doubles, so means match np.average bit for bit.
+
+    NumPy halves longer runs (at multiples of eight) until they fit in a
+    block. The halving is walked with an explicit stack, since numba can't
+    load recursive functions back from its cache.
+    """
+
+    # Pending runs, and whether their halves have been summed
+    firsts = np.empty(STACK_SIZE, dtype=np.int64)
+    counts = np.empty(STACK_SIZE, dtype=np.int64)
+    halved = np.empty(STACK_SIZE, dtype=np.bool_)
+    totals = np.empty(STACK_SIZE)
+    firsts[0], counts[0], halved[0] = first, count, False
+    runs, summed = 1, 0
+    while runs > 0:
+        runs -= 1
+        first, count = firsts[runs], counts[runs]
+        if count <= PAIRWISE_BLOCK_SIZE:
+            totals[summed] = block_sum(values, first, count)
+            summed += 1
+        elif halved[runs]:
+            summed -= 1
+            totals[summed - 1] += totals[summed]
+        else:
+            half = count//2
+            half -= half % 8
+            # Revisit this run once both halves are summed, first half first
+            halved[runs] = True
+            firsts[runs + 1], counts[runs + 1], halved[runs + 1] = first + half, count - half, False
+            firsts[runs + 2], counts[runs + 2], halved[runs + 2] = first, half, False
+            runs += 3
+
+    return totals[0]
+
+@numba.njit(cache=True)
+def segment_frames(f0: np.array, times: np.array, amplitudes: np.array, max_cents: float):
+    """Groups YIN frames into raw notes. Same result as
+    signal_processing.segment_frames.
+
+    Args:
+        f0 (np.array): The array of fundamental frequencies
+        times (np.array): The array of timestamps
+        amplitudes (np.array): The array of MIDI velocities
+        max_cents (float): The max cents difference within a note
+
+    Returns:
+        Tuple[np.array, np.array, np.array, np.array]: The arrays for note
+            pitch, velocity, start and end
+    """
+
+    n = f0.size
+    pitch = np.empty(n)
+    velocity = np.empty(n, dtype=amplitudes.dtype)
+    start = np.empty(n)
+    end = np.empty(n)
+    frequencies = np.empty(n + 1)
+    m = 0
+
+    i = 1
+    while i < n:
+        if abs(1200*np.log2(f0[i]/f0[i - 1])) <= max_cents:
+            # A note starts on the previous frame, at its rounded pitch
+            reference = A4*2**(np.round(12*np.log2(f0[i - 1]/A4))/12.0)
+            frequencies[0] = reference
+            count = 1
+            loudest = amplitudes[i - 1]
+            start[m] = times[i - 1]
+            end[m] = times[i]
+            while i < n and abs(1200*np.log2(f0[i]/reference)) <= max_cents:
+                end[m] = times[i]
+                frequencies[count] = f0[i]
+                count += 1
+                loudest = max(loudest, amplitudes[i])
+                i += 1
+            pitch[m] = pairwise_sum(frequencies, 0, count)/count
+            velocity[m] = loudest
+            m += 1
+
+        # (Frames that never form a note are assumed to be errors and skipped)
+        i += 1
+
+    return pitch[:m], velocity[:m], start[:m], end[:m]
+
+@numba.njit(cache=True)
+def merge_close_notes(pitch: np.array, velocity: np.array, start: np.array, end: np.array,
+                      max_gap: float):
+    """Merges notes into the note before them when they are within 10 cents
+    of it and start no more than max_gap seconds after it ends. Same result
+    as signal_processing.merge_close_notes.
+    """
+
+    kept = np.empty(pitch.size, dtype=np.int64)
+    end = end.copy()
+    m = 0
+    for i in range(pitch.size):
+        if m > 0:
+            last = kept[m - 1]
+            if abs(1200*np.log2(pitch[i]/pitch[last])) <= 10 and start[i] - end[last] <= max_gap:
+                end[last] = end[i]
+                continue
+        kept[m] = i
+        m += 1
+
+    kept = kept[:m]
+    return pitch[kept], velocity[kept], start[kept], end[kept]
+
+@numba.njit(cache=True)
+def merge_trailing_notes(pitch: np.array, velocity: np.array, start: np.array, end: np.array):
+    """Merges a note into the previous one when they are within 10 cents and
+    the previous one is MUCH louder. Same result as
+    signal_processing.merge_trailing_notes.
+    """
+
+    keep = np.ones(pitch.size, dtype=np.bool_)
+    end = end.copy()
+    for i in range(1, pitch.size):
+        # A merged note can't absorb the next one
+        if (keep[i - 1] and abs(1200*np.log2(pitch[i]/pitch[i - 1])) <= 10 and
+                velocity[i - 1] - velocity[i] >= 30):
+            end[i - 1] = end[i]
+            keep[i] = False
+
+    return pitch[keep], velocity[keep], start[keep], end[keep]
+
+@numba.njit(cache=True)
+def amplitude_to_midi_velocity(amplitude: np.array, mf_rms: float) -> np.array:
+    """Converts raw amplitude values to velocity values. Same result as
+    signal_processing.amplitude_to_midi_velocity, as an array.
+    """
+
+    levels = np.log10(amplitude)
+    lower = np.min(levels)
+    velocity = np.empty(levels.size, dtype=np.int64)
+    for i in range(levels.size):
+        velocity[i] = int(np.round((levels[i] - lower)/(mf_rms - lower)*80 + 1))
+
+    return velocity
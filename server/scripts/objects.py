@@ -50,9 +50,21 @@ class Difference:
 
 
 A4 = 440.0
+A4_CENTS = 6900.0 # A4 in MIDI cents (MIDI pitch 69, 100 cents per semitone)
+
+# Convert frequencies (Hz) to fractional MIDI cents, and back. Both take floats or arrays.
+def hz_to_cents(freq):
+    return 1200 * np.log2(np.divide(freq, A4)) + A4_CENTS
+
+def cents_to_hz(cents):
+    return A4 * 2**((np.subtract(cents, A4_CENTS)) / 1200)
+
+# A note's pitch is kept in Hz (for display) and in MIDI cents, where the distance between two
+# pitches is a subtraction. The cents are derived from the Hz when not given.
 class Note:
-    def __init__(self, pitch, velocity, start, end):
+    def __init__(self, pitch, velocity, start, end, cents=None):
         self.pitch = pitch
+        self.cents = float(hz_to_cents(pitch)) if cents is None else cents
         self.velocity = velocity
         self.start = start
         self.end = end
@@ -69,7 +81,7 @@ class Note:
             return False
 
         # Calculate the confidence for each factor
-        pitch_confidence = Note.get_pitch_eq_confidence(self.pitch, other.pitch)
+        pitch_confidence = Note.get_cents_eq_confidence(self.cents, other.cents)
         start_confidence = Note.get_end_eq_confidence(self.start, other.start)
         end_confidence = Note.get_end_eq_confidence(self.end, other.end)
         velocity_confidence = Note.get_velocity_eq_confidence(self.velocity, other.velocity)
@@ -98,6 +110,10 @@ class Note:
     def get_pitch_eq_confidence(freq1: float, freq2: float, tolerance=PITCH_TOLERANCE) -> float:
         return max(0, 1 - (abs(1200 * np.log2(freq1 / freq2)) / tolerance))
     
+    @staticmethod
+    def get_cents_eq_confidence(cents1: float, cents2: float, tolerance=PITCH_TOLERANCE) -> float:
+        return max(0, 1 - (abs(cents1 - cents2) / tolerance))
+    
     @staticmethod
     def get_velocity_eq_confidence(vel1: float, vel2: float, tolerance=VELOCITY_TOLERANCE):
         return max(0, 1 - abs(vel1 - vel2) / tolerance)
@@ -133,6 +149,7 @@ class Note:
     def to_dict(self):
         return {
             "pitch": self.pitch,
+            "cents": self.cents,
             "velocity": self.velocity,
             "start": self.start,
             "end": self.end
@@ -143,4 +160,63 @@ class Note:
         return f"Note: {self.pitch}, Velocity: {self.velocity}, Start Time: {self.start}, End Time: {self.end}"
     
     def __repr__(self):
-        return f"{self.pitch:.2f} Hz, {self.velocity} m/s, {self.start:.2f}-{self.end:.2f} s"
\ No newline at end of file
+        return f"{self.pitch:.2f} Hz, {self.velocity} m/s, {self.start:.2f}-{self.end:.2f} s"
+
+# Notes stored as a struct of arrays: pitch (Hz and MIDI cents), velocity (MIDI), start and end (s),
+# one entry per note. Slices are views of the same arrays (no copy), and Note objects are only made
+# when a single note is taken out, e.g. to write it to JSON. Either pitch may be None, and is then
+# derived from the other.
+class NoteArray:
+    def __init__(self, pitch, velocity, start, end, cents=None):
+        if pitch is None:
+            pitch = cents_to_hz(cents)
+        self.pitch = np.asarray(pitch, dtype=np.float64)
+        self.cents = np.asarray(hz_to_cents(self.pitch) if cents is None else cents, dtype=np.float64)
+        self.velocity = np.asarray(velocity, dtype=np.int64)
+        self.start = np.asarray(start, dtype=np.float64)
+        self.end = np.asarray(end, dtype=np.float64)
+
+    # Build a NoteArray from a list of Note objects.
+    @classmethod
+    def from_notes(cls, notes):
+        return cls([note.pitch for note in notes], [note.velocity for note in notes],
+                   [note.start for note in notes], [note.end for note in notes],
+                   [note.cents for note in notes])
+
+    # Build a NoteArray from a list of note dicts, as stored in the JSON files (files written
+    # before the cents were stored can be converted with scripts.convert_pitch_cents).
+    @classmethod
+    def from_dicts(cls, notes):
+        cents = [note["cents"] for note in notes] if all("cents" in note for note in notes) else None
+        return cls([note["pitch"] for note in notes], [note["velocity"] for note in notes],
+                   [note["start"] for note in notes], [note["end"] for note in notes], cents)
+
+    def __len__(self):
+        return self.pitch.size
+
+    # An integer index gives a Note, a slice a view and an index array a copy.
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return Note(float(self.pitch[index]), int(self.velocity[index]),
+                        float(self.start[index]), float(self.end[index]), float(self.cents[index]))
+        return NoteArray(self.pitch[index], self.velocity[index], self.start[index], self.end[index],
+                         self.cents[index])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    # The pitch (MIDI cents), velocity, start and end of every note, as an (n, 4) float array.
+    @property
+    def fields(self):
+        return np.stack((self.cents, self.velocity, self.start, self.end), axis=1)
+
+    # Convert the notes to a list of dictionaries for JSON serialization.
+    def to_dicts(self):
+        return [{"pitch": pitch, "cents": cents, "velocity": velocity, "start": start, "end": end}
+                for pitch, cents, velocity, start, end in zip(self.pitch.tolist(), self.cents.tolist(),
+                                                              self.velocity.tolist(), self.start.tolist(),
+                                                              self.end.tolist())]
+
+    def __repr__(self):
+        return f"NoteArray({len(self)} notes)"
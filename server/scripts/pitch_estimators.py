@@ -0,0 +1,284 @@
+"""Pitch Estimators
+
+This module contains the pitch estimation backends that signal processing can
+use to get the fundamental frequency of every analysis frame, along with a
+registry to pick one by name.
+
+Every backend takes audio that has already been framed (one frame per column)
+and returns one frequency per frame. Backends keep count of the frames they
+have estimated and the time it took, so their throughput can be compared.
+"""
+import time
+import librosa
+import numpy as np
+import scipy.fft
+from typing import Dict, List
+
+YIN_TROUGH_THRESHOLD = 0.1 # Absolute threshold for picking a period (librosa default)
+
+PITCH_ESTIMATORS: Dict[str, "PitchEstimator"] = {}
+
+def register_pitch_estimator(estimator_class):
+    """Class decorator that adds an instance of a backend to the registry
+    under its name.
+    """
+
+    PITCH_ESTIMATORS[estimator_class.name] = estimator_class()
+    return estimator_class
+
+def get_pitch_estimator(name: str) -> "PitchEstimator":
+    """Gets a registered pitch estimator.
+
+    Args:
+        name (str): The name of the backend
+
+    Returns:
+        PitchEstimator: The backend
+
+    Raises:
+        ValueError: If no backend has that name
+    """
+
+    estimator = PITCH_ESTIMATORS.get(name)
+    if estimator is None:
+        raise ValueError(f"Unknown pitch estimator: {name}")
+    return estimator
+
+def get_pitch_estimator_names() -> List[str]:
+    """Gets the names of all registered pitch estimators.
+
+    Returns:
+        List[str]: The backend names
+    """
+
+    return list(PITCH_ESTIMATORS)
+
+class PitchEstimator:
+    """Base class of the pitch estimation backends. Subclasses set name and
+    implement _estimate.
+    """
+
+    name = None
+
+    def __init__(self):
+        self.frames_estimated = 0
+        self.audio_seconds = 0.0
+        self.seconds_spent = 0.0
+
+    def estimate(self, frames: np.array, sr: int, hop_length: int, win_length: int,
+                 fmin: float, fmax: float) -> np.array:
+        """Estimates the fundamental frequency of every frame.
+
+        Args:
+            frames (np.array): The frames, shaped (frame_length, n_frames),
+                as cut from contiguous audio by librosa.util.frame
+            sr (int): The sample rate of the audio
+            hop_length (int): The number of samples between frames
+            win_length (int): The integration window length in samples
+            fmin (float): The lowest detectable frequency
+            fmax (float): The highest detectable frequency
+
+        Returns:
+            np.array: The fundamental frequency of every frame
+        """
+
+        start = time.perf_counter()
+        f0 = self._estimate(frames, sr, hop_length, win_length, fmin, fmax)
+        self.seconds_spent += time.perf_counter() - start
+        self.frames_estimated += frames.shape[1]
+        self.audio_seconds += frames.shape[1]*hop_length/sr
+        return f0
+
+    @property
+    def throughput(self) -> float:
+        """Frames estimated per second so far (0 before the first call)."""
+
+        if self.seconds_spent == 0:
+            return 0.0
+        return self.frames_estimated/self.seconds_spent
+
+    @property
+    def seconds_per_minute(self) -> float:
+        """Seconds spent per minute of audio so far (0 before the first call)."""
+
+        if self.audio_seconds == 0:
+            return 0.0
+        return 60*self.seconds_spent/self.audio_seconds
+
+    def reset_throughput(self):
+        self.frames_estimated = 0
+        self.audio_seconds = 0.0
+        self.seconds_spent = 0.0
+
+    def _estimate(self, frames, sr, hop_length, win_length, fmin, fmax):
+        raise NotImplementedError
+
+@register_pitch_estimator
+class YinEstimator(PitchEstimator):
+    """YIN on the shared frame buffer. Same result as librosa.yin."""
+
+    name = "yin"
+
+    def _estimate(self, frames, sr, hop_length, win_length, fmin, fmax):
+        return yin_from_frames(frames, sr, win_length, fmin, fmax)
+
+@register_pitch_estimator
+class FastYinEstimator(PitchEstimator):
+    """Single precision YIN that only computes the lags in the fmin-fmax
+    range, using one batched real FFT for the autocorrelation of all frames.
+    """
+
+    name = "fast_yin"
+
+    def _estimate(self, frames, sr, hop_length, win_length, fmin, fmax):
+        return fast_yin_from_frames(frames, sr, win_length, fmin, fmax)
+
+@register_pitch_estimator
+class LibrosaYinEstimator(PitchEstimator):
+    """Reference backend calling librosa.yin."""
+
+    name = "librosa_yin"
+
+    def _estimate(self, frames, sr, hop_length, win_length, fmin, fmax):
+        audio = _frames_to_audio(frames, hop_length)
+        return librosa.yin(audio, sr=sr, fmin=fmin, fmax=fmax, frame_length=frames.shape[0],
+                           win_length=win_length, hop_length=hop_length, center=False)
+
+@register_pitch_estimator
+class LibrosaPyinEstimator(PitchEstimator):
+    """Reference backend calling librosa.pyin. Unvoiced frames get pyin's
+    best guess so the output is shaped like YIN's.
+    """
+
+    name = "librosa_pyin"
+
+    def _estimate(self, frames, sr, hop_length, win_length, fmin, fmax):
+        audio = _frames_to_audio(frames, hop_length)
+        f0, _, _ = librosa.pyin(audio, sr=sr, fmin=fmin, fmax=fmax, frame_length=frames.shape[0],
+                                win_length=win_length, hop_length=hop_length, center=False,
+                                fill_na=None)
+        return f0
+
+def yin_from_frames(frames: np.array, sr: int, win_length: int, fmin: float, fmax: float) -> np.array:
+    """Estimates the fundamental frequency of already framed audio with
+    YIN. Gives the same result as librosa.yin over the same frames.
+
+    Args:
+        frames (np.array): The frames, shaped (frame_length, n_frames)
+        sr (int): The sample rate of the audio
+        win_length (int): The integration window length in samples
+        fmin (float): The lowest detectable frequency
+        fmax (float): The highest detectable frequency
+
+    Returns:
+        np.array: The fundamental frequency of every frame
+    """
+
+    frame_length = frames.shape[0]
+    min_period = max(int(np.floor(sr/fmax)), 1)
+    max_period = min(int(np.ceil(sr/fmin)), frame_length - win_length - 1)
+
+    # Autocorrelation
+    a = np.fft.rfft(frames, frame_length, axis=0)
+    b = np.fft.rfft(frames[win_length:0:-1], frame_length, axis=0)
+    acf = np.fft.irfft(a*b, frame_length, axis=0)[win_length:]
+    acf[np.abs(acf) < 1e-6] = 0
+
+    # Energy terms
+    energy = np.cumsum(frames**2, axis=0)
+    energy = energy[win_length:] - energy[:-win_length]
+    energy[np.abs(energy) < 1e-6] = 0
+
+    # Cumulative mean normalized difference function
+    difference = energy[:1] + energy - 2*acf
+    numerator = difference[min_period:max_period + 1]
+    cumulative_mean = np.cumsum(difference[1:max_period + 1], axis=0)/np.arange(1, max_period + 1)[:, None]
+    denominator = cumulative_mean[min_period - 1:max_period]
+    yin = numerator/(denominator + librosa.util.tiny(denominator))
+
+    return sr/_pick_periods(yin, min_period)
+
+def fast_yin_from_frames(frames: np.array, sr: int, win_length: int, fmin: float, fmax: float) -> np.array:
+    """Estimates the fundamental frequency of already framed audio with
+    YIN in single precision.
+
+    The frames are transposed once so every frame is contiguous and the
+    cross-correlation of each frame with its first win_length samples is
+    computed for all frames with one batched real FFT, just long enough to
+    hold the lags up to the longest period fmin allows.
+
+    Args:
+        frames (np.array): The frames, shaped (frame_length, n_frames)
+        sr (int): The sample rate of the audio
+        win_length (int): The integration window length in samples
+        fmin (float): The lowest detectable frequency
+        fmax (float): The highest detectable frequency
+
+    Returns:
+        np.array: The fundamental frequency of every frame
+    """
+
+    frame_length = frames.shape[0]
+    min_period = max(int(np.floor(sr/fmax)), 1)
+    max_period = min(int(np.ceil(sr/fmin)), frame_length - win_length - 1)
+    # Samples 1 .. win_length + max_period take part in the difference function
+    used = win_length + max_period + 1
+    x = np.ascontiguousarray(frames[:used].T, dtype=np.float32)
+
+    # Autocorrelation for lags 0 .. max_period, without wrap-around
+    n_fft = scipy.fft.next_fast_len(used, real=True)
+    a = scipy.fft.rfft(x, n_fft, axis=1)
+    b = scipy.fft.rfft(x[:, win_length:0:-1], n_fft, axis=1)
+    acf = scipy.fft.irfft(a*b, n_fft, axis=1)[:, win_length:used]
+    acf[np.abs(acf) < 1e-6] = 0
+
+    # Energy terms
+    energy = np.cumsum(x*x, axis=1)
+    energy = energy[:, win_length:used] - energy[:, :used - win_length]
+    energy[np.abs(energy) < 1e-6] = 0
+
+    # Cumulative mean normalized difference function
+    difference = energy[:, :1] + energy - 2*acf
+    cumulative_mean = np.cumsum(difference[:, 1:], axis=1)/np.arange(1, max_period + 1, dtype=np.float32)
+    yin = (difference[:, min_period:]/(cumulative_mean[:, min_period - 1:] + np.finfo(np.float32).tiny)).T
+
+    return (sr/_pick_periods(yin, min_period)).astype(np.float64)
+
+def _pick_periods(yin: np.array, min_period: int) -> np.array:
+    """Picks the smallest lag of every frame with a trough below the
+    threshold, or the global minimum if there is none, and refines it with
+    parabolic interpolation.
+
+    Args:
+        yin (np.array): The normalized difference function, shaped
+            (n_lags, n_frames)
+        min_period (int): The lag of the first row of yin
+
+    Returns:
+        np.array: The fractional period of every frame in samples
+    """
+
+    is_trough = np.empty(yin.shape, dtype=bool)
+    is_trough[0] = yin[0] < yin[1]
+    is_trough[1:-1] = (yin[1:-1] < yin[:-2]) & (yin[1:-1] <= yin[2:])
+    is_trough[-1] = yin[-1] < yin[-2]
+    is_trough &= yin < YIN_TROUGH_THRESHOLD
+    period = np.where(is_trough.any(axis=0), np.argmax(is_trough, axis=0), np.argmin(yin, axis=0))
+
+    # Only the chosen lag is interpolated
+    columns = np.arange(yin.shape[1])
+    inside = (period > 0) & (period < yin.shape[0] - 1)
+    below = yin[np.maximum(period - 1, 0), columns]
+    at = yin[period, columns]
+    above = yin[np.minimum(period + 1, yin.shape[0] - 1), columns]
+    parabola_a = (below + above - 2*at)/2
+    parabola_b = (above - below)/2
+    shift = -parabola_b/(2*parabola_a + librosa.util.tiny(parabola_a))
+    shift[~inside | (np.abs(shift) > 1)] = 0
+
+    return min_period + period + shift
+
+def _frames_to_audio(frames: np.array, hop_length: int) -> np.array:
+    """Rebuilds the contiguous audio that a frame view was cut from."""
+
+    return np.concatenate((frames[:hop_length].T.ravel(), frames[hop_length:, -1]))
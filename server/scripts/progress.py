@@ -0,0 +1,109 @@
+"""Progress
+
+This module reports the progress of an analysis through its stages. The
+analysis calls report as it goes, which passes the stage and how far along
+it is to the reporter of the current thread, if there is one (e.g. a
+Progress, or the analysis pool forwarding to the server process).
+
+A Progress keeps the events of one analysis, with the elapsed time and the
+percent complete, for the jobs API to stream to clients.
+"""
+import threading
+import time
+from itertools import accumulate
+
+# Stages of an analysis, in order, and the share of the analysis each one usually takes (percent)
+STAGES = {
+    "decode": 5,
+    "pitch_tracking": 60,
+    "segmentation": 5,
+    "alignment": 15,
+    "diff_annotation": 5,
+    "persistence": 10,
+}
+
+# Percent of the analysis done when each stage starts
+STAGE_STARTS = dict(zip(STAGES, accumulate(STAGES.values(), initial=0)))
+
+_local = threading.local()
+
+def set_reporter(reporter):
+    """Sets the reporter of the current thread.
+
+    Args:
+        reporter: A function taking the stage and the fraction of it done,
+            or None to stop reporting
+    """
+    _local.reporter = reporter
+
+def get_reporter():
+    """Gets the reporter of the current thread.
+
+    Returns:
+        The reporter, or None
+    """
+    return getattr(_local, "reporter", None)
+
+def report(stage: str, fraction: float=1.0):
+    """Reports how far along a stage of the analysis is, to the reporter of
+    the current thread. A stage reports 0 when it starts and 1 when it ends.
+
+    Args:
+        stage (str): The stage, one of STAGES
+        fraction (float): The fraction of the stage done
+    """
+    reporter = get_reporter()
+    if reporter is not None:
+        reporter(stage, fraction)
+
+class Progress:
+    """The progress events of one analysis. Events are dicts with the stage,
+    the percent of it done, the percent of the whole analysis done and the
+    seconds elapsed since the analysis was queued.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.finished = False
+        self.created = time.perf_counter()
+        self.stage_started = {}
+        self.stage_seconds = {}
+        self.condition = threading.Condition()
+
+    def __call__(self, stage: str, fraction: float=1.0):
+        now = time.perf_counter()
+        with self.condition:
+            self.stage_started.setdefault(stage, now)
+            if fraction >= 1:
+                self.stage_seconds[stage] = round(now - self.stage_started[stage], 3)
+            self.events.append({
+                "stage": stage,
+                "stage_percent": round(100.0*fraction, 1),
+                "percent": round(float(STAGE_STARTS[stage] + STAGES[stage]*fraction), 1),
+                "elapsed": round(now - self.created, 3)
+            })
+            self.condition.notify_all()
+
+    def finish(self):
+        """Marks the analysis as finished, ending the stage still running."""
+        now = time.perf_counter()
+        with self.condition:
+            for stage, started in self.stage_started.items():
+                self.stage_seconds.setdefault(stage, round(now - started, 3))
+            self.finished = True
+            self.condition.notify_all()
+
+    def wait(self, first: int, timeout: float=None):
+        """Waits for events after the first ones already seen.
+
+        Args:
+            first (int): The number of events already seen
+            timeout (float): The seconds to wait at most
+
+        Returns:
+            Tuple[list, bool]: The new events (empty after the timeout), and
+                whether the analysis has finished
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: len(self.events) > first or self.finished, timeout)
+            return self.events[first:], self.finished
@@ -0,0 +1,224 @@
+"""Recording Session
+
+This module contains recording sessions: recordings uploaded chunk by chunk
+while they're being recorded, and pitch tracked as the chunks arrive.
+
+The chunks are written to a float WAV file with the samples as they were
+received, in the thread that receives them. Pitch tracking them runs in the
+recording worker of the analysis pool (see scripts/analysis_pool.py), which
+resamples and analyzes them in blocks of STREAM_BLOCK_DURATION seconds,
+exactly as streaming the finished file would analyze it. When the recording
+ends, only its last block is left to pitch track. The frame-level analysis
+is then stored in the analysis cache under the WAV file, so analyzing the
+file afterwards (with stream=True) only has to find its notes and compare
+them.
+"""
+import logging
+import threading
+import numpy as np
+import soundfile as sf
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+from .analysis_pool import analysis_pool
+from .audio_stream import ResampleStream
+from .signal_processing import (StreamAnalyzer, AnalysisSetup, analysis_cache, get_analysis_params,
+                                STREAM_BLOCK_DURATION)
+
+logger = logging.getLogger(__name__)
+
+# File path of every recording pitch tracked in this process: its tracker
+_trackers = {}
+
+class ChunkTracker:
+    """Pitch tracks the chunks of a recording, in blocks of the same length as
+    stream_audio decodes the finished file in.
+    """
+
+    def __init__(self, sample_rate: int, setup: AnalysisSetup, estimator: str=None):
+        """
+        Args:
+            sample_rate (int): The sample rate of the chunks
+            setup (AnalysisSetup): The analysis setup, as signal_processing
+                would choose it
+            estimator (str): The name of the pitch estimator to use. Defaults
+                to config.PITCH_ESTIMATOR
+        """
+
+        self.setup = setup
+        self.estimator = estimator
+        self.resampler = ResampleStream(sample_rate, setup.sr)
+        self.analyzer = StreamAnalyzer(estimator, setup)
+        # Blocks of the same length as stream_audio decodes the file in, once resampled
+        self.block_length = max(1, int(STREAM_BLOCK_DURATION*sample_rate)//self.resampler.down)*self.resampler.up
+        self.pending = np.zeros(0, dtype=np.float32)
+
+    def push(self, samples: np.array):
+        """Resamples a chunk and pitch tracks the blocks it completes.
+
+        Args:
+            samples (np.array): The mono samples of the chunk
+        """
+        self.pending = np.concatenate((self.pending, self.resampler.push(samples)))
+        blocks = self.pending.size//self.block_length
+        for block in range(blocks):
+            self.analyzer.push(self.pending[block*self.block_length:(block + 1)*self.block_length])
+        self.pending = self.pending[blocks*self.block_length:]
+
+    def finish(self) -> Tuple[np.array, np.array, np.array]:
+        """Pitch tracks the rest of the recording.
+
+        Returns:
+            Tuple[np.array, np.array, np.array]: The arrays for fundamental
+                frequency, their times, and amplitudes
+        """
+        self.pending = np.concatenate((self.pending, self.resampler.flush()))
+        for first in range(0, self.pending.size, self.block_length):
+            self.analyzer.push(self.pending[first:first + self.block_length])
+        return self.analyzer.finish()
+
+def start_tracking(wav_file_path: str, sample_rate: int, setup: AnalysisSetup, estimator: str=None):
+    """Starts pitch tracking a recording. Runs in the recording worker.
+
+    Args:
+        wav_file_path (str): The file path the recording is written to
+        sample_rate (int): The sample rate of the chunks
+        setup (AnalysisSetup): The analysis setup
+        estimator (str): The name of the pitch estimator to use
+    """
+    _trackers[wav_file_path] = ChunkTracker(sample_rate, setup, estimator)
+
+def track_chunk(wav_file_path: str, samples: np.array):
+    """Pitch tracks the next chunk of a recording. Runs in the recording
+    worker. A recording that failed to track (or was tracked by a worker
+    that has since died) is left to the analysis job.
+
+    Args:
+        wav_file_path (str): The file path the recording is written to
+        samples (np.array): The mono samples of the chunk
+    """
+    tracker = _trackers.get(wav_file_path)
+    if tracker is None:
+        return
+    try:
+        tracker.push(samples)
+    except Exception:
+        logger.exception(f"Pitch tracking {wav_file_path} failed")
+        del _trackers[wav_file_path]
+
+def finish_tracking(wav_file_path: str) -> Optional[Tuple[np.array, np.array, np.array]]:
+    """Pitch tracks the rest of a recording, once its WAV file is closed, and
+    stores the analysis in the analysis cache. Runs in the recording worker.
+
+    Args:
+        wav_file_path (str): The file path the recording was written to
+
+    Returns:
+        Optional[Tuple[np.array, np.array, np.array]]: The arrays for
+            fundamental frequency, their times, and amplitudes, or None if
+            the recording wasn't tracked
+    """
+    tracker = _trackers.pop(wav_file_path, None)
+    if tracker is None:
+        return None
+    try:
+        f0, times, velocities = tracker.finish()
+    except Exception:
+        logger.exception(f"Pitch tracking {wav_file_path} failed")
+        return None
+
+    key = analysis_cache.key(wav_file_path, get_analysis_params(True, tracker.estimator, tracker.setup))
+    analysis_cache.put(key, f0, times, velocities)
+    return f0, times, velocities
+
+def cancel_tracking(wav_file_path: str):
+    """Stops pitch tracking a recording. Runs in the recording worker.
+
+    Args:
+        wav_file_path (str): The file path the recording was written to
+    """
+    _trackers.pop(wav_file_path, None)
+
+class RecordingSession:
+    """A recording uploaded chunk by chunk. Chunks are numbered from 0 and
+    must arrive in order; a chunk sent again (e.g. retried after a timeout)
+    is ignored.
+    """
+
+    def __init__(self, wav_file_path: str, sample_rate: int, setup: AnalysisSetup, estimator: str=None):
+        """
+        Args:
+            wav_file_path (str): The file path to write the recording to
+            sample_rate (int): The sample rate of the chunks
+            setup (AnalysisSetup): The analysis setup, as signal_processing
+                would choose it
+            estimator (str): The name of the pitch estimator to use. Defaults
+                to config.PITCH_ESTIMATOR
+        """
+
+        self.wav_file_path = wav_file_path
+        self.wav_file = sf.SoundFile(wav_file_path, "w", samplerate=sample_rate, channels=1, subtype="FLOAT")
+        self.chunks = 0
+        self.finished = False
+        self.lock = threading.Lock()
+        analysis_pool.submit_recording(start_tracking, wav_file_path, sample_rate, setup, estimator)
+
+    def push(self, index: int, samples: np.array) -> bool:
+        """Adds a chunk of the recording, and sends it to be pitch tracked.
+
+        Args:
+            index (int): The number of the chunk
+            samples (np.array): The mono samples of the chunk, between -1
+                and 1
+
+        Raises:
+            ValueError: If chunks are missing before this one, or the
+                recording has ended
+
+        Returns:
+            bool: Whether the chunk was added (False if it was already)
+        """
+
+        with self.lock:
+            if self.finished:
+                raise ValueError("The recording has ended")
+            if index < self.chunks:
+                return False
+            if index > self.chunks:
+                raise ValueError(f"Expected chunk {self.chunks}")
+
+            samples = np.asarray(samples, dtype=np.float32)
+            self.wav_file.write(samples)
+            # (under the lock, so the chunks are tracked in order)
+            analysis_pool.submit_recording(track_chunk, self.wav_file_path, samples)
+            self.chunks += 1
+            return True
+
+    def finish(self) -> Optional[Tuple[np.array, np.array, np.array]]:
+        """Ends the recording: closes the WAV file, and waits for the rest of
+        the recording to be pitch tracked and its analysis stored in the
+        analysis cache.
+
+        Returns:
+            Optional[Tuple[np.array, np.array, np.array]]: The arrays for
+                fundamental frequency, their times, and amplitudes, or None if
+                pitch tracking failed and is left to the analysis job
+        """
+
+        with self.lock:
+            self.finished = True
+            self.wav_file.close()
+            future = analysis_pool.submit_recording(finish_tracking, self.wav_file_path)
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            logger.exception(f"Pitch tracking {self.wav_file_path} failed")
+            return None
+
+    def cancel(self):
+        """Ends the recording without analyzing the rest of it."""
+        with self.lock:
+            if not self.finished:
+                self.finished = True
+                self.wav_file.close()
+                analysis_pool.submit_recording(cancel_tracking, self.wav_file_path)
@@ -8,8 +8,16 @@ return that JSON to be stored locally in the file system.
 import librosa
 import numpy as np
 import json
-from typing import List, Dict, Tuple
-from .objects import Note
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import List, Dict, NamedTuple, Tuple
+from .objects import Note, NoteArray, A4
+from .audio_stream import FrameStream, load_audio, stream_audio
+from .pitch_estimators import get_pitch_estimator
+from .analysis_cache import AnalysisCache
+from . import note_kernels
+from . import progress
+import config
 
 FMIN = librosa.note_to_hz('C2') # Min detectable frequency (~65 Hz)
 FMAX = librosa.note_to_hz('C7') # Max detectable frequency (~2093 Hz)
@@ -18,10 +26,88 @@ YIN_SAMPLE_RATE = 22050
 YIN_FRAME_LENGTH = 256
 YIN_HOP_LENGTH = YIN_FRAME_LENGTH//6 # Frame increment in samples. Default FRAME_LENGTH//4
 YIN_WINDOW_LENGTH = YIN_FRAME_LENGTH//2
+FEATURE_BLOCK_FRAMES = 4096 # Frames whose features are computed at once.
+PROGRESS_BLOCKS = 20 # Min blocks frames are estimated in when pitch tracking reports its progress.
 # Note extrapolation parameters
 MAX_CENTS_DIFFERENCE = 31.5 # Max cents difference between notes.
 MIN_NOTE_DISTANCE = YIN_HOP_LENGTH/YIN_SAMPLE_RATE + 1e-10 # Min note distance before merging in seconds.
 REST_FREQUENCY = 2205 # Arbitrary frequency value assigned to rests.
+# Silence trimming parameters (librosa.effects.trim defaults)
+TRIM_TOP_DB = 60
+TRIM_FRAME_LENGTH = 2048
+TRIM_HOP_LENGTH = 512
+# Streaming parameters
+STREAM_MIN_DURATION = 600 # Recordings at least this long (seconds) are streamed.
+STREAM_BLOCK_DURATION = 10 # Audio decoded and analyzed at once in seconds.
+# Parallel analysis parameters
+PARALLEL_MIN_DURATION = 30 # Recordings at least this long (seconds) are split across workers.
+SPLIT_SEARCH_FRAMES = 1024 # Frames searched on each side of a split point for silence.
+# Score-informed analysis parameters
+SCORE_BAND_MARGIN = 4 # Semitones searched beyond the lowest and highest note of the score.
+SCORE_MIN_SAMPLES_PER_PERIOD = 8 # Min samples per period of the highest frequency searched.
+ANALYSIS_RATE_DIVISORS = (1, 2, 3, 6) # Divisors of YIN_SAMPLE_RATE tried as analysis rates.
+# Coarse to fine tracking parameters
+COARSE_MIN_STABLE_STEPS = 2 # Min consecutive stable coarse steps that make a note.
+COARSE_ONSET_DB = 6 # Rise in level within a coarse step that marks an onset.
+COARSE_MAX_GAP_STEPS = 2 # Max unstable coarse steps between two notes that are tracked frame by frame.
+COARSE_MAX_OCTAVE_STEPS = 4 # Max coarse steps of a note an octave off the next one that are tracked frame by frame.
+# Energy gate parameters
+GATE_MIN_SILENCE = 24 # Min frames below the gate (~45 ms) to skip. Shorter dips are still tracked.
+# Onset segmentation parameters (onset frames share the trim frame geometry)
+ONSET_BLOCK_FRAMES = 256 # Onset frames whose spectra are computed at once.
+ONSET_DELTA = 0.1 # Min rise of a peak above the local mean of the normalized onset envelope.
+NOTE_SEGMENTERS = ("frames", "onsets") # Ways frames can be grouped into notes.
+
+_executors = {}
+
+class GateStats:
+    """Running totals of the frames the energy gate has seen and skipped in
+    this process.
+    """
+
+    def __init__(self):
+        self.frames = 0
+        self.frames_skipped = 0
+
+    def add(self, voiced: np.array):
+        self.frames += voiced.size
+        self.frames_skipped += voiced.size - int(np.count_nonzero(voiced))
+
+    @property
+    def skipped_fraction(self) -> float:
+        """Fraction of frames skipped so far (0 before the first recording)."""
+
+        if self.frames == 0:
+            return 0.0
+        return self.frames_skipped/self.frames
+
+    def reset(self):
+        self.frames = 0
+        self.frames_skipped = 0
+
+gate_stats = GateStats()
+analysis_cache = AnalysisCache(config.CACHE_DIR, config.ANALYSIS_CACHE_MAX_BYTES)
+
+class AnalysisSetup(NamedTuple):
+    """Sample rate, frame geometry (in samples) and frequency band that a
+    recording is analyzed with. With coarse_hops above 1, pitch is tracked
+    coarse to fine (see track_coarse_to_fine). With gate_top_db set, frames
+    that many dB below the loudest frame are skipped (see get_voiced_frames).
+    """
+
+    sr: int
+    frame_length: int
+    hop_length: int
+    win_length: int
+    fmin: float
+    fmax: float
+    trim_frame_length: int
+    trim_hop_length: int
+    coarse_hops: int = 1
+    gate_top_db: float = None
+
+DEFAULT_SETUP = AnalysisSetup(YIN_SAMPLE_RATE, YIN_FRAME_LENGTH, YIN_HOP_LENGTH, YIN_WINDOW_LENGTH,
+                              FMIN, FMAX, TRIM_FRAME_LENGTH, TRIM_HOP_LENGTH)
 
 class NpEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -30,29 +116,147 @@ class NpEncoder(json.JSONEncoder):
         else:
             return super(NpEncoder, self).default(obj)
 
-def signal_processing(rec_file: str, bpm: int=100) -> Dict:
+def signal_processing(rec_file: str, bpm: int=100, stream: bool=None, estimator: str=None,
+                      use_cache: bool=True, band: Tuple[float, float]=None, segmenter: str=None) -> Dict:
     """Analyzes WAV sound file and returns a JSON containing the list
     of extrapolated notes.
 
     Args:
         rec_file (str): The file path of the WAV file
         bpm (int): The BPM of the recording
+        stream (bool): Whether to analyze the file block by block. By
+            default, recordings longer than STREAM_MIN_DURATION are streamed
+        estimator (str): The name of the pitch estimator to use. Defaults to
+            config.PITCH_ESTIMATOR
+        use_cache (bool): Whether to reuse and store the frame-level analysis
+            in the analysis cache
+        band (Tuple[float, float]): The lowest and highest frequency to
+            search, e.g. from get_score_band. By default, FMIN to FMAX at
+            YIN_SAMPLE_RATE
+        segmenter (str): How frames are grouped into notes, "frames" (see
+            freq_to_notes_yin) or "onsets" (see onsets_to_notes_yin).
+            Defaults to config.NOTE_SEGMENTER
 
     Returns:
         Dict: The JSON with the list of notes
     """
 
+    if segmenter is None:
+        segmenter = config.NOTE_SEGMENTER
+    if segmenter not in NOTE_SEGMENTERS:
+        raise ValueError(f"Unknown note segmenter: {segmenter}")
+    if stream is None:
+        stream = librosa.get_duration(filename=rec_file) >= STREAM_MIN_DURATION
+    setup = get_analysis_setup(band, config.COARSE_TO_FINE_HOPS, config.ENERGY_GATE_TOP_DB)
+
+    features = None
+    if use_cache:
+        cache_key = analysis_cache.key(rec_file, get_analysis_params(stream, estimator, setup))
+        features = analysis_cache.get(cache_key)
+
     # Converts sound file to frequency data, etc.
-    f0, times, amplitudes = get_f0_time_amp_yin(rec_file)
+    if features is not None:
+        f0, times, amplitudes = features
+    elif stream:
+        f0, times, amplitudes = get_f0_time_amp_yin_stream(rec_file, estimator=estimator, setup=setup)
+    else:
+        f0, times, amplitudes = get_f0_time_amp_yin(rec_file, estimator=estimator, setup=setup)
+
+    if use_cache and features is None:
+        analysis_cache.put(cache_key, f0, times, amplitudes)
 
     # Converts the fundamental frequencies, etc. to notes
-    notes = freq_to_notes_yin(f0, times, amplitudes, bpm)
+    progress.report("segmentation", 0)
+    if segmenter == "onsets":
+        onset_times = get_onset_times(rec_file, setup, stream)
+        notes = onsets_to_notes_yin(f0, times, amplitudes, onset_times, bpm, get_lowest_frequency(setup),
+                                    setup.fmax)
+    else:
+        notes = freq_to_notes_yin(f0, times, amplitudes, bpm, setup.fmax)
 
     # Converts the notes to a JSON file structure
     result = notes_to_JSON(notes)
+    progress.report("segmentation")
 
     return result
 
+def get_score_band(notes: List[Dict], margin: float=SCORE_BAND_MARGIN) -> Tuple[float, float]:
+    """Gets the frequency band to search for the notes of a score: from the
+    lowest to the highest pitch, widened by a margin and kept within FMIN
+    to FMAX.
+
+    Args:
+        notes (List[Dict]): The notes of the score, as stored in master.json
+        margin (float): The margin in semitones on each side
+
+    Returns:
+        Tuple[float, float]: The lowest and highest frequency, or None if the
+            score has no notes
+    """
+
+    if not notes:
+        return None
+    pitches = [note["pitch"] for note in notes]
+    ratio = 2**(margin/12)
+
+    return max(FMIN, min(pitches)/ratio), min(FMAX, max(pitches)*ratio)
+
+def get_analysis_setup(band: Tuple[float, float]=None, coarse_hops: int=1, gate_top_db: float=None) -> AnalysisSetup:
+    """Gets the analysis setup for a frequency band: the lowest sample rate
+    in ANALYSIS_RATE_DIVISORS that still gives the highest frequency
+    SCORE_MIN_SAMPLES_PER_PERIOD samples per period, with every length scaled
+    to keep the same durations as DEFAULT_SETUP. Narrowing the band also
+    narrows the range of lags YIN searches.
+
+    Args:
+        band (Tuple[float, float]): The lowest and highest frequency to
+            search. None gives DEFAULT_SETUP
+        coarse_hops (int): The hops between frames of the coarse pitch
+            tracking pass. 1 tracks every frame
+        gate_top_db (float): The level in dB below the loudest frame under
+            which frames are skipped. None tracks every frame
+
+    Returns:
+        AnalysisSetup: The analysis setup
+    """
+
+    if band is None:
+        return DEFAULT_SETUP._replace(coarse_hops=coarse_hops, gate_top_db=gate_top_db)
+    fmin, fmax = band
+    divisor = max(divisor for divisor in ANALYSIS_RATE_DIVISORS
+                  if divisor == 1 or YIN_SAMPLE_RATE/divisor >= fmax*SCORE_MIN_SAMPLES_PER_PERIOD)
+
+    return AnalysisSetup(YIN_SAMPLE_RATE//divisor,
+                         round(YIN_FRAME_LENGTH/divisor),
+                         YIN_HOP_LENGTH//divisor,
+                         round(YIN_WINDOW_LENGTH/divisor),
+                         fmin, fmax,
+                         round(TRIM_FRAME_LENGTH/divisor),
+                         round(TRIM_HOP_LENGTH/divisor),
+                         coarse_hops, gate_top_db)
+
+def get_analysis_params(stream: bool, estimator: str=None, setup: AnalysisSetup=DEFAULT_SETUP) -> Dict:
+    """Gets the parameters that the frame-level analysis of a recording
+    depends on, used to key the analysis cache.
+
+    Args:
+        stream (bool): Whether the file is analyzed block by block
+        estimator (str): The name of the pitch estimator. Defaults to
+            config.PITCH_ESTIMATOR
+        setup (AnalysisSetup): The analysis setup
+
+    Returns:
+        Dict: The analysis parameters
+    """
+
+    return {
+        **setup._asdict(),
+        "trim_top_db": TRIM_TOP_DB,
+        "stream": stream,
+        "resampler": "polyphase" if stream else config.RESAMPLE_TYPE,
+        "estimator": estimator or config.PITCH_ESTIMATOR
+    }
+
 def amplitude_to_midi_velocity(amplitude: np.array) -> np.array:
     """Converts raw amplitude values to velocity values.
 
@@ -65,6 +269,8 @@ def amplitude_to_midi_velocity(amplitude: np.array) -> np.array:
 
     # Amplitude value assigned to mezzo forte (velocity 80)
     MF_RMS = np.log10(0.058209)
+    if config.COMPILED_NOTE_KERNELS:
+        return note_kernels.amplitude_to_midi_velocity(np.asarray(amplitude), MF_RMS).tolist()
     amplitude = np.log10(amplitude)
     lower = np.min(amplitude)
     upper = MF_RMS
@@ -75,150 +281,1065 @@ def amplitude_to_midi_velocity(amplitude: np.array) -> np.array:
     # Convert the NumPy array to a list of native integers
     return midi_velocity.tolist()
 
-def get_f0_time_amp_yin(rec_file: str) -> Tuple[np.array, np.array, np.array]:
+def get_f0_time_amp_yin(rec_file: str, workers: int=None, estimator: str=None,
+                        setup: AnalysisSetup=DEFAULT_SETUP) -> Tuple[np.array, np.array, np.array]:
     """Gets fundamental frequencies, timestamps, and amplitudes from a WAV
     sound file. YIN implementation.
 
     Args:
         rec_file (str): The file path of the WAV file
+        workers (int): The number of processes to analyze with. Defaults to
+            config.ANALYSIS_WORKERS
+        estimator (str): The name of the pitch estimator to use. Defaults to
+            config.PITCH_ESTIMATOR
+        setup (AnalysisSetup): The sample rate, frame geometry and band to
+            analyze with
 
     Returns:
         Tuple[np.array, np.array, np.array, np.array]: The arrays for fundamental
             frequency, their times, and amplitudes
     """
     
-    audio, sr = librosa.load(rec_file)
-    audio, _ = librosa.effects.trim(audio)
+    progress.report("decode", 0)
+    audio, sr = load_trimmed_audio(rec_file, setup)
+    progress.report("decode")
     
-    f0 = librosa.yin(audio, sr=sr, fmin=FMIN, fmax=FMAX, frame_length=YIN_FRAME_LENGTH, win_length=YIN_WINDOW_LENGTH, hop_length=YIN_HOP_LENGTH)
+    # Gets the fundamental frequencies and their amplitudes
+    progress.report("pitch_tracking", 0)
+    f0, amplitudes = get_frame_features_parallel(audio, sr, workers, estimator, setup)
+    progress.report("pitch_tracking")
 
     # Get times for frequencies
-    times = np.array([YIN_HOP_LENGTH/sr*i for i in range(f0.size)])
-
-    # Gets the amplitude of the fundamental frequencies
-    S = librosa.magphase(librosa.stft(audio, n_fft=YIN_FRAME_LENGTH, hop_length=YIN_HOP_LENGTH, win_length=YIN_WINDOW_LENGTH, window=np.ones))[0]
-    amplitudes = librosa.feature.rms(S=S, frame_length=YIN_FRAME_LENGTH, hop_length=YIN_HOP_LENGTH)[0]
+    times = setup.hop_length/sr*np.arange(f0.size)
 
     # Convert amplitude to MIDI velocity
     midi_velocities = amplitude_to_midi_velocity(amplitudes)
     
     return f0, times, midi_velocities
 
-def freq_to_notes_yin(f0: np.array, times: np.array, amplitudes: np.array, bpm: int) -> List[Note]:
+def load_trimmed_audio(rec_file: str, setup: AnalysisSetup=DEFAULT_SETUP) -> Tuple[np.array, int]:
+    """Loads a sound file at the analysis sample rate and trims the silence
+    at its start and end.
+
+    Args:
+        rec_file (str): The file path of the sound file
+        setup (AnalysisSetup): The sample rate and trim frame geometry
+
+    Returns:
+        Tuple[np.array, int]: The trimmed audio and its sample rate
+    """
+
+    audio, sr = load_audio(rec_file, setup.sr, config.RESAMPLE_TYPE)
+    audio, _ = librosa.effects.trim(audio, top_db=TRIM_TOP_DB, frame_length=setup.trim_frame_length,
+                                    hop_length=setup.trim_hop_length)
+
+    return audio, sr
+
+def get_frame_features(audio: np.array, sr: int, center: bool=True, estimator: str=None,
+                       setup: AnalysisSetup=DEFAULT_SETUP, voiced: np.array=None,
+                       report_progress: bool=False) -> Tuple[np.array, np.array]:
+    """Frames audio once and computes the fundamental frequency and the RMS
+    amplitude of every frame from the same frame buffer.
+
+    The RMS is taken over the window in the middle of each frame and divided
+    by twice the window length (YIN_FRAME_LENGTH by default), which is what
+    the RMS of a boxcar-windowed STFT works out to, without building a
+    spectrogram.
+    Frames are processed FEATURE_BLOCK_FRAMES at a time to bound the size of
+    the temporary arrays.
+
+    Args:
+        audio (np.array): The audio time series
+        sr (int): The sample rate of the audio
+        center (bool): Whether to pad the audio so frames are centered on
+            multiples of the hop length
+        estimator (str): The name of the pitch estimator to use. Defaults to
+            config.PITCH_ESTIMATOR
+        setup (AnalysisSetup): The frame geometry and band to analyze with
+        voiced (np.array): Which frames to estimate the pitch of (see
+            get_voiced_frames). The others are set to REST_FREQUENCY. By
+            default, every frame
+        report_progress (bool): Whether to report the progress of the
+            pitch_tracking stage as blocks of frames are estimated
+
+    Returns:
+        Tuple[np.array, np.array]: The arrays for fundamental frequency and
+            amplitude
+    """
+
+    pitch_estimator = get_pitch_estimator(estimator or config.PITCH_ESTIMATOR)
+    if center:
+        audio = np.pad(audio, setup.frame_length//2)
+    frames = librosa.util.frame(audio, frame_length=setup.frame_length, hop_length=setup.hop_length)
+    amplitudes = get_frame_rms(frames, setup)
+
+    n_frames = frames.shape[1]
+    report = (0, 1) if report_progress else None
+    if setup.coarse_hops > 1:
+        f0 = track_coarse_to_fine(frames, amplitudes, sr, pitch_estimator, setup, voiced, report_progress)
+    elif voiced is not None:
+        f0 = _estimate_frames(frames, np.arange(n_frames), sr, pitch_estimator, setup, voiced, report)
+    else:
+        f0 = np.empty(n_frames)
+        block_frames = _get_block_frames(n_frames, report)
+        for first in range(0, n_frames, block_frames):
+            block = frames[:, first:first + block_frames]
+            f0[first:first + block.shape[1]] = pitch_estimator.estimate(block, sr, setup.hop_length, setup.win_length,
+                                                                        setup.fmin, setup.fmax)
+            if report_progress:
+                progress.report("pitch_tracking", (first + block.shape[1])/n_frames)
+
+    return f0, amplitudes
+
+def get_frame_rms(frames: np.array, setup: AnalysisSetup=DEFAULT_SETUP) -> np.array:
+    """Computes the RMS amplitude of every frame over the window in its
+    middle, FEATURE_BLOCK_FRAMES at a time.
+
+    Args:
+        frames (np.array): The frames, shaped (frame_length, n_frames)
+        setup (AnalysisSetup): The frame geometry
+
+    Returns:
+        np.array: The RMS amplitude of every frame
+    """
+
+    amplitudes = np.empty(frames.shape[1], dtype=frames.dtype)
+    offset = (setup.frame_length - setup.win_length)//2
+    for first in range(0, frames.shape[1], FEATURE_BLOCK_FRAMES):
+        window = frames[offset:offset + setup.win_length, first:first + FEATURE_BLOCK_FRAMES]
+        amplitudes[first:first + window.shape[1]] = np.sqrt(np.einsum("ij,ij->j", window, window)/(2*setup.win_length))
+
+    return amplitudes
+
+def get_voiced_frames(amplitudes: np.array, reference: float, setup: AnalysisSetup) -> np.array:
+    """Gates frames by energy: frames more than setup.gate_top_db below the
+    reference level are silence or rests, unless they are part of a dip
+    shorter than GATE_MIN_SILENCE frames.
+
+    Args:
+        amplitudes (np.array): The RMS amplitude of every frame
+        reference (float): The RMS amplitude of the loudest frame
+        setup (AnalysisSetup): The gate level
+
+    Returns:
+        np.array: Whether each frame should be pitch tracked
+    """
+
+    if setup.gate_top_db is None:
+        return np.ones(amplitudes.size, dtype=bool)
+    voiced = amplitudes > reference*10**(-setup.gate_top_db/20)
+    if voiced.size == 0:
+        return voiced
+
+    run = np.cumsum(np.append(True, voiced[1:] != voiced[:-1])) - 1
+    voiced |= np.bincount(run)[run] < GATE_MIN_SILENCE
+
+    return voiced
+
+def track_coarse_to_fine(frames: np.array, amplitudes: np.array, sr: int, pitch_estimator,
+                         setup: AnalysisSetup, voiced: np.array=None, report_progress: bool=False) -> np.array:
+    """Estimates the fundamental frequency of every frame, running the
+    estimator at full resolution only around note boundaries.
+
+    A first pass estimates every coarse_hops-th frame (and the last one). A
+    coarse step is stable when the frames at its ends are within
+    MAX_CENTS_DIFFERENCE cents of each other, and runs of at least
+    COARSE_MIN_STABLE_STEPS stable steps are notes, whose frames are
+    interpolated. In the steps next to a note, the frame where the note
+    starts or ends is found by bisection. Gaps of at most
+    COARSE_MAX_GAP_STEPS unstable steps between two notes (a quick change of
+    note, or a coarse frame off by an octave), steps of a note whose level
+    rises by COARSE_ONSET_DB (a repeated note) and notes of a few steps an
+    octave off the next or previous one are estimated frame by frame; frames of a gap
+    that are whole octaves off the notes around it are folded back onto
+    them. All other frames are noise or rests and are set to REST_FREQUENCY.
+
+    Args:
+        frames (np.array): The frames, shaped (frame_length, n_frames)
+        amplitudes (np.array): The RMS amplitude of every frame
+        sr (int): The sample rate of the audio
+        pitch_estimator (PitchEstimator): The pitch estimator
+        setup (AnalysisSetup): The frame geometry, band and coarse step
+        voiced (np.array): Which frames to estimate the pitch of. The others
+            are set to REST_FREQUENCY. By default, every frame
+        report_progress (bool): Whether to report the progress of the
+            pitch_tracking stage, in proportion to the frames estimated so
+            far out of those the passes are expected to estimate
+
+    Returns:
+        np.array: The fundamental frequency of every frame
+    """
+
+    n_frames = frames.shape[1]
+    coarse = np.arange(0, n_frames, setup.coarse_hops)
+    if coarse[-1] != n_frames - 1:
+        coarse = np.append(coarse, n_frames - 1)
+    coarse_f0 = _estimate_frames(frames, coarse, sr, pitch_estimator, setup, voiced)
+    if coarse.size < 2:
+        return np.interp(np.arange(n_frames), coarse, coarse_f0)
+
+    # Steps that belong to notes, and the steps next to them
+    stable = np.abs(1200*np.log2(coarse_f0[1:]/coarse_f0[:-1])) <= MAX_CENTS_DIFFERENCE
+    run = np.cumsum(np.append(True, stable[1:] != stable[:-1])) - 1
+    note = stable & (np.bincount(run)[run] >= COARSE_MIN_STABLE_STEPS)
+    octave_jump = _find_octave_jumps(note, coarse_f0)
+    note_before = np.append(False, note[:-1])
+    note_after = np.append(note[1:], False)
+    note_run = np.cumsum(np.append(True, note[1:] != note[:-1])) - 1
+    gap = (~note & (np.bincount(note_run)[note_run] <= COARSE_MAX_GAP_STEPS)
+           & (note_run > 0) & (note_run < note_run[-1]))
+    # Pitch of the notes before and after every step's run
+    run_start = np.flatnonzero(np.append(True, note[1:] != note[:-1]))
+    pitch_before = coarse_f0[run_start[note_run]]
+    pitch_after = coarse_f0[np.append(run_start[1:], note.size)[note_run]]
+
+    f0 = np.full(n_frames, float(REST_FREQUENCY))
+    interpolated = _frame_ranges(coarse[:-1][note], coarse[1:][note] + 1)
+    f0[interpolated] = np.interp(interpolated, coarse, coarse_f0)
+
+    # Notes that end inside the next step
+    ending = np.flatnonzero(~note & ~gap & note_before)
+    end = _bisect_boundaries(frames, coarse[ending], coarse[ending + 1], coarse_f0[ending], True,
+                             sr, pitch_estimator, setup, voiced)
+    f0[_frame_ranges(coarse[ending], end)] = np.repeat(coarse_f0[ending], end - coarse[ending])
+
+    # Notes that start inside the previous step
+    starting = np.flatnonzero(~note & ~gap & note_after)
+    start = _bisect_boundaries(frames, coarse[starting], coarse[starting + 1], coarse_f0[starting + 1], False,
+                               sr, pitch_estimator, setup, voiced)
+    f0[_frame_ranges(start, coarse[starting + 1])] = np.repeat(coarse_f0[starting + 1], coarse[starting + 1] - start)
+
+    # Gaps between notes, notes with an onset inside a step and notes an octave off the next
+    # one, tracked frame by frame
+    level = librosa.amplitude_to_db(amplitudes, top_db=None)
+    level = np.append(level, np.full(setup.coarse_hops, level[-1]))
+    steps = librosa.util.frame(level, frame_length=setup.coarse_hops + 1, hop_length=setup.coarse_hops)
+    steps = steps[:, :stable.size]
+    rise = np.max(steps - np.minimum.accumulate(steps, axis=0), axis=0)
+    onset = note & (rise > COARSE_ONSET_DB)
+    f0[coarse[1:][gap]] = coarse_f0[1:][gap]
+    fine = _frame_ranges(coarse[:-1][onset | gap | octave_jump] + 1, coarse[1:][onset | gap | octave_jump])
+    report = None
+    if report_progress:
+        # (bisection estimates up to log2(coarse_hops) frames of every boundary)
+        estimated = coarse.size + (ending.size + starting.size)*int(np.ceil(np.log2(setup.coarse_hops)))
+        report = (estimated/(estimated + fine.size), 1)
+        progress.report("pitch_tracking", report[0])
+    f0[fine] = _estimate_frames(frames, fine, sr, pitch_estimator, setup, voiced, report)
+
+    # Frames of a gap whole octaves off the note before or after it are the
+    # estimator jumping octaves, not a new note
+    folded = _frame_ranges(coarse[:-1][gap] + 1, coarse[1:][gap] + 1)
+    lengths = np.diff(coarse)[gap]
+    f0[folded] = _fold_octaves(f0[folded], np.repeat(pitch_before[gap], lengths),
+                               np.repeat(pitch_after[gap], lengths))
+    if voiced is not None:
+        f0[~voiced] = REST_FREQUENCY
+
+    return f0
+
+def _bisect_boundaries(frames: np.array, low: np.array, high: np.array, pitch: np.array, note_first: bool,
+                       sr: int, pitch_estimator, setup: AnalysisSetup, voiced: np.array=None) -> np.array:
+    """Finds where a note starts or ends between pairs of frames by
+    bisection, estimating one frame of every pair per round.
+
+    Args:
+        frames (np.array): The frames, shaped (frame_length, n_frames)
+        low (np.array): The first frame of every pair
+        high (np.array): The last frame of every pair
+        pitch (np.array): The pitch of the note of every pair
+        note_first (bool): Whether the note is at the low frame and ends
+            before the high frame, rather than starting after the low frame
+            and lasting to the high frame
+        sr (int): The sample rate of the audio
+        pitch_estimator (PitchEstimator): The pitch estimator
+        setup (AnalysisSetup): The frame geometry and band
+        voiced (np.array): Which frames to estimate the pitch of. The others
+            count as REST_FREQUENCY
+
+    Returns:
+        np.array: The first frame after the note ends, or the first frame of
+            the note
+    """
+
+    low, high = low.copy(), high.copy()
+    active = np.flatnonzero(high - low > 1)
+    while active.size > 0:
+        middle = (low[active] + high[active])//2
+        f0 = _estimate_frames(frames, middle, sr, pitch_estimator, setup, voiced)
+        in_note = np.abs(1200*np.log2(f0/pitch[active])) <= MAX_CENTS_DIFFERENCE
+        moves_low = in_note if note_first else ~in_note
+        low[active[moves_low]] = middle[moves_low]
+        high[active[~moves_low]] = middle[~moves_low]
+        active = active[high[active] - low[active] > 1]
+
+    return high
+
+def _find_octave_jumps(note: np.array, coarse_f0: np.array) -> np.array:
+    """Finds the runs of at most COARSE_MAX_GAP_STEPS note steps that are
+    whole octaves off the note next to them (at most COARSE_MAX_GAP_STEPS
+    steps away) and no longer than it. They may be a leap of an octave, or
+    the estimator jumping octaves for a few coarse frames, which only their
+    frames can tell apart.
+
+    Args:
+        note (np.array): Whether each coarse step belongs to a note
+        coarse_f0 (np.array): The fundamental frequency of every coarse frame
+
+    Returns:
+        np.array: Whether each coarse step is in one of those runs
+    """
+
+    run = np.cumsum(np.append(True, note[1:] != note[:-1])) - 1
+    run_start = np.flatnonzero(np.append(True, note[1:] != note[:-1]))
+    run_length = np.bincount(run)
+    run_pitch = coarse_f0[run_start]
+    is_note = note[run_start]
+
+    jump = np.zeros(run_start.size, dtype=bool)
+    for offset in (-2, 2):
+        runs = np.arange(max(0, -offset), run_start.size - max(0, offset))
+        other, between = runs + offset, runs + offset//2
+        octaves = np.log2(run_pitch[runs]/run_pitch[other])
+        jump[runs] |= (is_note[runs] & is_note[other] & (run_length[between] <= COARSE_MAX_GAP_STEPS)
+                               & (run_length[runs] <= np.minimum(run_length[other], COARSE_MAX_OCTAVE_STEPS))
+                               & (np.round(octaves) != 0)
+                               & (np.abs(1200*(octaves - np.round(octaves))) <= MAX_CENTS_DIFFERENCE))
+
+    return jump[run]
+
+def _fold_octaves(f0: np.array, pitch_before: np.array, pitch_after: np.array) -> np.array:
+    """Moves frames that are whole octaves off the pitch of the note before
+    or after them (whichever is fewer octaves away) onto it. Frames within
+    MAX_CENTS_DIFFERENCE cents of either pitch are kept.
+    """
+
+    f0 = f0.copy()
+    octaves_before = np.log2(f0/pitch_before)
+    octaves_after = np.log2(f0/pitch_after)
+    octaves = np.where(np.abs(octaves_before) <= np.abs(octaves_after), octaves_before, octaves_after)
+    whole = np.round(octaves)
+    off = ((np.abs(1200*octaves_before) > MAX_CENTS_DIFFERENCE) & (np.abs(1200*octaves_after) > MAX_CENTS_DIFFERENCE)
+           & (whole != 0) & (np.abs(1200*(octaves - whole)) <= MAX_CENTS_DIFFERENCE))
+    f0[off] /= 2**whole[off]
+    return f0
+
+def _frame_ranges(starts: np.array, stops: np.array) -> np.array:
+    """Concatenates the frame indices from every start up to its stop."""
+
+    lengths = stops - starts
+    return np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+def _estimate_frames(frames: np.array, index: np.array, sr: int, pitch_estimator, setup: AnalysisSetup,
+                     voiced: np.array=None, report: Tuple[float, float]=None) -> np.array:
+    """Estimates the fundamental frequency of the frames at some indices,
+    FEATURE_BLOCK_FRAMES at a time. Frames that aren't voiced are given
+    REST_FREQUENCY without running the estimator. With a report range, the
+    pitch_tracking stage advances across it block by block.
+    """
+
+    f0 = np.full(index.size, float(REST_FREQUENCY))
+    estimated = np.arange(index.size) if voiced is None else np.flatnonzero(voiced[index])
+    block_frames = _get_block_frames(estimated.size, report)
+    for first in range(0, estimated.size, block_frames):
+        chunk = estimated[first:first + block_frames]
+        f0[chunk] = pitch_estimator.estimate(frames[:, index[chunk]], sr, setup.hop_length, setup.win_length,
+                                             setup.fmin, setup.fmax)
+        if report is not None:
+            progress.report("pitch_tracking", report[0] + (report[1] - report[0])*(first + chunk.size)/estimated.size)
+    return f0
+
+def _get_block_frames(n_frames: int, report: Tuple[float, float]=None) -> int:
+    """Gets the number of frames to estimate at once: FEATURE_BLOCK_FRAMES,
+    or few enough to report progress PROGRESS_BLOCKS times.
+    """
+
+    if report is None:
+        return FEATURE_BLOCK_FRAMES
+    return max(1, min(FEATURE_BLOCK_FRAMES, -(-n_frames//PROGRESS_BLOCKS)))
+
+def get_frame_features_parallel(audio: np.array, sr: int, workers: int=None, estimator: str=None,
+                                setup: AnalysisSetup=DEFAULT_SETUP) -> Tuple[np.array, np.array]:
+    """Computes the same features as get_frame_features, splitting long
+    recordings into one segment per worker process.
+
+    Segments are cut at the quietest frame near each even split point and
+    carry the overlap their edge frames need, so every frame is computed from
+    exactly the same samples as in a single pass and the merged arrays match
+    the serial result (except around segment edges when tracking coarse to
+    fine, as each segment starts its own coarse grid). The energy gate is
+    applied to the whole recording before splitting.
+
+    Args:
+        audio (np.array): The audio time series
+        sr (int): The sample rate of the audio
+        workers (int): The number of processes to use. Defaults to
+            config.ANALYSIS_WORKERS
+        estimator (str): The name of the pitch estimator to use. Defaults to
+            config.PITCH_ESTIMATOR
+        setup (AnalysisSetup): The frame geometry and band to analyze with
+
+    Returns:
+        Tuple[np.array, np.array]: The arrays for fundamental frequency and
+            amplitude
+    """
+
+    if workers is None:
+        workers = config.ANALYSIS_WORKERS
+    padded = np.pad(audio, setup.frame_length//2)
+
+    # Gates the whole recording at once so every segment uses the same level
+    voiced = None
+    if setup.gate_top_db is not None:
+        frames = librosa.util.frame(padded, frame_length=setup.frame_length, hop_length=setup.hop_length)
+        amplitudes = get_frame_rms(frames, setup)
+        voiced = get_voiced_frames(amplitudes, np.max(amplitudes), setup)
+        gate_stats.add(voiced)
+
+    if workers <= 1 or audio.size < PARALLEL_MIN_DURATION*sr:
+        return get_frame_features(audio, sr, estimator=estimator, setup=setup, voiced=voiced, report_progress=True)
+
+    bounds = split_frames_at_silence(audio, workers, setup.hop_length)
+    segments = [padded[first*setup.hop_length:(last - 1)*setup.hop_length + setup.frame_length]
+                for first, last in zip(bounds[:-1], bounds[1:])]
+
+    executor = _executors.get(workers)
+    if executor is None:
+        executor = _executors[workers] = ProcessPoolExecutor(max_workers=workers)
+    segment_voiced = [None if voiced is None else voiced[first:last]
+                      for first, last in zip(bounds[:-1], bounds[1:])]
+    results = []
+    for result in executor.map(get_frame_features, segments, repeat(sr), repeat(False), repeat(estimator),
+                               repeat(setup), segment_voiced):
+        results.append(result)
+        progress.report("pitch_tracking", len(results)/len(segments))
+
+    f0 = np.concatenate([result[0] for result in results])
+    amplitudes = np.concatenate([result[1] for result in results])
+
+    return f0, amplitudes
+
+def split_frames_at_silence(audio: np.array, n_segments: int, hop_length: int=YIN_HOP_LENGTH) -> np.array:
+    """Splits the frames of a recording into contiguous segments of roughly
+    equal length, moving every split to the quietest frame within
+    SPLIT_SEARCH_FRAMES of it.
+
+    Args:
+        audio (np.array): The audio time series
+        n_segments (int): The number of segments
+        hop_length (int): The number of samples between frames
+
+    Returns:
+        np.array: The first frame of every segment, followed by the total
+            number of frames
+    """
+
+    n_frames = 1 + audio.size//hop_length
+    hops = audio[:(audio.size//hop_length)*hop_length].reshape(-1, hop_length)
+    energy = np.einsum("ij,ij->i", hops, hops)
+
+    bounds = [0]
+    for k in range(1, n_segments):
+        target = k*n_frames//n_segments
+        low = max(bounds[-1] + 1, target - SPLIT_SEARCH_FRAMES)
+        high = min(target + SPLIT_SEARCH_FRAMES, energy.size)
+        if low >= high:
+            continue
+        bounds.append(low + int(np.argmin(energy[low:high])))
+    bounds.append(n_frames)
+
+    return np.array(bounds)
+
+class StreamAnalyzer:
+    """Pitch tracks audio pushed block by block, e.g. decoded from a file or
+    uploaded while it's being recorded.
+
+    Frames are laid out on one grid over the whole stream and stitched across
+    block edges, so peak memory depends on the block size rather than the
+    recording length. Silence is trimmed once the stream ends and the
+    loudest part of the recording is known, by dropping the frames outside
+    the non-silent region.
+    """
+
+    def __init__(self, estimator: str=None, setup: AnalysisSetup=DEFAULT_SETUP):
+        """
+        Args:
+            estimator (str): The name of the pitch estimator to use. Defaults
+                to config.PITCH_ESTIMATOR
+            setup (AnalysisSetup): The sample rate, frame geometry and band
+                to analyze with
+        """
+
+        self.estimator = estimator
+        self.setup = setup
+        self.frames = FrameStream(setup.frame_length, setup.hop_length)
+        self.trim_frames = FrameStream(setup.trim_frame_length, setup.trim_hop_length)
+        self.f0_blocks, self.rms_blocks, self.trim_blocks = [], [], []
+        self.n_samples = 0
+        self.loudest = 0.0
+
+    def push(self, block: np.array):
+        """Pitch tracks the frames a block of audio completes.
+
+        Args:
+            block (np.array): The next block of audio, at setup.sr
+        """
+
+        self.n_samples += block.size
+        self._analyze(self.frames.push(block), self.trim_frames.push(block))
+
+    def finish(self) -> Tuple[np.array, np.array, np.array]:
+        """Pitch tracks the end of the stream and trims its silence.
+
+        Returns:
+            Tuple[np.array, np.array, np.array]: The arrays for fundamental
+                frequency, their times, and amplitudes
+        """
+
+        setup = self.setup
+        self._analyze(self.frames.flush(), self.trim_frames.flush())
+
+        f0 = np.concatenate(self.f0_blocks) if self.f0_blocks else np.empty(0)
+        amplitudes = np.concatenate(self.rms_blocks) if self.rms_blocks else np.empty(0)
+        trim_rms = np.concatenate(self.trim_blocks) if self.trim_blocks else np.empty(0)
+
+        bounds = get_non_silent_bounds(trim_rms, self.n_samples, setup)
+        if bounds is None:
+            return np.empty(0), np.empty(0), []
+        start, end = bounds
+
+        # Keep as many frames as analyzing the trimmed audio would give
+        first = -(-start//setup.hop_length)
+        count = 1 + (end - start)//setup.hop_length
+        f0 = f0[first:first + count]
+        amplitudes = amplitudes[first:first + count]
+
+        times = setup.hop_length/setup.sr*np.arange(f0.size)
+
+        # Convert amplitude to MIDI velocity
+        midi_velocities = amplitude_to_midi_velocity(amplitudes)
+
+        return f0, times, midi_velocities
+
+    def _analyze(self, segment: np.array, trim_segment: np.array):
+        setup = self.setup
+        if segment.size > 0:
+            voiced = None
+            if setup.gate_top_db is not None:
+                # Gated against the loudest frame so far, which lets through
+                # at least the frames the final level would
+                rms = get_frame_rms(librosa.util.frame(segment, frame_length=setup.frame_length,
+                                                       hop_length=setup.hop_length), setup)
+                self.loudest = max(self.loudest, float(np.max(rms)))
+                voiced = get_voiced_frames(rms, self.loudest, setup)
+                gate_stats.add(voiced)
+            f0, rms = get_frame_features(segment, setup.sr, center=False, estimator=self.estimator, setup=setup,
+                                         voiced=voiced)
+            self.f0_blocks.append(f0)
+            self.rms_blocks.append(rms)
+        if trim_segment.size > 0:
+            self.trim_blocks.append(librosa.feature.rms(y=trim_segment, frame_length=setup.trim_frame_length,
+                                                        hop_length=setup.trim_hop_length, center=False)[0])
+
+def get_f0_time_amp_yin_stream(rec_file: str, estimator: str=None,
+                               setup: AnalysisSetup=DEFAULT_SETUP) -> Tuple[np.array, np.array, np.array]:
+    """Gets fundamental frequencies, timestamps, and amplitudes from a WAV
+    sound file, decoding and analyzing it in blocks of STREAM_BLOCK_DURATION
+    seconds with a StreamAnalyzer. YIN implementation.
+
+    Args:
+        rec_file (str): The file path of the WAV file
+        estimator (str): The name of the pitch estimator to use. Defaults to
+            config.PITCH_ESTIMATOR
+        setup (AnalysisSetup): The sample rate, frame geometry and band to
+            analyze with
+
+    Returns:
+        Tuple[np.array, np.array, np.array]: The arrays for fundamental
+            frequency, their times, and amplitudes
+    """
+
+    analyzer = StreamAnalyzer(estimator, setup)
+
+    # (decoding is part of pitch tracking here, block by block)
+    progress.report("pitch_tracking", 0)
+    total_samples = max(1, librosa.get_duration(filename=rec_file)*setup.sr)
+    for block in stream_audio(rec_file, setup.sr, STREAM_BLOCK_DURATION):
+        analyzer.push(block)
+        progress.report("pitch_tracking", min(analyzer.n_samples/total_samples, 0.99))
+    features = analyzer.finish()
+    progress.report("pitch_tracking")
+
+    return features
+
+def get_non_silent_bounds(trim_rms: np.array, n_samples: int, setup: AnalysisSetup=DEFAULT_SETUP) -> Tuple[int, int]:
+    """Finds the non-silent region of a recording from the RMS of its trim
+    frames (not centered), as librosa.effects.trim would find it.
+
+    Args:
+        trim_rms (np.array): The RMS of every trim frame
+        n_samples (int): The length of the recording in samples
+        setup (AnalysisSetup): The trim frame geometry
+
+    Returns:
+        Tuple[int, int]: The first and last (exclusive) non-silent sample,
+            or None if the whole recording is silent
+    """
+
+    non_silent = np.flatnonzero(librosa.amplitude_to_db(trim_rms, ref=np.max, top_db=None) > -TRIM_TOP_DB)
+    if non_silent.size == 0:
+        return None
+
+    return non_silent[0]*setup.trim_hop_length, min(n_samples, (non_silent[-1] + 1)*setup.trim_hop_length)
+
+def get_lowest_frequency(setup: AnalysisSetup=DEFAULT_SETUP) -> float:
+    """Gets the lowest frequency YIN can report with an analysis setup, which
+    is above setup.fmin when the frames are too short for its period.
+
+    Args:
+        setup (AnalysisSetup): The sample rate, frame geometry and band
+
+    Returns:
+        float: The lowest frequency
+    """
+
+    max_period = min(int(np.ceil(setup.sr/setup.fmin)), setup.frame_length - setup.win_length - 1)
+    return setup.sr/max_period
+
+def get_onset_times(rec_file: str, setup: AnalysisSetup=DEFAULT_SETUP, stream: bool=False) -> np.array:
+    """Detects the note onsets of a sound file from a spectral flux onset
+    envelope, computed once over the recording.
+
+    Onset frames have the trim frame geometry and are centered like the
+    pitch frames, so onset times line up with the times returned by
+    get_f0_time_amp_yin and get_f0_time_amp_yin_stream.
+
+    Args:
+        rec_file (str): The file path of the sound file
+        setup (AnalysisSetup): The sample rate and trim frame geometry
+        stream (bool): Whether to decode the file block by block
+
+    Returns:
+        np.array: The onset times in seconds from the end of the leading
+            silence
+    """
+
+    sr = setup.sr
+    mel_basis = librosa.filters.mel(sr=sr, n_fft=setup.trim_frame_length)
+
+    if not stream:
+        audio, _ = load_trimmed_audio(rec_file, setup)
+        audio = np.pad(audio, setup.trim_frame_length//2)
+        frames = librosa.util.frame(audio, frame_length=setup.trim_frame_length, hop_length=setup.trim_hop_length)
+        envelope, _ = get_onset_envelope(frames, mel_basis)
+    else:
+        onset_frames = FrameStream(setup.trim_frame_length, setup.trim_hop_length)
+        trim_frames = FrameStream(setup.trim_frame_length, setup.trim_hop_length)
+        envelope_blocks, trim_blocks = [], []
+        n_samples = 0
+        previous = None
+
+        def analyze(segment: np.array, trim_segment: np.array):
+            nonlocal previous
+            if segment.size > 0:
+                frames = librosa.util.frame(segment, frame_length=setup.trim_frame_length,
+                                            hop_length=setup.trim_hop_length)
+                envelope, previous = get_onset_envelope(frames, mel_basis, previous)
+                envelope_blocks.append(envelope)
+            if trim_segment.size > 0:
+                trim_blocks.append(librosa.feature.rms(y=trim_segment, frame_length=setup.trim_frame_length,
+                                                       hop_length=setup.trim_hop_length, center=False)[0])
+
+        for block in stream_audio(rec_file, sr, STREAM_BLOCK_DURATION):
+            n_samples += block.size
+            analyze(onset_frames.push(block), trim_frames.push(block))
+        analyze(onset_frames.flush(), trim_frames.flush())
+
+        envelope = np.concatenate(envelope_blocks) if envelope_blocks else np.empty(0)
+        trim_rms = np.concatenate(trim_blocks) if trim_blocks else np.empty(0)
+
+        bounds = get_non_silent_bounds(trim_rms, n_samples, setup)
+        if bounds is None:
+            return np.empty(0)
+        start, end = bounds
+
+        # Keep the frames centered on the trimmed audio
+        first = start//setup.trim_hop_length
+        envelope = envelope[first:first + 1 + (end - start)//setup.trim_hop_length]
+
+    if envelope.size == 0:
+        return np.empty(0)
+    return librosa.onset.onset_detect(onset_envelope=envelope, sr=sr, hop_length=setup.trim_hop_length,
+                                      delta=ONSET_DELTA, units="time")
+
+def get_onset_envelope(frames: np.array, mel_basis: np.array, previous: np.array=None) -> Tuple[np.array, np.array]:
+    """Computes the spectral flux of frames, like librosa.onset.onset_strength:
+    the mean increase in log mel power from each frame to the next. Frames
+    are processed ONSET_BLOCK_FRAMES at a time.
+
+    Args:
+        frames (np.array): The frames, shaped (frame_length, n_frames)
+        mel_basis (np.array): The mel filter bank
+        previous (np.array): The log mel spectrum of the frame before the
+            first one, when continuing a stream
+
+    Returns:
+        Tuple[np.array, np.array]: The onset strength of every frame, and the
+            log mel spectrum of the last frame
+    """
+
+    window = librosa.filters.get_window("hann", frames.shape[0])[:, None]
+    envelope = np.empty(frames.shape[1])
+    for first in range(0, frames.shape[1], ONSET_BLOCK_FRAMES):
+        block = frames[:, first:first + ONSET_BLOCK_FRAMES]
+        power = np.abs(np.fft.rfft(block*window, axis=0))**2
+        mel = librosa.power_to_db(mel_basis @ power)
+        if previous is None:
+            previous = mel[:, :1]
+        flux = np.diff(np.concatenate((previous, mel), axis=1), axis=1)
+        envelope[first:first + block.shape[1]] = np.maximum(flux, 0).mean(axis=0)
+        previous = mel[:, -1:]
+
+    return envelope, previous
+
+def onsets_to_notes_yin(f0: np.array, times: np.array, amplitudes: np.array, onset_times: np.array,
+                        bpm: int, fmin: float=FMIN, fmax: float=FMAX) -> NoteArray:
     """Converts an array of frequencies, timestamps, and amplitudes into
-    a list of notes.
+    notes, with one note per segment between onsets.
+
+    A segment's steady frames are the frames strictly between fmin and fmax
+    within MAX_CENTS_DIFFERENCE cents of the next frame. Its pitch is the median of
+    those frames, and the note lasts from the first to the last steady frame
+    within MAX_CENTS_DIFFERENCE cents of that median. Its velocity is the
+    loudest frame of the segment. Segments whose note would be shorter than
+    a 16th note are rests.
+
+    Args:
+        f0 (np.array): The array of fundamental frequencies
+        times (np.array): The array of timestamps
+        amplitudes (np.array): The array of MIDI velocities
+        onset_times (np.array): The onset times (see get_onset_times)
+        bpm (int): The BPM of the recording
+        fmin (float): The lowest frequency YIN can report (see
+            get_lowest_frequency)
+        fmax (float): The highest frequency that was searched. Frames YIN
+            can't make sense of come out at either end of the band
+
+    Returns:
+        NoteArray: The notes, with their pitch in Hz and in MIDI cents
+    """
+
+    MIN_NOTE_LENGTH = 60.0/bpm/6.0 # Allow for 16th note
+
+    f0 = np.asarray(f0, dtype=np.float64)
+    times = np.asarray(times, dtype=np.float64)
+    amplitudes = np.asarray(amplitudes)
+    n = f0.size
+    if n < 2:
+        return NoteArray(np.empty(0), np.empty(0, dtype=int), np.empty(0), np.empty(0))
+
+    # Segment of every frame
+    bounds = np.unique(np.concatenate(([0], np.searchsorted(times, onset_times), [n])))
+    bounds = bounds[bounds <= n]
+    segment = np.repeat(np.arange(bounds.size - 1), np.diff(bounds))
+    n_segments = bounds.size - 1
+
+    steady = np.zeros(n, dtype=bool)
+    steady[:-1] = (np.abs(1200*np.log2(f0[1:]/f0[:-1])) <= MAX_CENTS_DIFFERENCE) & (segment[1:] == segment[:-1])
+    steady &= (f0 > fmin*2**(1/1200)) & (f0 < fmax)
+
+    # Median of the steady frames of every segment
+    index = np.flatnonzero(steady)
+    order = index[np.lexsort((f0[index], segment[index]))]
+    counts = np.bincount(segment[order], minlength=n_segments)
+    has_note = counts > 0
+    offsets = np.cumsum(counts) - counts
+    low = order[(offsets + (counts - 1)//2)[has_note]]
+    high = order[(offsets + counts//2)[has_note]]
+    pitch = np.full(n_segments, np.nan)
+    pitch[has_note] = (f0[low] + f0[high])/2
+
+    # First and last steady frame close to the median
+    close = steady & (np.abs(1200*np.log2(f0/pitch[segment])) <= MAX_CENTS_DIFFERENCE)
+    frame = np.arange(n)
+    first = np.minimum.reduceat(np.where(close, frame, n), bounds[:-1])
+    last = np.maximum.reduceat(np.where(close, frame, -1), bounds[:-1])
+    velocity = np.maximum.reduceat(amplitudes, bounds[:-1])
+
+    found = first < n
+    start, end = times[first[found]], times[last[found]]
+    keep = end - start >= MIN_NOTE_LENGTH
+    start, end = start[keep], end[keep]
+    pitch, velocity = pitch[found][keep], velocity[found][keep]
+    if start.size > 0:
+        # Time shift notes to start at 0
+        end = end - start[0]
+        start = start - start[0]
+
+    return NoteArray(pitch, velocity, start, end)
+
+def freq_to_notes_yin(f0: np.array, times: np.array, amplitudes: np.array, bpm: int,
+                      fmax: float=FMAX) -> NoteArray:
+    """Converts an array of frequencies, timestamps, and amplitudes into
+    notes.
+
+    Frames are grouped into notes and cleaned up by the compiled kernels in
+    note_kernels, or with whole-array NumPy operations when
+    config.COMPILED_NOTE_KERNELS is off. Both give the same notes.
 
     Args:
         f0 (np.array): The array of fundamental frequencies
         times (np.array): The array of timestamps
         amplitudes (np.array): The array of max amplitudes
         bpm (int): The BPM of the recording
+        fmax (float): The highest frequency that was searched. Frames YIN
+            can't make sense of come out at or above it
 
     Returns:
-        List[Note]: A list of notes
+        NoteArray: The notes, with their pitch in Hz and in MIDI cents
     """
 
     MIN_NOTE_LENGTH = 60.0/bpm/6.0 # Allow for 16th note
 
-    # Turns the frequencies into a list of Note objects
-    note_objects = []
-    i = 1
-    while i < len(f0):
-        previous_freq = f0[i-1]
-        current_freq = f0[i]
-        previous_amp = amplitudes[i-1]
-        current_amp = amplitudes[i]
-        
-        # Similar enough frequencies
-        if Note.difference_cents(current_freq, previous_freq) <= MAX_CENTS_DIFFERENCE:
-            # If the note is the same as the previous note, update the duration
-            offset = times[i-1]
-            new_note = Note(current_freq, current_amp, offset, 0)
-            note_frequencies = [Note.round_frequency(previous_freq)]
-            note_amplitudes = [previous_amp]
-            end_time = times[i]
-            while (i < len(f0) and
-                   Note.difference_cents(current_freq, note_frequencies[0]) <= MAX_CENTS_DIFFERENCE):
-                end_time = times[i]
-                note_frequencies.append(current_freq)
-                note_amplitudes.append(current_amp)
-                i += 1
-                if i >= len(f0):
-                    break
-                previous_freq = f0[i-1]
-                current_freq = f0[i]
-                previous_amp = amplitudes[i-1]
-                current_amp = amplitudes[i]
-            # Average note's frequencies and reset end time
-            new_note.pitch = np.average(note_frequencies)
-            new_note.end = end_time
-            new_note.velocity = np.max(note_amplitudes)
-            note_objects.append(new_note)
-
-        # (Notes that aren't duplicated at all are assumed to be errors and skipped)
-        i += 1
-    
-    # YIN is kind of noisy. If a note isn't long enough, merge it with the
-    # previous note
-    last_good_index = 0
-    for i in range(len(note_objects)):
-        if note_objects[i].end - note_objects[i].start < MIN_NOTE_LENGTH:
-            note_objects[i].pitch = REST_FREQUENCY # Mark for deletion
-        else:
-            last_good_index = i
-
-    # Keep notes that don't exceed FMAX
-    note_objects = [note for note in note_objects if
-                    note.pitch < FMAX]
-
-    # Merge identical notes that are too close to each other
-    last_good_index = 0
-    for i in range(1, len(note_objects)):
-        if (Note.difference_cents(note_objects[i].pitch, note_objects[last_good_index].pitch) <= 10 and
-            note_objects[i].start - note_objects[last_good_index].end <= YIN_HOP_LENGTH/YIN_SAMPLE_RATE):
-            note_objects[last_good_index].end = note_objects[i].end
-            note_objects[i].pitch = REST_FREQUENCY # Mark for deletion
-        else:
-            last_good_index = i
-            
-    # Delete notes that need to be deleted
-    note_objects = [note for note in note_objects if
-                    note.pitch < FMAX]
-
-    # Merge two identical notes when the first one is MUCH louder than the next
-    # This assumes first note is the hammer and second note is trailing sound
-    for i in range(1, len(note_objects)):
-        if (Note.difference_cents(note_objects[i].pitch, note_objects[i-1].pitch) <= 10 and
-            note_objects[i-1].velocity - note_objects[i].velocity >= 30):
-            note_objects[i-1].end = note_objects[i].end
-            note_objects[i].pitch = REST_FREQUENCY # Mark for deletion
-    
-    # Delete notes that need to be deleted
-    note_objects = [note for note in note_objects if
-                    note.pitch < FMAX]
+    f0 = np.asarray(f0, dtype=np.float64)
+    times = np.asarray(times, dtype=np.float64)
+    amplitudes = np.asarray(amplitudes)
+
+    # Turns the frequencies into note pitches, velocities and boundaries
+    if config.COMPILED_NOTE_KERNELS:
+        pitch, velocity, start, end = note_kernels.segment_frames(f0, times, amplitudes, MAX_CENTS_DIFFERENCE)
+    else:
+        pitch, velocity, start, end = segment_frames(f0, times, amplitudes)
 
-    if len(note_objects) > 0:    
+    # YIN is kind of noisy. Drop notes that aren't long enough, as well as
+    # notes that exceed fmax
+    keep = (end - start >= MIN_NOTE_LENGTH) & (pitch < fmax)
+    pitch, velocity, start, end = pitch[keep], velocity[keep], start[keep], end[keep]
+
+    if config.COMPILED_NOTE_KERNELS:
+        pitch, velocity, start, end = note_kernels.merge_close_notes(pitch, velocity, start, end,
+                                                                     YIN_HOP_LENGTH/YIN_SAMPLE_RATE)
+        pitch, velocity, start, end = note_kernels.merge_trailing_notes(pitch, velocity, start, end)
+    else:
+        # Merge identical notes that are too close to each other
+        pitch, velocity, start, end = merge_close_notes(pitch, velocity, start, end)
+
+        # Merge two identical notes when the first one is MUCH louder than the next
+        pitch, velocity, start, end = merge_trailing_notes(pitch, velocity, start, end)
+
+    if pitch.size > 0:
         # Time shift notes to start at 0
-        offset = note_objects[0].start
-        for note in note_objects:
-            note.start -= offset
-            note.end -= offset
-    
-    return note_objects
+        offset = start[0]
+        start = start - offset
+        end = end - offset
+
+    return NoteArray(pitch, velocity, start, end)
+
+def segment_frames(f0: np.array, times: np.array, amplitudes: np.array) -> Tuple[np.array, np.array, np.array, np.array]:
+    """Groups YIN frames into raw notes.
+
+    A note starts on a frame whose successor is within MAX_CENTS_DIFFERENCE
+    cents of it, and lasts while the following frames stay within
+    MAX_CENTS_DIFFERENCE cents of the starting frame's rounded pitch. Its
+    pitch is the mean of the rounded starting pitch and the frames it spans,
+    and its velocity is the loudest of those frames. Frames that never form a
+    note are assumed to be errors and skipped.
+
+    Args:
+        f0 (np.array): The array of fundamental frequencies
+        times (np.array): The array of timestamps
+        amplitudes (np.array): The array of MIDI velocities
+
+    Returns:
+        Tuple[np.array, np.array, np.array, np.array]: The arrays for note
+            pitch, velocity, start and end
+    """
+
+    n = f0.size
+    no_notes = (np.empty(0), np.empty(0, dtype=int), np.empty(0), np.empty(0))
+    if n < 2:
+        return no_notes
+
+    # Nearest equal-tempered pitch of every frame (see Note.round_frequency).
+    # There are only a few distinct semitones, and raising 2 to each one as a
+    # scalar keeps the result bit for bit equal to Note.round_frequency.
+    semitones = np.round(12*np.log2(f0/A4))
+    unique_semitones, semitone_index = np.unique(semitones, return_inverse=True)
+    reference = np.array([A4*2**(exponent/12.0) for exponent in unique_semitones])[semitone_index]
+
+    # starts[i]: frame i is close enough to frame i-1 to start a note there
+    starts = np.zeros(n + 1, dtype=bool)
+    starts[1:n] = np.abs(1200*np.log2(f0[1:]/f0[:-1])) <= MAX_CENTS_DIFFERENCE
+    starts[n] = True
+    # extends[i]: frame i keeps a note going that was started on frame i-1's
+    # rounded pitch. Frames within MAX_CENTS_DIFFERENCE (< 50) cents of a
+    # rounded pitch always round to it, so this only needs the neighbour.
+    extends = np.zeros(n + 1, dtype=bool)
+    extends[1:n] = ((np.abs(1200*np.log2(f0/reference)) <= MAX_CENTS_DIFFERENCE)[1:] &
+                    (semitones[1:] == semitones[:-1]))
+
+    next_start = _next_true(starts)
+    next_stop = _next_true(~extends)
+
+    # Scanning resumes one frame after the frame that ended the previous note
+    note_starts = next_start
+    note_stops = next_stop[note_starts]
+    successor = np.minimum(note_stops + 1, n)
+    successor[note_starts == n] = n
+    scan = _follow_chain(successor, 1)
+    first = note_starts[scan]
+    stop = note_stops[first]
+    first, stop = first[first < n], stop[first < n]
+    if first.size == 0:
+        return no_notes
+
+    # Every note spans frames first-1 .. max(stop, first)-1, with the first
+    # frame's pitch replaced by its rounded pitch
+    lengths = np.maximum(stop, first) - first + 1
+    offsets = np.cumsum(lengths) - lengths
+    frames = np.arange(lengths.sum()) - np.repeat(offsets - (first - 1), lengths)
+    frequencies = f0[frames]
+    frequencies[offsets] = reference[first - 1]
+
+    pitch = _segment_means(frequencies, offsets, lengths)
+    velocity = np.maximum.reduceat(amplitudes[frames], offsets)
+    start = times[first - 1]
+    end = times[np.maximum(stop - 1, first)]
+
+    return pitch, velocity, start, end
 
-def notes_to_JSON(notes: List[Note]) -> Dict:
-    """Converts a list of notes into a JSON.
+def merge_close_notes(pitch: np.array, velocity: np.array, start: np.array, end: np.array) -> Tuple[np.array, np.array, np.array, np.array]:
+    """Merges notes into the note before them when they are within 10 cents
+    of it and start no more than one hop after the previous note ends.
 
     Args:
-        notes (List[Note]): The list of notes
+        pitch (np.array): The array of note pitches
+        velocity (np.array): The array of note velocities
+        start (np.array): The array of note start times
+        end (np.array): The array of note end times
+
+    Returns:
+        Tuple[np.array, np.array, np.array, np.array]: The merged arrays
+    """
+
+    m = pitch.size
+    if m < 2:
+        return pitch, velocity, start, end
+
+    # Touching neighbours; a merged run keeps the first note's pitch, so the
+    # pitch check is always made against the note that opened the run
+    touching = np.zeros(m + 1, dtype=bool)
+    touching[1:m] = start[1:] - end[:-1] <= YIN_HOP_LENGTH/YIN_SAMPLE_RATE
+
+    group_end = np.arange(1, m + 1)
+    growing = np.flatnonzero(touching[group_end])
+    while growing.size > 0:
+        nxt = group_end[growing]
+        growing = growing[np.abs(1200*np.log2(pitch[nxt]/pitch[growing])) <= 10]
+        group_end[growing] += 1
+        growing = growing[touching[group_end[growing]]]
+
+    successor = np.append(group_end, m)
+    kept = _follow_chain(successor, 0)
+    end = end[group_end[kept] - 1]
+
+    return pitch[kept], velocity[kept], start[kept], end
+
+def merge_trailing_notes(pitch: np.array, velocity: np.array, start: np.array, end: np.array) -> Tuple[np.array, np.array, np.array, np.array]:
+    """Merges a note into the previous one when they are within 10 cents and
+    the previous one is MUCH louder. This assumes the first note is the hammer
+    and the second note is trailing sound.
+
+    Args:
+        pitch (np.array): The array of note pitches
+        velocity (np.array): The array of note velocities
+        start (np.array): The array of note start times
+        end (np.array): The array of note end times
+
+    Returns:
+        Tuple[np.array, np.array, np.array, np.array]: The merged arrays
+    """
+
+    m = pitch.size
+    if m < 2:
+        return pitch, velocity, start, end
+
+    candidate = np.zeros(m, dtype=bool)
+    candidate[1:] = ((np.abs(1200*np.log2(pitch[1:]/pitch[:-1])) <= 10) &
+                     (velocity[:-1] - velocity[1:] >= 30))
+
+    # A merged note can't absorb the next one, so only every other note of a
+    # run of candidates is merged
+    index = np.arange(m)
+    run_begins = candidate & ~np.concatenate(([False], candidate[:-1]))
+    run_start = np.maximum.accumulate(np.where(run_begins, index, 0))
+    merged = candidate & ((index - run_start) % 2 == 0)
+
+    end = end.copy()
+    end[np.flatnonzero(merged) - 1] = end[merged]
+    kept = ~merged
+
+    return pitch[kept], velocity[kept], start[kept], end[kept]
+
+def _segment_means(values: np.array, offsets: np.array, lengths: np.array) -> np.array:
+    """Averages consecutive segments of values. Segments of equal length are
+    summed together as rows of a 2D array, which keeps NumPy's pairwise
+    summation and so gives the same result as np.average on each segment.
+    """
+
+    means = np.empty(lengths.size)
+    order = np.argsort(lengths, kind="stable")
+    bounds = np.flatnonzero(np.diff(lengths[order])) + 1
+    for group in np.split(order, bounds):
+        length = lengths[group[0]]
+        rows = values[offsets[group, None] + np.arange(length)]
+        means[group] = rows.sum(axis=1) / length
+
+    return means
+
+def _next_true(mask: np.array) -> np.array:
+    """For every index, finds the first index at or after it where mask is
+    True. The last element of mask must be True.
+    """
+
+    index = np.where(mask, np.arange(mask.size), mask.size - 1)
+    return np.minimum.accumulate(index[::-1])[::-1]
+
+def _follow_chain(successor: np.array, first: int) -> np.array:
+    """Follows successor pointers from first and returns the visited indices
+    in order. Pointers must move strictly forward and the last index is a
+    terminal that points to itself. Uses pointer jumping, so only
+    O(log(chain length)) array passes are made.
+    """
+
+    terminal = successor.size - 1
+    if first >= terminal:
+        return np.empty(0, dtype=int)
+
+    visited = np.array([first])
+    jump = successor
+    while True:
+        # visited holds the nodes 0 .. 2^k-1 steps away, jump moves 2^k steps
+        reached = jump[visited]
+        reached = reached[reached < terminal]
+        if reached.size == 0:
+            break
+        visited = np.concatenate((visited, reached))
+        jump = jump[jump]
+
+    return np.sort(visited)
+
+def notes_to_JSON(notes: NoteArray) -> Dict:
+    """Converts notes into a JSON.
+
+    Args:
+        notes (NoteArray): The notes
 
     Returns:
         Dict: A dict containing the number of notes and the list of notes
     """
-    
-    notes_JSON_array = []
-    for i in range(len(notes)):
-        notes_JSON_array.append(notes[i].__dict__)
+
+    notes_JSON_array = notes.to_dicts()
 
     result_dict = {
         "size": int(len(notes)),
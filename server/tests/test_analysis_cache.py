@@ -0,0 +1,51 @@
+"""Test Analysis Cache
+
+Test storing, reusing and evicting frame-level analyses.
+"""
+from scripts.analysis_cache import AnalysisCache
+from scripts.signal_processing import *
+import os
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+WAV_DATA_PATH = TEST_DIR + "/data/wav/"
+
+def test_cache_round_trip(tmp_path):
+    cache = AnalysisCache(str(tmp_path), 1 << 20)
+    key = cache.key(WAV_DATA_PATH + "cmaj_actual.wav", get_analysis_params(False))
+    f0, times, velocities = get_f0_time_amp_yin(WAV_DATA_PATH + "cmaj_actual.wav")
+
+    assert(cache.get(key) is None)
+    cache.put(key, f0, times, velocities)
+    cached_f0, cached_times, cached_velocities = cache.get(key)
+
+    assert(np.array_equal(cached_f0, f0))
+    assert(np.array_equal(cached_times, times))
+    assert(cached_velocities == velocities)
+    assert(cache.hits == 1 and cache.misses == 1)
+
+def test_cache_key_depends_on_params():
+    cache = AnalysisCache("", 0)
+    file = WAV_DATA_PATH + "cmaj_actual.wav"
+
+    assert(cache.key(file, get_analysis_params(False)) == cache.key(file, get_analysis_params(False)))
+    assert(cache.key(file, get_analysis_params(False)) != cache.key(file, get_analysis_params(True)))
+    assert(cache.key(file, get_analysis_params(False)) != cache.key(file, get_analysis_params(False, "fast_yin")))
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    f0 = np.random.default_rng(0).uniform(100, 1000, 1000)
+    times = np.arange(f0.size)*0.01
+    velocities = [80]*f0.size
+    cache = AnalysisCache(str(tmp_path), 1 << 20)
+    cache.put("a", f0, times, velocities)
+    cache.put("b", f0, times, velocities)
+    os.utime(tmp_path/"a.npz", (0, 0))
+    os.utime(tmp_path/"b.npz", (1, 1))
+    cache.get("a")
+
+    # Room for two entries only
+    cache.max_bytes = 2*os.path.getsize(tmp_path/"a.npz") + 1
+    cache.put("c", f0, times, velocities)
+
+    assert(cache.get("a") is not None)
+    assert(cache.get("b") is None)
+    assert(cache.get("c") is not None)
@@ -0,0 +1,218 @@
+"""Test Compare
+
+Test aligning and comparing performed notes against sheet music notes.
+"""
+from scripts.compare import *
+from scripts.objects import Note, hz_to_cents, cents_to_hz
+from scripts.convert_pitch_cents import add_cents
+import os
+import json
+import numpy as np
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+JSON_DATA_PATH = TEST_DIR + "/data/dat/"
+
+def initialize_notes(path):
+    with open(JSON_DATA_PATH + path) as file:
+        json_data = json.load(file)
+    notes = [Note(note["pitch"], note["velocity"], note["start"], note["end"])
+             for note in json_data["notes"]]
+
+    return notes
+
+def perform(notes, seed):
+    # Plays the notes with timing jitter, wrong, missing and extra notes
+    rng = np.random.default_rng(seed)
+    played = []
+    for note in notes:
+        if rng.random() < 0.05:
+            continue
+        pitch = note.pitch*2**(rng.choice([-1, 1])/12) if rng.random() < 0.05 else note.pitch
+        shift = rng.normal(0, 0.05)
+        played.append(Note(pitch, int(rng.integers(40, 100)), note.start + shift, note.end + shift))
+        if rng.random() < 0.05:
+            played.append(Note(note.pitch*1.5, 60, note.end, note.end + 0.1))
+
+    return played
+
+def reference_needleman_wunsch(seq1, seq2, gap_penalty=GAP_PENALTY, mismatch_penalty=MISMATCH_PENALTY, match_score=MATCH_SCORE,
+                               insert_penalty=INSERT_PENALTY):
+    # Cell by cell fill, comparing notes with Note.__eq__
+    score_matrix = np.zeros((len(seq1) + 1, len(seq2) + 1), dtype=int)
+    score_matrix[:, 0] = gap_penalty*np.arange(len(seq1) + 1)
+    score_matrix[0, :] = insert_penalty*np.arange(len(seq2) + 1)
+    for i in range(1, len(seq1) + 1):
+        for j in range(1, len(seq2) + 1):
+            match = score_matrix[i - 1, j - 1] + (match_score if seq1[i - 1] == seq2[j - 1] else mismatch_penalty)
+            score_matrix[i, j] = max(match, score_matrix[i - 1, j] + gap_penalty, score_matrix[i, j - 1] + insert_penalty)
+
+    return score_matrix
+
+def test_needleman_wunsch_matches_reference():
+    for path in ["CMajor.json", "Happy Birthday.json", "Wet Hands.json", "Gerudo Valley.json"]:
+        ideal = initialize_notes(path)
+        for seed in range(5):
+            actual = perform(ideal, seed)
+            assert(np.array_equal(needleman_wunsch(ideal, actual), reference_needleman_wunsch(ideal, actual)))
+
+def test_note_match_matrix():
+    ideal = initialize_notes("Happy Birthday.json")
+    actual = perform(ideal, 0)
+    matches = note_match_matrix(ideal, actual)
+
+    for i in range(len(ideal)):
+        for j in range(len(actual)):
+            assert(matches[i, j] == (ideal[i] == actual[j]))
+
+def test_compare_arrays_exact_match():
+    ideal = initialize_notes("Wet Hands.json")
+    actual = initialize_notes("Wet Hands.json")
+
+    accuracy_notes, accuracy_dynamics, accuracy_start_stop, differences = compare_arrays(ideal, actual)
+
+    assert(accuracy_notes == accuracy_dynamics == accuracy_start_stop == 1)
+    assert(differences == [])
+
+def alignment_score(aligned_ideal, aligned_actual, gap_penalty=GAP_PENALTY, mismatch_penalty=MISMATCH_PENALTY,
+                    match_score=MATCH_SCORE, insert_penalty=INSERT_PENALTY):
+    score = 0
+    for ideal_note, actual_note in zip(aligned_ideal, aligned_actual):
+        if actual_note is None:
+            score += gap_penalty
+        elif ideal_note is None:
+            score += insert_penalty
+        else:
+            score += match_score if ideal_note == actual_note else mismatch_penalty
+
+    return score
+
+def test_banded_alignment_is_optimal():
+    for path in ["Happy Birthday.json", "Wet Hands.json", "Gerudo Valley.json"]:
+        ideal = initialize_notes(path)
+        for seed in range(5):
+            # Played 20% slower
+            actual = [Note(note.pitch, note.velocity, note.start*1.2, note.end*1.2) for note in perform(ideal, seed)]
+            aligned_ideal, aligned_actual = aligned_notes(ideal, actual, *banded_alignment(ideal, actual, band_seconds=0.5))
+
+            assert([note for note in aligned_ideal if note is not None] == ideal)
+            assert([note for note in aligned_actual if note is not None] == actual)
+            assert(alignment_score(aligned_ideal, aligned_actual) == needleman_wunsch(ideal, actual)[-1, -1])
+
+def test_alignment_band_is_narrow():
+    ideal = initialize_notes("Gerudo Valley.json")
+    actual = perform(ideal, 0)
+    first, last = get_alignment_band(ideal, actual, 1)
+
+    assert((last - first).max() < len(actual)/4)
+    assert(first[0] == 0 and last[-1] == len(actual))
+
+def test_hirschberg_and_full_alignment_match(monkeypatch):
+    # Small blocks, so the recursion goes several levels deep
+    monkeypatch.setattr("scripts.compare.HIRSCHBERG_BLOCK_CELLS", 64)
+    for path in ["Happy Birthday.json", "Wet Hands.json", "Gerudo Valley.json"]:
+        ideal = initialize_notes(path)
+        for seed in range(5):
+            actual = perform(ideal, seed)[3:]
+            # A band wider than the piece keeps the whole score matrix
+            expected_ideal, expected_actual = aligned_notes(ideal, actual, *banded_alignment(ideal, actual, band_seconds=1e6))
+            for alignment in [hirschberg_alignment(ideal, actual), full_alignment(ideal, actual)]:
+                aligned_ideal, aligned_actual = aligned_notes(ideal, actual, *alignment)
+                assert(len(aligned_ideal) == len(expected_ideal))
+                assert(all(note is expected for note, expected in zip(aligned_ideal, expected_ideal)))
+                assert(all(note is expected for note, expected in zip(aligned_actual, expected_actual)))
+
+def test_full_alignment_is_optimal():
+    # With the scores defined in compare, and with extra notes costing more than missing ones
+    for penalties in [(GAP_PENALTY, MISMATCH_PENALTY, MATCH_SCORE, INSERT_PENALTY),
+                      (GAP_PENALTY, MISMATCH_PENALTY, MATCH_SCORE, 2*INSERT_PENALTY)]:
+        for path in ["CMajor.json", "Happy Birthday.json", "Wet Hands.json"]:
+            ideal = initialize_notes(path)
+            for seed in range(5):
+                actual = perform(ideal, seed)
+                aligned_ideal, aligned_actual = aligned_notes(ideal, actual, *full_alignment(ideal, actual, *penalties))
+
+                assert([note for note in aligned_ideal if note is not None] == ideal)
+                assert([note for note in aligned_actual if note is not None] == actual)
+                assert(alignment_score(aligned_ideal, aligned_actual, *penalties) ==
+                       reference_needleman_wunsch(ideal, actual, *penalties)[-1, -1])
+
+def test_anchored_alignment():
+    for path in ["Happy Birthday.json", "Wet Hands.json", "Gerudo Valley.json"]:
+        ideal = initialize_notes(path)
+        # Played exactly: every note is anchored to itself
+        aligned_ideal, aligned_actual = aligned_notes(ideal, ideal, *anchored_alignment(ideal, ideal))
+        assert(all(note is expected for note, expected in zip(aligned_ideal, ideal)))
+        assert(all(note is expected for note, expected in zip(aligned_actual, ideal)))
+
+        for seed in range(5):
+            actual = perform(ideal, seed)
+            aligned_ideal, aligned_actual = aligned_notes(ideal, actual, *anchored_alignment(ideal, actual))
+
+            assert([note for note in aligned_ideal if note is not None] == ideal)
+            assert([note for note in aligned_actual if note is not None] == actual)
+            assert(alignment_score(aligned_ideal, aligned_actual) == needleman_wunsch(ideal, actual)[-1, -1])
+
+def test_find_subsequence():
+    for path in ["Happy Birthday.json", "Wet Hands.json", "Gerudo Valley.json"]:
+        ideal = initialize_notes(path)
+        first, last = len(ideal) // 3, 2 * len(ideal) // 3
+        # A recording of the middle third, starting at its own time 0
+        section = ideal[first:last]
+        actual = [Note(note.pitch, note.velocity, note.start - section[0].start, note.end - section[0].start)
+                  for note in section]
+
+        assert(find_subsequence(ideal, actual) == (first, last, section[0].start))
+
+def test_aligners():
+    ideal = initialize_notes("Wet Hands.json")
+    actual = perform(ideal, 0)
+    for name in get_aligner_names():
+        aligned_ideal, aligned_actual = aligned_notes(ideal, actual, *get_aligner(name).align(ideal, actual))
+
+        assert(len(aligned_ideal) == len(aligned_actual))
+        assert([note for note in aligned_ideal if note is not None] == ideal)
+        assert([note for note in aligned_actual if note is not None] == actual)
+        assert(compare_arrays(ideal, ideal, name)[:3] == (1, 1, 1))
+
+    try:
+        compare_arrays(ideal, actual, "unknown")
+        assert(False)
+    except ValueError:
+        pass
+
+def test_note_array():
+    ideal = initialize_notes("Gerudo Valley.json")
+    actual = perform(ideal, 0)
+    ideal_array, actual_array = NoteArray.from_notes(ideal), NoteArray.from_notes(actual)
+
+    # Slices share the arrays, and notes come out as Note objects
+    section = ideal_array[10:20]
+    assert(np.shares_memory(section.pitch, ideal_array.pitch))
+    assert(section[0].to_dict() == ideal[10].to_dict())
+    assert(NoteArray.from_dicts(ideal_array.to_dicts()).to_dicts() == [note.to_dict() for note in ideal])
+
+    for mode in get_aligner_names():
+        expected = compare_arrays(ideal, actual, mode)
+        accuracies = compare_arrays(ideal_array, actual_array, mode)
+
+        assert(accuracies[:3] == expected[:3])
+        assert([difference.to_dict() for difference in accuracies[3]] ==
+               [difference.to_dict() for difference in expected[3]])
+
+def test_pitch_cents():
+    ideal = initialize_notes("Wet Hands.json")
+    ideal_array = NoteArray.from_notes(ideal)
+
+    # A4 is MIDI pitch 69, and a semitone is 100 cents
+    assert(hz_to_cents(440) == 6900 and cents_to_hz(6900) == 440)
+    assert(np.allclose(ideal_array.cents, [hz_to_cents(note.pitch) for note in ideal]))
+    assert(np.allclose(NoteArray(None, ideal_array.velocity, ideal_array.start, ideal_array.end,
+                                 ideal_array.cents).pitch, ideal_array.pitch))
+    assert(np.allclose(np.diff(ideal_array.cents[:2]), 1200*np.log2(ideal[1].pitch/ideal[0].pitch)))
+
+    # Notes stored before the cents get them, right after the pitch
+    stored = {"notes": [{"pitch": note.pitch, "velocity": note.velocity, "start": note.start, "end": note.end}
+                        for note in ideal]}
+    assert(add_cents(stored) == len(ideal) and add_cents(stored) == 0)
+    assert(list(stored["notes"][0]) == ["pitch", "cents", "velocity", "start", "end"])
+    assert(NoteArray.from_dicts(stored["notes"]).to_dicts() == ideal_array.to_dicts())
@@ -0,0 +1,167 @@
+"""Test Jobs
+
+Test running, failing and resuming background jobs, the analysis worker
+processes they run in, and the recording sessions that queue them.
+"""
+from flask import Flask
+from datetime import datetime, timezone
+import os
+import time
+import numpy as np
+
+from api.jobs import JobQueue, jobs_blueprint
+from api import recording
+from models import db
+from models.goal import Goal
+from models.job import Job, JOB_DONE, JOB_FAILED, JOB_RUNNING
+from scripts.analysis_pool import AnalysisPool
+from scripts.recording_session import RecordingSession
+from scripts.audio_stream import decode_stats
+from scripts.pitch_estimators import PITCH_ESTIMATORS
+from scripts.signal_processing import signal_processing, analysis_cache, get_analysis_setup
+from scripts import progress
+import config
+import json
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+WAV_DATA_PATH = TEST_DIR + "/data/wav/"
+
+def create_app(path):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{path}/jobs.db"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    app.register_blueprint(jobs_blueprint)
+    app.register_blueprint(recording.recording_blueprint)
+    return app
+
+def create_queue():
+    queue = JobQueue()
+
+    @queue.handler("add")
+    def add(params):
+        progress.report("alignment", 0)
+        progress.report("alignment", 0.5)
+        progress.report("alignment")
+        now = datetime.now(timezone.utc)
+        db.session.add(Goal(params["id"], None, "goal", now, now, 0, 0, 0, 0))
+        if params["fail"]:
+            raise ValueError("failed")
+        return {"id": params["id"]}
+
+    return queue
+
+def test_jobs(tmp_path):
+    app = create_app(tmp_path)
+    queue = create_queue()
+    queue.init_app(app, workers=2)
+    with app.app_context():
+        done = queue.submit("add", {"id": 1, "fail": False})
+        failed = queue.submit("add", {"id": 2, "fail": True})
+        done_id, failed_id = done.id, failed.id
+    queue.executor.shutdown(wait=True)
+
+    client = app.test_client()
+    assert(client.get(f"/jobs/{done_id}").get_json()["state"] == JOB_DONE)
+    assert(client.get(f"/jobs/{done_id}").get_json()["result"] == {"id": 1})
+    assert(client.get(f"/jobs/{failed_id}").get_json()["state"] == JOB_FAILED)
+    assert(client.get(f"/jobs/{failed_id}").get_json()["error"] == "failed")
+    assert(client.get("/jobs/unknown").status_code == 404)
+    with app.app_context():
+        # What a failed job added is never committed
+        assert([goal.id for goal in db.session.query(Goal)] == [1])
+
+def test_unfinished_jobs_resume(tmp_path):
+    app = create_app(tmp_path)
+    with app.app_context():
+        # A job that was running when the server stopped
+        job = Job("interrupted", "add", {"id": 3, "fail": False}, datetime.now(timezone.utc))
+        job.state = JOB_RUNNING
+        db.session.add(job)
+        db.session.commit()
+
+    queue = create_queue()
+    queue.init_app(app, workers=1)
+    queue.executor.shutdown(wait=True)
+    with app.app_context():
+        assert(db.session.get(Job, "interrupted").state == JOB_DONE)
+        assert(queue.pending("add") == [])
+
+def test_analysis_pool(monkeypatch):
+    pool = AnalysisPool()
+    # Until it's started, functions run in this process
+    assert(pool.run(os.getpid) == os.getpid())
+    assert(pool.submit_recording(os.getpid).result() == os.getpid())
+
+    monkeypatch.setattr(config, "ANALYSIS_WORKERS", 5)
+    pool.start(size=1, max_jobs=2)
+    pids = [pool.run(os.getpid) for _ in range(3)]
+    recording_pids = {future.result() for future in [pool.submit_recording(os.getpid) for _ in range(3)]}
+    pool.stop()
+
+    # The worker is replaced after two jobs
+    assert(pids[0] == pids[1] != pids[2] and os.getpid() not in pids)
+    # Recordings are tracked in a worker of their own, which keeps its state
+    assert(len(recording_pids) == 1 and recording_pids.isdisjoint(pids + [os.getpid()]))
+    # Workers split the processes for long recordings between them
+    assert(pool.worker_processes == 5)
+    pool.start(size=2)
+    pool.stop()
+    assert(pool.worker_processes == 2)
+
+def test_analysis_pool_counters():
+    # What workers count is added to this process's counters, as the status endpoints report them
+    estimator = PITCH_ESTIMATORS[config.PITCH_ESTIMATOR]
+    frames_estimated, decoded, misses = estimator.frames_estimated, decode_stats.audio_seconds, analysis_cache.misses
+    pool = AnalysisPool()
+    pool.start(size=1)
+    pool.run(signal_processing, WAV_DATA_PATH + "cmaj_actual.wav", 60, False, None, False)
+    pool.stop()
+
+    assert(estimator.frames_estimated > frames_estimated)
+    assert(decode_stats.audio_seconds > decoded)
+    # (the warm up isn't counted, and the job didn't use the cache)
+    assert(analysis_cache.misses == misses)
+
+def test_job_events(tmp_path):
+    app = create_app(tmp_path)
+    queue = create_queue()
+    queue.init_app(app, workers=1)
+    with app.app_context():
+        job_id = queue.submit("add", {"id": 4, "fail": False}).id
+
+    # Streams while the job runs, then ends with the job's state
+    stream = app.test_client().get(f"/jobs/{job_id}/events").data.decode()
+    queue.executor.shutdown(wait=True)
+    events = [(event.split("\n")[0][len("event: "):], json.loads(event.split("\n")[1][len("data: "):]))
+              for event in stream.strip().split("\n\n") if event.startswith("event")]
+
+    start = progress.STAGE_STARTS["alignment"]
+    assert([data["percent"] for _, data in events[:-1]] ==
+           [start, start + progress.STAGES["alignment"]/2, start + progress.STAGES["alignment"]])
+    assert(events[-1][0] == JOB_DONE and events[-1][1]["result"] == {"id": 4})
+    assert(set(events[-1][1]["stage_seconds"]) == {"alignment"})
+
+def test_recording_sessions_dropped(tmp_path, monkeypatch):
+    app = create_app(tmp_path)
+    client = app.test_client()
+    monkeypatch.setattr(recording, "sessions", {})
+
+    def add_session(id, updated):
+        session = RecordingSession(str(tmp_path / f"{id}.wav"), 8000, get_analysis_setup())
+        recording.sessions[id] = {"session": session, "sheet_music_id": 1, "average_tempo": 120, "options": {},
+                                  "updated": updated}
+        return session
+
+    # Any request drops the sessions that went too long without a chunk, with their recordings
+    idle = add_session("idle", time.monotonic() - recording.RECORDING_SESSION_TIMEOUT - 1)
+    active = add_session("active", time.monotonic())
+    response = client.put("/recording/active/chunks/0", data=np.zeros(800, dtype="<f4").tobytes())
+    assert(response.status_code == 200 and response.get_json() == {"chunks": 1})
+    assert(list(recording.sessions) == ["active"] and not os.path.exists(idle.wav_file_path))
+
+    # Finishing a recording of sheet music that's since been deleted drops it
+    response = client.post("/recording/active/finish")
+    assert(response.status_code == 404 and recording.sessions == {})
+    assert(not os.path.exists(active.wav_file_path))
@@ -3,8 +3,10 @@
 Test signal processing note extrapolation. YIN implementation.
 """
 from scripts.signal_processing import *
+from scripts import progress
 import os
 import json
+import soundfile as sf
 
 TEST_DIR = os.path.dirname(os.path.abspath(__file__))
 WAV_DATA_PATH = TEST_DIR + "/data/wav/"
@@ -140,4 +142,225 @@ def test_gerudo_valley_expected():
     
     assert(len(notes) == len(xml_notes))
     for i in range(len(notes)):
-        assert(Note.difference_cents(notes[i].pitch, xml_notes[i].pitch) <= MAX_CENTS_DIFF_PIANO)
\ No newline at end of file
+        assert(Note.difference_cents(notes[i].pitch, xml_notes[i].pitch) <= MAX_CENTS_DIFF_PIANO)
+
+def test_cmajor_actual_stream():
+    # File is an actual piano recording, analyzed block by block
+    file = WAV_DATA_PATH + "cmaj_actual.wav"
+    f0, times, velocities = get_f0_time_amp_yin_stream(file)
+    notes = freq_to_notes_yin(f0, times, velocities, 60)
+    xml_notes = initialize_notes("CMajor.json")
+    
+    assert(len(notes) == len(xml_notes))
+    for i in range(len(notes)):
+        assert(Note.difference_cents(notes[i].pitch, xml_notes[i].pitch) <= MAX_CENTS_DIFF_PIANO)
+
+def test_happy_birthday_actual_stream():
+    # File is an actual piano recording, analyzed block by block
+    file = WAV_DATA_PATH + "happybirthday_actual.wav"
+    f0, times, velocities = get_f0_time_amp_yin_stream(file)
+    notes = freq_to_notes_yin(f0, times, velocities, 80)
+    xml_notes = initialize_notes("Happy Birthday.json")
+    
+    assert(len(notes) == len(xml_notes))
+    for i in range(len(notes)):
+        assert(Note.difference_cents(notes[i].pitch, xml_notes[i].pitch) <= MAX_CENTS_DIFF_PIANO)
+
+def test_stream_block_edges(monkeypatch):
+    # Frames must not depend on where the blocks are cut
+    file = WAV_DATA_PATH + "cmaj_expected.wav"
+    f0, times, velocities = get_f0_time_amp_yin_stream(file)
+    monkeypatch.setattr("scripts.signal_processing.STREAM_BLOCK_DURATION", 0.37)
+    f0_small, times_small, velocities_small = get_f0_time_amp_yin_stream(file)
+
+    assert(np.array_equal(f0, f0_small))
+    assert(np.array_equal(times, times_small))
+    assert(velocities == velocities_small)
+
+def test_parallel_matches_serial(monkeypatch):
+    # Splitting the frames across processes must not change them
+    monkeypatch.setattr("scripts.signal_processing.PARALLEL_MIN_DURATION", 0)
+    audio, sr = librosa.load(WAV_DATA_PATH + "happybirthday_actual.wav")
+    f0, amplitudes = get_frame_features(audio, sr)
+    f0_parallel, amplitudes_parallel = get_frame_features_parallel(audio, sr, 3)
+
+    assert(np.array_equal(f0, f0_parallel))
+    assert(np.array_equal(amplitudes, amplitudes_parallel))
+
+def test_serial_pitch_tracking_progress():
+    # Pitch tracking in a single process reports its progress block by block, without changing the frames
+    audio, sr = librosa.load(WAV_DATA_PATH + "happybirthday_actual.wav")
+    coarse_setup = get_analysis_setup(None, 16, 50)
+    frames = librosa.util.frame(np.pad(audio, coarse_setup.frame_length//2), frame_length=coarse_setup.frame_length,
+                                hop_length=coarse_setup.hop_length)
+    amplitudes = get_frame_rms(frames, coarse_setup)
+    for setup, voiced in [(DEFAULT_SETUP, None),
+                          (coarse_setup, get_voiced_frames(amplitudes, np.max(amplitudes), coarse_setup))]:
+        f0, _ = get_frame_features(audio, sr, setup=setup, voiced=voiced)
+        fractions = []
+        progress.set_reporter(lambda stage, fraction: fractions.append(fraction))
+        try:
+            f0_reported, _ = get_frame_features(audio, sr, setup=setup, voiced=voiced, report_progress=True)
+        finally:
+            progress.set_reporter(None)
+
+        assert(np.array_equal(f0, f0_reported))
+        assert(len(fractions) >= PROGRESS_BLOCKS and fractions[-1] == 1)
+        assert(all(0 < fraction <= 1 for fraction in fractions) and fractions == sorted(fractions))
+
+def test_happy_birthday_actual_fast_yin():
+    # File is an actual piano recording, analyzed with the float32 YIN backend
+    file = WAV_DATA_PATH + "happybirthday_actual.wav"
+    f0, times, velocities = get_f0_time_amp_yin(file, estimator="fast_yin")
+    notes = freq_to_notes_yin(f0, times, velocities, 80)
+    xml_notes = initialize_notes("Happy Birthday.json")
+    
+    assert(len(notes) == len(xml_notes))
+    for i in range(len(notes)):
+        assert(Note.difference_cents(notes[i].pitch, xml_notes[i].pitch) <= MAX_CENTS_DIFF_PIANO)
+
+def test_happy_birthday_actual_score_band():
+    file = WAV_DATA_PATH + "happybirthday_actual.wav"
+    xml_notes = initialize_notes("Happy Birthday.json")
+    setup = get_analysis_setup(get_score_band([{"pitch": note.pitch} for note in xml_notes]))
+    f0, times, velocities = get_f0_time_amp_yin(file, setup=setup)
+    notes = freq_to_notes_yin(f0, times, velocities, 80, setup.fmax)
+
+    assert(setup.sr < YIN_SAMPLE_RATE)
+    assert(len(notes) == len(xml_notes))
+    for i in range(len(notes)):
+        assert(Note.difference_cents(notes[i].pitch, xml_notes[i].pitch) <= MAX_CENTS_DIFF_PIANO)
+
+def test_score_band_stream_matches():
+    file = WAV_DATA_PATH + "cmaj_actual.wav"
+    setup = get_analysis_setup(get_score_band(json.load(open(JSON_DATA_PATH + "CMajor.json"))["notes"]))
+    notes = freq_to_notes_yin(*get_f0_time_amp_yin(file, setup=setup), 60, setup.fmax)
+    stream_notes = freq_to_notes_yin(*get_f0_time_amp_yin_stream(file, setup=setup), 60, setup.fmax)
+
+    assert(len(notes) == len(stream_notes))
+    for i in range(len(notes)):
+        assert(Note.difference_cents(notes[i].pitch, stream_notes[i].pitch) <= 1)
+
+def test_happy_birthday_actual_coarse_to_fine():
+    file = WAV_DATA_PATH + "happybirthday_actual.wav"
+    estimator = get_pitch_estimator(config.PITCH_ESTIMATOR)
+    estimator.reset_throughput()
+    f0, times, velocities = get_f0_time_amp_yin(file)
+    fine_notes = freq_to_notes_yin(f0, times, velocities, 80)
+    fine_frames = estimator.frames_estimated
+
+    estimator.reset_throughput()
+    f0, times, velocities = get_f0_time_amp_yin(file, setup=get_analysis_setup(None, 16))
+    notes = freq_to_notes_yin(f0, times, velocities, 80)
+
+    assert(estimator.frames_estimated < fine_frames/8)
+    assert(len(notes) == len(fine_notes))
+    for i in range(len(notes)):
+        assert(Note.difference_cents(notes[i].pitch, fine_notes[i].pitch) <= MAX_CENTS_DIFF_PIANO)
+        assert(abs(notes[i].start - fine_notes[i].start) <= config.START_TOLERANCE)
+        assert(abs(notes[i].end - fine_notes[i].end) <= config.END_TOLERANCE)
+
+def test_happy_birthday_actual_shipped_defaults():
+    # The score band with the configured coarse-to-fine pass and energy gate, as uploads are analyzed
+    file = WAV_DATA_PATH + "happybirthday_actual.wav"
+    ref_notes = json.load(open(JSON_DATA_PATH + "Happy Birthday.json"))["notes"]
+    for stream in [False, True]:
+        notes = json.loads(signal_processing(file, 80, stream=stream, use_cache=False,
+                                             band=get_score_band(ref_notes)))["notes"]
+
+        assert(len(notes) == len(ref_notes))
+        for note, ref_note in zip(notes, ref_notes):
+            assert(Note.difference_cents(note["pitch"], ref_note["pitch"]) <= MAX_CENTS_DIFF_PIANO)
+
+def test_cmajor_clarinet_energy_gate():
+    file = WAV_DATA_PATH + "cmaj_clarinet.wav"
+    f0, times, velocities = get_f0_time_amp_yin(file)
+    ungated_notes = freq_to_notes_yin(f0, times, velocities, 60)
+
+    gate_stats.reset()
+    f0, times, velocities = get_f0_time_amp_yin(file, setup=get_analysis_setup(gate_top_db=50))
+    notes = freq_to_notes_yin(f0, times, velocities, 60)
+
+    assert(gate_stats.skipped_fraction > 0.1)
+    assert(np.count_nonzero(f0 == REST_FREQUENCY) >= gate_stats.frames_skipped)
+    assert(len(notes) == len(ungated_notes))
+    for i in range(len(notes)):
+        assert(notes[i].pitch == ungated_notes[i].pitch)
+        assert(notes[i].start == ungated_notes[i].start)
+        assert(notes[i].end == ungated_notes[i].end)
+
+def test_cmajor_actual_onsets():
+    file = WAV_DATA_PATH + "cmaj_actual.wav"
+    f0, times, velocities = get_f0_time_amp_yin(file)
+    onset_times = get_onset_times(file)
+    notes = onsets_to_notes_yin(f0, times, velocities, onset_times, 60, get_lowest_frequency())
+    xml_notes = initialize_notes("CMajor.json")
+
+    assert(len(notes) == len(xml_notes))
+    for i in range(len(notes)):
+        assert(Note.difference_cents(notes[i].pitch, xml_notes[i].pitch) <= MAX_CENTS_DIFF_PIANO)
+
+def test_happy_birthday_expected_onsets():
+    file = WAV_DATA_PATH + "happybirthday_expected.wav"
+    f0, times, velocities = get_f0_time_amp_yin(file)
+    onset_times = get_onset_times(file)
+    notes = onsets_to_notes_yin(f0, times, velocities, onset_times, 80, get_lowest_frequency())
+    stream_onset_times = get_onset_times(file, stream=True)
+    xml_notes = initialize_notes("Happy Birthday.json")
+
+    assert(np.allclose(onset_times, stream_onset_times, atol=0.05))
+    assert(len(notes) == len(xml_notes))
+    for i in range(len(notes)):
+        assert(Note.difference_cents(notes[i].pitch, xml_notes[i].pitch) <= MAX_CENTS_DIFF_PIANO)
+
+def test_short_and_silent_recordings_onsets(tmp_path):
+    # Too short or too quiet to hold a note, with either segmenter
+    for name, audio in [("short", 0.5*np.sin(2*np.pi*440*np.arange(30)/22050)), ("silent", np.zeros(2205))]:
+        file = str(tmp_path / f"{name}.wav")
+        sf.write(file, audio, 22050)
+        for segmenter in ["onsets", "frames"]:
+            for stream in [False, True]:
+                result = signal_processing(file, 120, stream=stream, use_cache=False, segmenter=segmenter)
+                assert(json.loads(result)["notes"] == [])
+
+def test_compiled_note_kernels_match(monkeypatch):
+    file = WAV_DATA_PATH + "happybirthday_actual.wav"
+    f0, times, velocities = get_f0_time_amp_yin(file)
+    monkeypatch.setattr(config, "COMPILED_NOTE_KERNELS", False)
+    numpy_notes = freq_to_notes_yin(f0, times, velocities, 80)
+    numpy_velocities = amplitude_to_midi_velocity(np.linspace(0.001, 0.1, 1000))
+    monkeypatch.setattr(config, "COMPILED_NOTE_KERNELS", True)
+    notes = freq_to_notes_yin(f0, times, velocities, 80)
+
+    assert(amplitude_to_midi_velocity(np.linspace(0.001, 0.1, 1000)) == numpy_velocities)
+    assert(len(notes) == len(numpy_notes))
+    for i in range(len(notes)):
+        assert(notes[i].pitch == numpy_notes[i].pitch)
+        assert(notes[i].velocity == numpy_notes[i].velocity)
+        assert(notes[i].start == numpy_notes[i].start)
+        assert(notes[i].end == numpy_notes[i].end)
+
+def test_recording_session_matches_stream(tmp_path, monkeypatch):
+    # Pitch tracking chunks as they're uploaded must match streaming the finished recording
+    from scripts.analysis_cache import AnalysisCache
+    from scripts.recording_session import RecordingSession
+    cache = AnalysisCache(str(tmp_path), 1 << 20)
+    monkeypatch.setattr("scripts.recording_session.analysis_cache", cache)
+    monkeypatch.setattr("scripts.recording_session.STREAM_BLOCK_DURATION", 2)
+    monkeypatch.setattr("scripts.signal_processing.STREAM_BLOCK_DURATION", 2)
+    audio, sr = librosa.load(WAV_DATA_PATH + "happybirthday_actual.wav", sr=44100)
+    setup = get_analysis_setup(get_score_band(json.load(open(JSON_DATA_PATH + "Happy Birthday.json"))["notes"]),
+                               16, 50)
+
+    session = RecordingSession(str(tmp_path / "session.wav"), sr, setup)
+    chunk_length = 4096
+    for index, first in enumerate(range(0, audio.size, chunk_length)):
+        assert(session.push(index, audio[first:first + chunk_length]))
+    assert(not session.push(0, audio[:chunk_length]))
+    f0, times, velocities = session.finish()
+    stream_f0, stream_times, stream_velocities = get_f0_time_amp_yin_stream(session.wav_file_path, setup=setup)
+
+    assert(np.array_equal(f0, stream_f0))
+    assert(np.array_equal(times, stream_times))
+    assert(np.array_equal(velocities, stream_velocities))
+    assert(cache.get(cache.key(session.wav_file_path, get_analysis_params(True, None, setup))) is not None)